@@ -1,11 +1,15 @@
 """FastAPI application for Fusion RAG"""
 
+import glob
+import json
 import os
 from pathlib import Path
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 
 from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 
 import sys
@@ -15,7 +19,10 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from rag_core.pipeline.pipeline import FusionRAGPipeline
+from rag_core.pipeline.registry import CollectionRegistry
+from rag_core.retriever.fusion import FusionParams
 from rag_core.utils.config import load_config, FusionRAGConfig
+from rag_core.utils.metrics import CONTENT_TYPE, REGISTRY
 
 from dotenv import load_dotenv
 load_dotenv()
@@ -35,15 +42,29 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Global pipeline instance
-pipeline: Optional[FusionRAGPipeline] = None
+# Collections served by this process, each with its own pipeline
+registry: Optional[CollectionRegistry] = None
 
 
-class QueryRequest(BaseModel):
+class FusionOverrides(BaseModel):
+    """Per-request fusion settings; unset fields use the configuration."""
+
+    k: Optional[int] = None
+    mode: Optional[str] = None
+    vector_weight: Optional[float] = None
+    bm25_weight: Optional[float] = None
+    vector_top_k: Optional[int] = None
+    bm25_top_k: Optional[int] = None
+    mmr: Optional[bool] = None
+    mmr_lambda: Optional[float] = None
+    mmr_candidates: Optional[int] = None
+
+
+class QueryRequest(FusionOverrides):
     """Request model for query endpoint."""
 
     query: str
-    k: Optional[int] = None
+    collection: Optional[str] = None
 
 
 class QueryResponse(BaseModel):
@@ -53,12 +74,49 @@ class QueryResponse(BaseModel):
     answer: str
     context: List[str]
     scores: Optional[List[float]] = None
+    cached: Optional[str] = None
+
+
+class BatchQueryRequest(FusionOverrides):
+    """Request model for batch query endpoint."""
+
+    queries: List[str]
+    max_concurrency: Optional[int] = None
+    collection: Optional[str] = None
+
+
+class BatchQueryItem(BaseModel):
+    """Result for one query of a batch; `error` is set if it failed."""
+
+    query: str
+    answer: Optional[str] = None
+    context: List[str] = []
+    scores: Optional[List[float]] = None
+    cached: Optional[str] = None
+    error: Optional[str] = None
+
+
+class BatchQueryResponse(BaseModel):
+    """Response model for batch query endpoint."""
+
+    results: List[BatchQueryItem]
+
+
+class WarmQueriesRequest(BaseModel):
+    """Request model for query embedding warm-up endpoint."""
+
+    queries: List[str]
+    collection: Optional[str] = None
 
 
 class IngestRequest(BaseModel):
     """Request model for ingest endpoint."""
 
     data_path: str
+    stream: bool = False
+    resume: bool = True
+    batch_size: Optional[int] = None
+    collection: Optional[str] = None
 
 
 class IngestResponse(BaseModel):
@@ -66,17 +124,74 @@ class IngestResponse(BaseModel):
 
     message: str
     nodes_count: int
+    progress: Optional[Dict[str, Any]] = None
+
+
+class DocumentRequest(BaseModel):
+    """Request model for document upsert endpoint."""
+
+    path: str
+    collection: Optional[str] = None
+
+
+class DocumentResponse(BaseModel):
+    """Response model for document upsert and delete endpoints."""
+
+    path: str
+    status: str
+    nodes_added: int = 0
+    nodes_removed: int = 0
+    nodes_count: int
+
+
+class DocumentInfo(BaseModel):
+    """Summary of an ingested document."""
+
+    path: str
+    content_hash: str
+    nodes_count: int
+    updated_at: str
+
+
+class SnapshotRequest(BaseModel):
+    """Request model for snapshot endpoints."""
+
+    path: Optional[str] = None
+    collection: Optional[str] = None
+
+
+class SnapshotResponse(BaseModel):
+    """Response model for snapshot endpoints."""
+
+    message: str
+    path: Optional[str] = None
+    nodes_count: int
 
 
 @app.on_event("startup")
 async def startup_event():
-    """Initialize pipeline on startup."""
-    global pipeline
+    """Initialize the collection registry on startup."""
+    global registry
     try:
         config = load_config()
-        pipeline = FusionRAGPipeline(config)
+        registry = CollectionRegistry(config)
     except Exception as e:
         print(f"Warning: Could not initialize pipeline on startup: {e}")
+        return
+
+    # Other collections are loaded on their first request
+    if config.snapshot.load_on_startup:
+        try:
+            await run_in_threadpool(registry.get)
+        except Exception as e:
+            print(f"Warning: Could not load latest snapshot on startup: {e}")
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Save collections with unsaved document updates on shutdown."""
+    if registry is not None:
+        await run_in_threadpool(registry.save_dirty)
 
 
 @app.get("/")
@@ -85,7 +200,7 @@ async def root():
     return {
         "message": "Fusion RAG API",
         "status": "running",
-        "pipeline_initialized": pipeline is not None,
+        "pipeline_initialized": registry is not None,
     }
 
 
@@ -94,7 +209,7 @@ async def health():
     """Health check endpoint."""
     return {
         "status": "healthy",
-        "pipeline_initialized": pipeline is not None,
+        "pipeline_initialized": registry is not None,
     }
 
 
@@ -108,18 +223,28 @@ async def ingest_documents(request: IngestRequest):
     Returns:
         Ingest response with status
     """
-    global pipeline
-
-    if pipeline is None:
-        config = load_config()
-        pipeline = FusionRAGPipeline(config)
+    pipeline = await _pipeline(request.collection, create=True)
 
     data_path = request.data_path
-    if not Path(data_path).exists():
+    if not glob.has_magic(data_path) and not Path(data_path).exists():
         raise HTTPException(status_code=404, detail=f"File not found: {data_path}")
 
     try:
-        pipeline.ingest(data_path)
+        if request.stream:
+            state = await run_in_threadpool(
+                pipeline.ingest_stream,
+                data_path,
+                batch_size=request.batch_size,
+                resume=request.resume,
+            )
+            await _evict(request.collection)
+            return IngestResponse(
+                message="Documents ingested successfully",
+                nodes_count=len(pipeline.nodes),
+                progress=state.to_dict(),
+            )
+        await run_in_threadpool(pipeline.ingest, data_path)
+        await _evict(request.collection)
         return IngestResponse(
             message="Documents ingested successfully",
             nodes_count=len(pipeline.nodes),
@@ -128,6 +253,18 @@ async def ingest_documents(request: IngestRequest):
         raise HTTPException(status_code=500, detail=f"Error ingesting documents: {str(e)}")
 
 
+@app.get("/ingest/progress")
+async def ingest_progress(collection: Optional[str] = None):
+    """Progress of the current or last streaming ingestion of a collection."""
+    pipeline = await _pipeline(collection)
+    if pipeline.ingest_progress is None:
+        raise HTTPException(status_code=404, detail="No streaming ingestion has run")
+    return {
+        **pipeline.ingest_progress.to_dict(),
+        "embedding": pipeline.vector_store_manager.embedding_stats(),
+    }
+
+
 @app.post("/query", response_model=QueryResponse)
 async def query(request: QueryRequest):
     """Query the RAG pipeline.
@@ -138,17 +275,347 @@ async def query(request: QueryRequest):
     Returns:
         Query response with answer and context
     """
-    if pipeline is None or pipeline.retriever is None:
+    pipeline = await _ready_pipeline(request.collection)
+
+    params = _fusion_params(pipeline, request)
+    try:
+        result = await pipeline.aquery(request.query, params)
+        return QueryResponse(**result)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing query: {str(e)}")
+
+
+@app.post("/query/batch", response_model=BatchQueryResponse)
+async def query_batch(request: BatchQueryRequest):
+    """Answer many queries in one request.
+
+    Queries share batched embedding and retrieval, and answers are
+    generated concurrently. Results are returned in input order, with a
+    per-item `error` for queries that failed.
+
+    Args:
+        request: Batch query request
+
+    Returns:
+        Batch query response with one item per query
+    """
+    pipeline = await _ready_pipeline(request.collection)
+    if request.max_concurrency is not None and request.max_concurrency < 1:
+        raise HTTPException(status_code=422, detail="max_concurrency must be positive")
+
+    params = _fusion_params(pipeline, request)
+    try:
+        results = await pipeline.aquery_batch(
+            request.queries, request.max_concurrency, params
+        )
+        return BatchQueryResponse(results=[BatchQueryItem(**r) for r in results])
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing batch: {str(e)}")
+
+
+@app.post("/query/stream")
+async def query_stream(request: QueryRequest):
+    """Query the RAG pipeline and stream the answer as Server-Sent Events.
+
+    The stream starts with a `context` event carrying the retrieved context
+    and scores, followed by one `token` event per answer delta and a final
+    `done` event with the full answer. Failures after the stream has
+    started are reported as an `error` event.
+
+    Args:
+        request: Query request
+
+    Returns:
+        Streaming response with `text/event-stream` content
+    """
+    pipeline = await _ready_pipeline(request.collection)
+
+    params = _fusion_params(pipeline, request)
+
+    async def events():
+        try:
+            async for event in pipeline.aquery_stream(request.query, params):
+                yield _sse(event.pop("event"), event)
+        except Exception as e:
+            yield _sse("error", {"detail": f"Error processing query: {str(e)}"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _fusion_params(
+    pipeline: FusionRAGPipeline, request: FusionOverrides
+) -> Optional[FusionParams]:
+    """Fusion settings of a request, or None if it overrides nothing."""
+    overrides = request.model_dump(include=set(FusionOverrides.model_fields))
+    if all(value is None for value in overrides.values()):
+        return None
+    overrides["top_k"] = overrides.pop("k")
+    try:
+        return pipeline.fusion_params(**overrides)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+def _registry() -> CollectionRegistry:
+    """Collection registry, created on first use if startup failed."""
+    global registry
+    if registry is None:
+        registry = CollectionRegistry(load_config())
+    return registry
+
+
+async def _pipeline(
+    collection: Optional[str] = None, create: bool = False
+) -> FusionRAGPipeline:
+    """Pipeline of a collection, loading it on first use.
+
+    Args:
+        collection: Collection name; the default collection if None
+        create: Create the collection if it does not exist yet
+    """
+    collections = _registry()
+    try:
+        pipeline = collections.get_loaded(collection)
+        if pipeline is None:
+            pipeline = await run_in_threadpool(collections.get, collection, create)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+    return pipeline
+
+
+async def _ready_pipeline(collection: Optional[str] = None) -> FusionRAGPipeline:
+    """Pipeline of a collection that has indexed documents."""
+    pipeline = await _pipeline(collection)
+    if pipeline.retriever is None:
         raise HTTPException(
             status_code=400,
             detail="Pipeline not initialized. Please ingest documents first.",
         )
+    return pipeline
+
+
+async def _evict(collection: Optional[str]):
+    """Evict other collections if a collection grew past the memory budget."""
+    collections = _registry()
+    await run_in_threadpool(collections.evict, collections.validate(collection))
+
+
+def _sse(event: str, data: dict) -> str:
+    """Format one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.get("/documents", response_model=List[DocumentInfo])
+async def list_documents(collection: Optional[str] = None):
+    """List ingested documents.
+
+    Args:
+        collection: Collection name; the default collection if omitted
+
+    Returns:
+        Ingested documents with their node counts
+    """
+    pipeline = await _pipeline(collection)
+    return [
+        DocumentInfo(
+            path=record.path,
+            content_hash=record.content_hash,
+            nodes_count=len(record.node_ids),
+            updated_at=record.updated_at,
+        )
+        for record in pipeline.list_documents()
+    ]
+
+
+@app.post("/documents", response_model=DocumentResponse)
+async def upsert_document(request: DocumentRequest):
+    """Add or update a single document incrementally.
 
+    Args:
+        request: Document request with file path
+
+    Returns:
+        Document response with node counts
+    """
+    if not Path(request.path).is_file():
+        raise HTTPException(status_code=404, detail=f"File not found: {request.path}")
+
+    pipeline = await _pipeline(request.collection, create=True)
     try:
-        result = pipeline.query(request.query)
-        return QueryResponse(**result)
+        result = await run_in_threadpool(pipeline.upsert_document, request.path)
+        await _evict(request.collection)
+        return DocumentResponse(**result, nodes_count=len(pipeline.nodes))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error processing query: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error upserting document: {str(e)}")
+
+
+@app.delete("/documents", response_model=DocumentResponse)
+async def delete_document(path: str, collection: Optional[str] = None):
+    """Remove a document's chunks from all indexes.
+
+    Args:
+        path: Path of a previously ingested document
+        collection: Collection name; the default collection if omitted
+
+    Returns:
+        Document response with node counts
+    """
+    pipeline = await _pipeline(collection)
+    try:
+        nodes_removed = await run_in_threadpool(pipeline.delete_document, path)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Document not found: {path}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error deleting document: {str(e)}")
+
+    return DocumentResponse(
+        path=path,
+        status="deleted",
+        nodes_removed=nodes_removed,
+        nodes_count=len(pipeline.nodes),
+    )
+
+
+@app.post("/documents/compact")
+async def compact_documents(collection: Optional[str] = None):
+    """Drop tombstoned chunks from the indexes of a collection."""
+    pipeline = await _ready_pipeline(collection)
+    compacted = await run_in_threadpool(pipeline.compact)
+    return {"compacted": compacted, "nodes_count": len(pipeline.nodes)}
+
+
+@app.post("/snapshot/save", response_model=SnapshotResponse)
+async def save_snapshot(request: SnapshotRequest):
+    """Save the current indexes as a snapshot.
+
+    Args:
+        request: Snapshot request with optional target directory
+
+    Returns:
+        Snapshot response with the written path
+    """
+    pipeline = await _ready_pipeline(request.collection)
+
+    try:
+        path = await run_in_threadpool(pipeline.save, request.path)
+        return SnapshotResponse(
+            message="Snapshot saved successfully",
+            path=str(path),
+            nodes_count=len(pipeline.nodes),
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error saving snapshot: {str(e)}")
+
+
+@app.post("/snapshot/load", response_model=SnapshotResponse)
+async def load_snapshot(request: SnapshotRequest):
+    """Load indexes from a snapshot, defaulting to the latest one.
+
+    Args:
+        request: Snapshot request with optional source directory
+
+    Returns:
+        Snapshot response with the loaded node count
+    """
+    if request.path is not None and not Path(request.path).exists():
+        raise HTTPException(status_code=404, detail=f"Snapshot not found: {request.path}")
+
+    pipeline = await _pipeline(request.collection, create=True)
+    try:
+        loaded = await run_in_threadpool(pipeline.load, request.path)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error loading snapshot: {str(e)}")
+
+    if not loaded:
+        raise HTTPException(status_code=404, detail="No snapshot available")
+    return SnapshotResponse(
+        message="Snapshot loaded successfully",
+        path=request.path,
+        nodes_count=len(pipeline.nodes),
+    )
+
+
+@app.get("/cache/stats")
+async def cache_stats(collection: Optional[str] = None):
+    """Hit and miss counters of the answer, query embedding and rewrite caches.
+
+    A cache that is disabled is reported as null.
+    """
+    pipeline = await _pipeline(collection)
+    answer_cache = pipeline.answer_cache
+    rewriter = pipeline.query_rewriter
+    return {
+        "answers": (
+            await run_in_threadpool(answer_cache.stats) if answer_cache else None
+        ),
+        "query_embeddings": pipeline.vector_store_manager.query_cache_stats(),
+        "query_rewrites": rewriter.stats() if rewriter else None,
+    }
+
+
+@app.post("/cache/query-embeddings/warm")
+async def warm_query_embeddings(request: WarmQueriesRequest):
+    """Pre-compute embeddings for known frequent queries.
+
+    Args:
+        request: Queries to embed ahead of time
+
+    Returns:
+        Number of queries embedded and the cache counters
+    """
+    pipeline = await _pipeline(request.collection, create=True)
+    try:
+        embedded = await run_in_threadpool(
+            pipeline.warm_query_embeddings, request.queries
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, detail=f"Error warming query embeddings: {str(e)}"
+        )
+    return {
+        "embedded": embedded,
+        "stats": pipeline.vector_store_manager.query_cache_stats(),
+    }
+
+
+@app.delete("/cache")
+async def clear_answer_cache(collection: Optional[str] = None):
+    """Remove every cached answer of a collection."""
+    pipeline = await _pipeline(collection)
+    if pipeline.answer_cache is None:
+        raise HTTPException(status_code=404, detail="Answer cache is not enabled")
+    await run_in_threadpool(pipeline.answer_cache.clear)
+    return {"message": "Answer cache cleared"}
+
+
+@app.get("/collections")
+async def list_collections():
+    """Collections with a snapshot or in memory.
+
+    Returns:
+        Name, load state, node count and estimated memory of each collection
+    """
+    return await run_in_threadpool(_registry().stats)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Per-stage latency histograms and counters for Prometheus.
+
+    Returns:
+        All pipeline metrics in the Prometheus text exposition format
+    """
+    return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
 
 
 if __name__ == "__main__":
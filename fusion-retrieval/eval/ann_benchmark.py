@@ -0,0 +1,157 @@
+"""Recall versus latency report for the FAISS index types
+
+Builds every configured index type through `FaissIndexStore` on a synthetic
+low-rank corpus of unit vectors, sweeps the query-time knobs (`nprobe` for
+IVF, `efSearch` for HNSW) and measures recall@k against exact search along
+with single-query latency. Results are printed as a Markdown table and
+optionally written as JSON.
+
+Usage:
+    python -m eval.ann_benchmark --num-vectors 100000 --output eval/ann_report.json
+"""
+
+import argparse
+import json
+import sys
+import time
+from dataclasses import replace
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from rag_core.retriever.faiss_store import FaissIndexStore, factory_string
+from rag_core.utils.config import EmbeddingConfig
+
+SWEEPS = {
+    "flat": [{}],
+    "ivf_flat": [{"nprobe": n} for n in (1, 4, 16, 64)],
+    "ivf_pq": [{"nprobe": n} for n in (1, 4, 16, 64)],
+    "hnsw": [{"ef_search": ef} for ef in (16, 32, 64, 128, 256)],
+}
+
+
+def synthetic_corpus(
+    num_vectors: int,
+    num_queries: int,
+    dimensions: int,
+    intrinsic_dim: int,
+    noise: float,
+    seed: int,
+):
+    """Generate unit vectors on a noisy low-rank subspace, like real embeddings.
+
+    The first `num_vectors` rows form the corpus and the remaining rows are
+    held-out queries drawn from the same distribution.
+    """
+    rng = np.random.default_rng(seed)
+    total = num_vectors + num_queries
+    latent = rng.standard_normal((total, intrinsic_dim)).astype(np.float32)
+    projection = rng.standard_normal((intrinsic_dim, dimensions)).astype(np.float32)
+    vectors = latent @ projection / np.sqrt(intrinsic_dim)
+    vectors += noise * rng.standard_normal((total, dimensions)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors[:num_vectors], vectors[num_vectors:]
+
+
+def build_store(config: EmbeddingConfig, corpus: np.ndarray) -> tuple:
+    """Train and fill a store, returning it with its build time."""
+    start = time.perf_counter()
+    store = FaissIndexStore(config)
+    sample_size = min(config.train_sample_size, len(corpus))
+    store.train(corpus[:sample_size], num_vectors=len(corpus))
+    store.client.add_with_ids(corpus, np.arange(len(corpus), dtype=np.int64))
+    return store, time.perf_counter() - start
+
+
+def measure(store: FaissIndexStore, queries: np.ndarray, truth: np.ndarray, k: int):
+    """Measure recall@k and per-query latency (one query per search call)."""
+    latencies = []
+    hits = 0
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        _, ids = store.client.search(query[np.newaxis, :], k)
+        latencies.append(time.perf_counter() - start)
+        hits += len(np.intersect1d(ids[0], expected))
+    latencies_ms = np.asarray(latencies) * 1000
+    return {
+        "recall": hits / (len(queries) * k),
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p95_ms": float(np.percentile(latencies_ms, 95)),
+    }
+
+
+def main():
+    """Run the sweep and print the report."""
+    parser = argparse.ArgumentParser(description="FAISS recall vs latency report")
+    parser.add_argument("--num-vectors", type=int, default=100_000)
+    parser.add_argument("--num-queries", type=int, default=500)
+    parser.add_argument("--dimensions", type=int, default=512)
+    parser.add_argument("--intrinsic-dim", type=int, default=64)
+    parser.add_argument("--noise", type=float, default=0.3)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--train-sample-size", type=int, default=50_000)
+    parser.add_argument("--index-types", nargs="+", default=list(SWEEPS))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Optional JSON output path")
+    args = parser.parse_args()
+
+    corpus, queries = synthetic_corpus(
+        args.num_vectors,
+        args.num_queries,
+        args.dimensions,
+        args.intrinsic_dim,
+        args.noise,
+        args.seed,
+    )
+    base_config = EmbeddingConfig(
+        dimensions=args.dimensions,
+        cache_path=None,
+        train_sample_size=args.train_sample_size,
+    )
+
+    exact, _ = build_store(replace(base_config, index_type="flat"), corpus)
+    _, truth = exact.client.search(queries, args.k)
+
+    rows = []
+    for index_type in args.index_types:
+        config = replace(base_config, index_type=index_type)
+        store, build_seconds = build_store(config, corpus)
+        for params in SWEEPS[index_type]:
+            store.set_search_params(**params)
+            result = measure(store, queries, truth, args.k)
+            rows.append(
+                {
+                    "index_type": index_type,
+                    "factory": factory_string(
+                        config, min(config.train_sample_size, len(corpus)), len(corpus)
+                    ),
+                    "params": params,
+                    "build_s": build_seconds,
+                    **result,
+                }
+            )
+            print(f"{index_type} {params}: {result}", file=sys.stderr)
+
+    print(
+        f"\nCorpus: {args.num_vectors} x {args.dimensions}, "
+        f"{args.num_queries} queries, recall@{args.k}\n"
+    )
+    print("| index | factory | params | build (s) | recall | p50 (ms) | p95 (ms) |")
+    print("|---|---|---|---|---|---|---|")
+    for row in rows:
+        params = ", ".join(f"{key}={value}" for key, value in row["params"].items())
+        print(
+            f"| {row['index_type']} | `{row['factory']}` | {params or '-'} | "
+            f"{row['build_s']:.1f} | {row['recall']:.3f} | "
+            f"{row['p50_ms']:.3f} | {row['p95_ms']:.3f} |"
+        )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
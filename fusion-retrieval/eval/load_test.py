@@ -0,0 +1,166 @@
+"""Concurrency load test for the Fusion RAG API
+
+Sends `/query` requests to a running API at increasing concurrency levels
+and reports throughput and latency per level. With the async query path,
+throughput should grow with concurrency until the worker's CPU saturates,
+instead of staying flat at one request per LLM round trip. With `--stream`
+the requests go to `/query/stream` and time-to-first-byte (the context
+event) and time-to-first-token are reported as well.
+
+Usage:
+    uvicorn api.main:app --port 8000
+    python -m eval.load_test --url http://localhost:8000 --concurrency 1 8 32 128 256
+    python -m eval.load_test --url http://localhost:8000 --stream
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from typing import Optional
+
+import httpx
+import numpy as np
+
+DEFAULT_QUERIES = [
+    "What are the main causes of climate change?",
+    "How does deforestation affect the carbon cycle?",
+    "What is the greenhouse effect?",
+    "How do rising sea levels impact coastal communities?",
+    "What role do oceans play in regulating climate?",
+]
+
+
+def percentiles_ms(values: list) -> tuple:
+    """p50 and p95 of durations in seconds, in milliseconds."""
+    if not values:
+        return float("nan"), float("nan")
+    values_ms = np.asarray(values) * 1000
+    return float(np.percentile(values_ms, 50)), float(np.percentile(values_ms, 95))
+
+
+async def timed_query(client: httpx.AsyncClient, url: str, query: str) -> dict:
+    """Send one `/query` request and time it."""
+    start = time.perf_counter()
+    response = await client.post(f"{url}/query", json={"query": query})
+    response.raise_for_status()
+    latency = time.perf_counter() - start
+    return {"latency": latency, "first_byte": latency, "first_token": None}
+
+
+async def timed_stream(client: httpx.AsyncClient, url: str, query: str) -> dict:
+    """Send one `/query/stream` request, timing the first event and first token."""
+    start = time.perf_counter()
+    first_byte: Optional[float] = None
+    first_token: Optional[float] = None
+    async with client.stream(
+        "POST", f"{url}/query/stream", json={"query": query}
+    ) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line.startswith("event: "):
+                continue
+            if first_byte is None:
+                first_byte = time.perf_counter() - start
+            if line == "event: token" and first_token is None:
+                first_token = time.perf_counter() - start
+            if line == "event: error":
+                raise httpx.HTTPError("Stream reported an error event")
+    return {
+        "latency": time.perf_counter() - start,
+        "first_byte": first_byte,
+        "first_token": first_token,
+    }
+
+
+async def run_level(
+    client: httpx.AsyncClient,
+    url: str,
+    queries: list,
+    concurrency: int,
+    num_requests: int,
+    stream: bool = False,
+) -> dict:
+    """Issue `num_requests` queries with at most `concurrency` in flight."""
+    semaphore = asyncio.Semaphore(concurrency)
+    timings = []
+    errors = 0
+    send = timed_stream if stream else timed_query
+
+    async def one(i: int):
+        nonlocal errors
+        async with semaphore:
+            try:
+                timings.append(await send(client, url, queries[i % len(queries)]))
+            except httpx.HTTPError:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(num_requests)))
+    elapsed = time.perf_counter() - start
+
+    p50, p95 = percentiles_ms([t["latency"] for t in timings])
+    ttfb_p50, ttfb_p95 = percentiles_ms([t["first_byte"] for t in timings])
+    ttft_p50, _ = percentiles_ms(
+        [t["first_token"] for t in timings if t["first_token"] is not None]
+    )
+    return {
+        "concurrency": concurrency,
+        "requests": num_requests,
+        "errors": errors,
+        "throughput_rps": len(timings) / elapsed,
+        "p50_ms": p50,
+        "p95_ms": p95,
+        "ttfb_p50_ms": ttfb_p50,
+        "ttfb_p95_ms": ttfb_p95,
+        "ttft_p50_ms": ttft_p50,
+    }
+
+
+async def run(args) -> list:
+    """Run every concurrency level in turn."""
+    limits = httpx.Limits(max_connections=max(args.concurrency))
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        results = []
+        for concurrency in args.concurrency:
+            num_requests = max(args.requests_per_level, concurrency * 2)
+            result = await run_level(
+                client, args.url, DEFAULT_QUERIES, concurrency, num_requests, args.stream
+            )
+            results.append(result)
+        return results
+
+
+def main():
+    """Run the load test and print the report."""
+    parser = argparse.ArgumentParser(description="Fusion RAG API load test")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 128, 256])
+    parser.add_argument("--requests-per-level", type=int, default=200)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--stream", action="store_true", help="Use /query/stream")
+    parser.add_argument("--output", help="Optional JSON output path")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+
+    print(
+        "| concurrency | requests | errors | throughput (req/s) | p50 (ms) | p95 (ms) "
+        "| TTFB p50 (ms) | TTFB p95 (ms) | first token p50 (ms) |"
+    )
+    print("|---|---|---|---|---|---|---|---|---|")
+    for row in results:
+        print(
+            f"| {row['concurrency']} | {row['requests']} | {row['errors']} | "
+            f"{row['throughput_rps']:.1f} | {row['p50_ms']:.0f} | {row['p95_ms']:.0f} | "
+            f"{row['ttfb_p50_ms']:.0f} | {row['ttfb_p95_ms']:.0f} | "
+            f"{row['ttft_p50_ms']:.0f} |"
+        )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
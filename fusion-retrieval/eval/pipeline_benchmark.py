@@ -0,0 +1,463 @@
+"""Offline ingest and retrieval benchmark for the rag_core pipeline
+
+Generates synthetic corpora of the requested chunk counts and measures each
+stage of building a `FusionRetriever`: splitting throughput, embedding,
+FAISS and BM25 indexing time and resident memory, followed by
+`FusionRetriever.retrieve` latency percentiles for every fusion mode.
+Everything runs offline: chunks and queries are embedded by a deterministic
+feature-hashing model, and query rewrites (`--num-queries` > 1) come from a
+stub LLM. Results are printed as a Markdown table and optionally written as
+JSON together with library versions, so runs before and after an upgrade
+can be compared with `--baseline`. With `--shards` > 1 the indexes are
+split across shard worker processes, whose memory is included in the
+index RSS.
+
+Usage:
+    python -m eval.pipeline_benchmark --sizes 10000 100000 1000000 \
+        --output eval/pipeline_benchmark.json
+    python -m eval.pipeline_benchmark --sizes 10000 --baseline eval/pipeline_benchmark.json
+    python -m eval.pipeline_benchmark --sizes 1000000 --shards 4
+"""
+
+import argparse
+import gc
+import hashlib
+import json
+import logging
+import platform
+import re
+import resource
+import sys
+import time
+from dataclasses import asdict
+from importlib import metadata
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.llms import (
+    CompletionResponse,
+    CompletionResponseGen,
+    CustomLLM,
+    LLMMetadata,
+)
+from llama_index.core.llms.callbacks import llm_completion_callback
+from llama_index.core.schema import Document
+from pydantic import PrivateAttr
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from rag_core.retriever.bm25 import BM25Index, node_text
+from rag_core.retriever.faiss_store import FaissIndexStore
+from rag_core.retriever.fusion import FUSION_MODES
+from rag_core.retriever.node_store import NodeStore
+from rag_core.retriever.retriever import FusionRetriever
+from rag_core.retriever.rewriter import QueryRewriter
+from rag_core.retriever.sharded import ShardedBM25Index, ShardedVectorStore, ShardPool
+from rag_core.retriever.splitter import TextSplitter
+from rag_core.utils.config import EmbeddingConfig, RetrieverConfig
+
+_WORD = re.compile(r"\w+")
+
+# Compared against a baseline run, lower is better for all of them
+METRICS = (
+    "split_s",
+    "embed_s",
+    "vector_index_s",
+    "bm25_index_s",
+    "peak_rss_mb",
+)
+PACKAGES = ("llama-index-core", "faiss-cpu", "numpy", "scipy")
+
+
+class HashEmbedding(BaseEmbedding):
+    """Deterministic offline embedding by signed feature hashing of words.
+
+    Every word is hashed to one dimension with a random sign, and a text's
+    vector is the normalized sum over its words. Texts that share words
+    get similar vectors, which keeps vector search meaningful without any
+    network access or model weights.
+    """
+
+    dimensions: int = 512
+    _buckets: Dict[str, Tuple[int, float]] = PrivateAttr(default_factory=dict)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "HashEmbedding"
+
+    def _bucket(self, word: str) -> Tuple[int, float]:
+        bucket = self._buckets.get(word)
+        if bucket is None:
+            digest = hashlib.blake2b(word.encode(), digest_size=8).digest()
+            value = int.from_bytes(digest, "little")
+            bucket = (value % self.dimensions, 1.0 if value >> 63 else -1.0)
+            self._buckets[word] = bucket
+        return bucket
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Unit vectors of texts, shape (len(texts), dimensions)."""
+        rows, cols, signs = [], [], []
+        for row, text in enumerate(texts):
+            for word in _WORD.findall(text.lower()):
+                col, sign = self._bucket(word)
+                rows.append(row)
+                cols.append(col)
+                signs.append(sign)
+        # Duplicate (row, col) entries are summed on conversion
+        vectors = sp.coo_matrix(
+            (signs, (rows, cols)), shape=(len(texts), self.dimensions), dtype=np.float32
+        ).toarray()
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self.embed([query])[0].tolist()
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._get_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self.embed([text])[0].tolist()
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self.embed(texts).tolist()
+
+
+class StubLLM(CustomLLM):
+    """Offline LLM answering query rewrite prompts with reordered words."""
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(model_name="stub")
+
+    @llm_completion_callback()
+    def complete(
+        self, prompt: str, formatted: bool = False, **kwargs: Any
+    ) -> CompletionResponse:
+        query = prompt.rsplit("Query:", 1)[-1].split("\n", 1)[0].split()
+        variants = [
+            " ".join(query[shift:] + query[:shift]) for shift in range(1, len(query))
+        ]
+        return CompletionResponse(text="\n".join(variants))
+
+    @llm_completion_callback()
+    def stream_complete(
+        self, prompt: str, formatted: bool = False, **kwargs: Any
+    ) -> CompletionResponseGen:
+        yield self.complete(prompt, formatted=formatted, **kwargs)
+
+
+def vocabulary(size: int, rng: np.random.Generator) -> np.ndarray:
+    """Distinct pronounceable pseudo-words."""
+    syllables = np.array(
+        [c + v for c in "bcdfghklmnprstvz" for v in ("a", "e", "i", "o", "u", "ai")]
+    )
+    words = set()
+    while len(words) < size:
+        length = rng.integers(1, 4)
+        words.add("".join(rng.choice(syllables, length)))
+    return np.array(sorted(words), dtype=object)
+
+
+def synthetic_documents(
+    num_words: int,
+    words_per_document: int,
+    vocab: np.ndarray,
+    zipf: float,
+    rng: np.random.Generator,
+) -> List[Document]:
+    """Documents of Zipf-distributed words in sentences of 6 to 24 words."""
+    documents = []
+    for start in range(0, num_words, words_per_document):
+        count = min(words_per_document, num_words - start)
+        ids = np.minimum(rng.zipf(zipf, count), len(vocab)) - 1
+        words = vocab[ids]
+        ends = np.cumsum(rng.integers(6, 25, count))
+        ends = ends[ends < count]
+        sentences = np.split(words, ends)
+        text = " ".join(
+            " ".join(sentence).capitalize() + "."
+            for sentence in sentences
+            if len(sentence)
+        )
+        documents.append(Document(text=text, metadata={"file_name": f"doc{start}"}))
+    return documents
+
+
+def rss_mb(pid: Any = "self") -> float:
+    """Current resident set size of a process in MB.
+
+    Falls back to the peak RSS of this process where /proc is missing.
+    """
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * resource.getpagesize() / 2**20
+    except OSError:
+        return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS and in KB elsewhere
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def percentiles_ms(values: List[float]) -> Dict[str, float]:
+    """p50, p95 and p99 of durations in seconds, in milliseconds."""
+    values_ms = np.asarray(values) * 1000
+    return {
+        f"p{q}_ms": float(np.percentile(values_ms, q)) for q in (50, 95, 99)
+    }
+
+
+def words_per_chunk(splitter: TextSplitter, vocab, args) -> float:
+    """Average words per chunk, measured by splitting a sample document."""
+    rng = np.random.default_rng(args.seed + 1)
+    sample = synthetic_documents(
+        args.words_per_document, args.words_per_document, vocab, args.zipf, rng
+    )
+    nodes = splitter.splitter.get_nodes_from_documents(sample)
+    return args.words_per_document / max(len(nodes), 1)
+
+
+def benchmark_size(num_chunks: int, vocab: np.ndarray, args) -> Dict[str, Any]:
+    """Build a fusion retriever over `num_chunks` chunks and time it."""
+    rng = np.random.default_rng(args.seed)
+    splitter = TextSplitter(chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap)
+    # The chunk stride excludes the overlap repeated in consecutive chunks
+    stride = words_per_chunk(splitter, vocab, args)
+    documents = synthetic_documents(
+        int(num_chunks * stride), args.words_per_document, vocab, args.zipf, rng
+    )
+    corpus_mb = sum(len(document.text) for document in documents) / 2**20
+    baseline_rss = rss_mb()
+    result: Dict[str, Any] = {
+        "target_chunks": num_chunks,
+        "documents": len(documents),
+        "corpus_mb": corpus_mb,
+    }
+
+    start = time.perf_counter()
+    nodes = splitter.split_documents(documents)
+    result["split_s"] = time.perf_counter() - start
+    result["chunks"] = len(nodes)
+    result["split_chunks_per_s"] = len(nodes) / result["split_s"]
+    result["split_mb_per_s"] = corpus_mb / result["split_s"]
+    del documents
+    gc.collect()
+    print(f"{num_chunks}: split {len(nodes)} chunks", file=sys.stderr)
+    node_store = NodeStore()
+    node_ids = node_store.add(nodes)
+
+    embed_model = HashEmbedding(dimensions=args.dimensions, embed_batch_size=1000)
+    start = time.perf_counter()
+    embeddings = np.empty((len(nodes), args.dimensions), dtype=np.float32)
+    for batch in range(0, len(nodes), 1000):
+        embeddings[batch : batch + 1000] = embed_model.embed(
+            [node_text(node) for node in nodes[batch : batch + 1000]]
+        )
+    result["embed_s"] = time.perf_counter() - start
+
+    embed_config = EmbeddingConfig(
+        dimensions=args.dimensions,
+        index_type=args.index_type,
+        cache_path=None,
+        train_sample_size=args.train_sample_size,
+    )
+    pool = ShardPool(args.shards, embed_config) if args.shards > 1 else None
+    store = FaissIndexStore(embed_config)
+    if pool is not None:
+        # Start the workers outside of the timed section
+        store = ShardedVectorStore.create(pool)
+        baseline_rss += sum(rss_mb(pid) for pid in pool.pids)
+    start = time.perf_counter()
+    sample_size = min(embed_config.train_sample_size, len(nodes))
+    sample = rng.choice(len(nodes), sample_size, replace=False)
+    store.train(embeddings[sample], num_vectors=len(nodes))
+    store.add_embeddings(node_ids, embeddings)
+    result["vector_index_s"] = time.perf_counter() - start
+    del embeddings
+    gc.collect()
+    print(f"{num_chunks}: indexed {store.num_vectors} vectors", file=sys.stderr)
+
+    retriever_config = RetrieverConfig(
+        similarity_top_k=args.k, num_queries=args.num_queries
+    )
+    rewriter = None
+    if args.num_queries > 1:
+        rewriter = QueryRewriter(
+            num_rewrites=args.num_queries - 1, llm=StubLLM(), timeout=None
+        )
+    start = time.perf_counter()
+    bm25_index = BM25Index() if pool is None else ShardedBM25Index.create(pool)
+    bm25_index.add(node_ids, [node_text(node) for node in nodes])
+    retriever = FusionRetriever(
+        node_store,
+        store,
+        embed_model,
+        retriever_config,
+        bm25_index=bm25_index,
+        rewriter=rewriter,
+    )
+    result["bm25_index_s"] = time.perf_counter() - start
+    # Only the node store keeps the chunks from here on
+    del nodes
+    gc.collect()
+    worker_rss = sum(rss_mb(pid) for pid in pool.pids) if pool is not None else 0.0
+    result["index_rss_mb"] = rss_mb() + worker_rss - baseline_rss
+    result["peak_rss_mb"] = peak_rss_mb()
+    print(f"{num_chunks}: built BM25 index", file=sys.stderr)
+
+    # Queries are word runs taken from random chunks, so both retrievers
+    # find candidates
+    queries = []
+    for index in rng.choice(len(node_store), args.num_queries_timed, replace=True):
+        words = _WORD.findall(node_store[int(index)].get_content())
+        offset = rng.integers(0, max(len(words) - args.query_words, 0) + 1)
+        queries.append(" ".join(words[offset : offset + args.query_words]))
+
+    result["retrieve"] = {}
+    for mode in FUSION_MODES:
+        params = retriever.params.override(mode=mode)
+        for query in queries[: args.warmup]:
+            retriever.retrieve(query, params=params)
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            retriever.retrieve(query, params=params)
+            latencies.append(time.perf_counter() - start)
+        result["retrieve"][mode] = percentiles_ms(latencies)
+        print(f"{num_chunks}: {mode} {result['retrieve'][mode]}", file=sys.stderr)
+    if pool is not None:
+        pool.close()
+    return result
+
+
+def environment() -> Dict[str, Any]:
+    """Interpreter, platform and library versions of this run."""
+    versions = {}
+    for package in PACKAGES:
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            versions[package] = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.machine(),
+        "packages": versions,
+    }
+
+
+def print_report(rows: List[Dict[str, Any]]):
+    """Print stage timings and retrieval latencies as Markdown tables."""
+    print(
+        "| chunks | corpus (MB) | split (s) | split (chunks/s) | embed (s) | "
+        "FAISS (s) | BM25 (s) | index RSS (MB) | peak RSS (MB) |"
+    )
+    print("|---|---|---|---|---|---|---|---|---|")
+    for row in rows:
+        print(
+            f"| {row['chunks']} | {row['corpus_mb']:.1f} | {row['split_s']:.1f} | "
+            f"{row['split_chunks_per_s']:.0f} | {row['embed_s']:.1f} | "
+            f"{row['vector_index_s']:.1f} | {row['bm25_index_s']:.1f} | "
+            f"{row['index_rss_mb']:.0f} | {row['peak_rss_mb']:.0f} |"
+        )
+
+    print("\n| chunks | mode | p50 (ms) | p95 (ms) | p99 (ms) |")
+    print("|---|---|---|---|---|")
+    for row in rows:
+        for mode, latency in row["retrieve"].items():
+            print(
+                f"| {row['chunks']} | {mode} | {latency['p50_ms']:.2f} | "
+                f"{latency['p95_ms']:.2f} | {latency['p99_ms']:.2f} |"
+            )
+
+
+def print_comparison(rows: List[Dict[str, Any]], baseline_path: str):
+    """Print this run relative to a baseline JSON report of the same sizes."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    previous = {row["target_chunks"]: row for row in baseline["results"]}
+    print(f"\nRelative to {baseline_path} ({baseline['environment']['packages']})\n")
+    print("| chunks | metric | baseline | current | change |")
+    print("|---|---|---|---|---|")
+    for row in rows:
+        old = previous.get(row["target_chunks"])
+        if old is None:
+            continue
+        pairs = [(metric, old[metric], row[metric]) for metric in METRICS]
+        for mode, latency in row["retrieve"].items():
+            if mode in old["retrieve"]:
+                for name, value in latency.items():
+                    pairs.append((f"{mode} {name}", old["retrieve"][mode][name], value))
+        for metric, before, after in pairs:
+            change = (after - before) / before * 100 if before else float("nan")
+            print(
+                f"| {row['target_chunks']} | {metric} | {before:.2f} | "
+                f"{after:.2f} | {change:+.1f}% |"
+            )
+
+
+def main():
+    """Run the benchmark for every corpus size and print the report."""
+    parser = argparse.ArgumentParser(description="Offline rag_core pipeline benchmark")
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000]
+    )
+    parser.add_argument("--chunk-size", type=int, default=256)
+    parser.add_argument("--chunk-overlap", type=int, default=32)
+    parser.add_argument("--words-per-document", type=int, default=5_000)
+    parser.add_argument("--vocab-size", type=int, default=50_000)
+    parser.add_argument("--zipf", type=float, default=1.2)
+    parser.add_argument("--dimensions", type=int, default=256)
+    parser.add_argument("--index-type", default="flat")
+    parser.add_argument("--shards", type=int, default=1)
+    parser.add_argument("--train-sample-size", type=int, default=50_000)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--num-queries", type=int, default=1)
+    parser.add_argument("--num-queries-timed", type=int, default=500)
+    parser.add_argument("--query-words", type=int, default=6)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Optional JSON output path")
+    parser.add_argument("--baseline", help="JSON report of an earlier run to compare")
+    args = parser.parse_args()
+
+    # Per-query retrieval logs would dominate the measured latency
+    logging.getLogger("rag_core").setLevel(logging.WARNING)
+
+    vocab = vocabulary(args.vocab_size, np.random.default_rng(args.seed))
+    rows = []
+    for num_chunks in sorted(args.sizes):
+        rows.append(benchmark_size(num_chunks, vocab, args))
+        gc.collect()
+
+    print(
+        f"\n{args.dimensions}-d `{args.index_type}` index in {args.shards} "
+        f"shard(s), chunks of "
+        f"{args.chunk_size} tokens, top {args.k}, {args.num_queries} queries per "
+        f"retrieval, {args.num_queries_timed} timed queries per mode\n"
+    )
+    print_report(rows)
+    if args.baseline:
+        print_comparison(rows, args.baseline)
+
+    if args.output:
+        report = {
+            "args": vars(args),
+            "environment": environment(),
+            "retriever": asdict(RetrieverConfig(similarity_top_k=args.k)),
+            "results": rows,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
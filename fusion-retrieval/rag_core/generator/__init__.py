@@ -1,7 +1,8 @@
 """Generator modules for LLM integration"""
 
+from .context import ContextPacker
 from .llm import LLMGenerator
 
-__all__ = ["LLMGenerator"]
+__all__ = ["ContextPacker", "LLMGenerator"]
 
 
@@ -0,0 +1,235 @@
+"""Token-budgeted assembly of retrieved chunks into prompt context"""
+
+from __future__ import annotations
+
+import functools
+import re
+from collections import defaultdict
+from typing import Callable, Dict, FrozenSet, List, Optional, Sequence
+
+from llama_index.core.schema import NodeWithScore, TextNode
+from llama_index.core.utils import get_tokenizer
+
+from ..utils.config import ContextConfig
+from ..utils.logging import get_logger
+from ..utils.metrics import count_items, stage_timer
+
+logger = get_logger(__name__)
+
+# Joins context passages in the prompt
+SEPARATOR = "\n\n"
+
+# Characters at the start of a chunk searched for in its predecessor's tail
+_ANCHOR_CHARS = 32
+
+_WORD = re.compile(r"\w+")
+
+
+@functools.lru_cache(maxsize=None)
+def model_tokenizer(model: str) -> Callable[[str], List[int]]:
+    """Tokenizer of an OpenAI model, loaded once per model.
+
+    Args:
+        model: Model name, e.g. 'gpt-4o-mini'
+
+    Returns:
+        Function from text to token IDs; the `cl100k_base` tokenizer if the
+        model's encoding is unknown or cannot be loaded
+    """
+    try:
+        import tiktoken
+
+        encoding = tiktoken.encoding_for_model(model)
+    except Exception as e:
+        logger.warning(f"No tokenizer for {model} ({e}), counting with cl100k_base")
+        return get_tokenizer()
+    return functools.partial(encoding.encode, allowed_special="all")
+
+
+def join_overlapping(first: str, second: str) -> Optional[str]:
+    """Join two chunks if `second` continues `first` with overlapping text.
+
+    Args:
+        first: Earlier chunk
+        second: Later chunk
+
+    Returns:
+        `first` followed by the part of `second` it does not already
+        contain, or None if `second` does not start inside `first`. Overlaps
+        shorter than 32 characters are treated as coincidental.
+    """
+    anchor = second[:_ANCHOR_CHARS]
+    if not anchor:
+        return first
+    # Leftmost match first: the longest overlap wins
+    start = first.find(anchor)
+    while start != -1:
+        overlap = len(first) - start
+        if second[:overlap] == first[start:start + len(second)]:
+            return first + second[overlap:]
+        start = first.find(anchor, start + 1)
+    return None
+
+
+class ContextPacker:
+    """Assembles retrieved chunks into the context passed to the LLM.
+
+    Chunks of the same source document whose character ranges overlap or
+    touch are merged into one passage, so the `chunk_overlap` text they
+    share appears once. Passages whose word trigrams are mostly contained
+    in a better scored passage are dropped as near-duplicates. The rest are
+    ordered by score and added until the token budget is used up; a
+    passage that does not fit is skipped in favour of smaller ones, and the
+    best passage is truncated if it alone exceeds the budget.
+    """
+
+    def __init__(
+        self,
+        config: ContextConfig,
+        tokenizer: Optional[Callable[[str], List[int]]] = None,
+        model: str = "gpt-4o-mini",
+    ):
+        """Initialize context packer.
+
+        Args:
+            config: Context assembly configuration
+            tokenizer: Function from text to tokens; defaults to the
+                tokenizer of `model`, loaded on first use
+            model: LLM whose tokenizer measures the budget
+        """
+        self.config = config
+        self.model = model
+        self._tokenizer = tokenizer
+
+    @property
+    def tokenizer(self) -> Callable[[str], List[int]]:
+        if self._tokenizer is None:
+            self._tokenizer = model_tokenizer(self.model)
+        return self._tokenizer
+
+    def pack(self, nodes: Sequence[NodeWithScore]) -> List[NodeWithScore]:
+        """Build the prompt context from retrieved nodes.
+
+        Args:
+            nodes: Retrieved nodes with scores
+
+        Returns:
+            Context passages with scores, best first
+        """
+        with stage_timer("pack_context"):
+            if self.config.merge_adjacent:
+                passages = self._merge(nodes)
+            else:
+                passages = list(nodes)
+            passages.sort(key=lambda passage: passage.score or 0.0, reverse=True)
+            if self.config.dedup_threshold is not None:
+                passages = self._deduplicate(passages)
+            if self.config.max_tokens > 0:
+                passages = self._fit(passages)
+        count_items("pack_context", len(passages))
+        logger.info(f"Packed {len(nodes)} chunks into {len(passages)} passages")
+        return passages
+
+    def _merge(self, nodes: Sequence[NodeWithScore]) -> List[NodeWithScore]:
+        """Merge overlapping or adjacent chunks of the same source document."""
+        by_source: Dict[str, List[NodeWithScore]] = defaultdict(list)
+        passages = []
+        for node in nodes:
+            inner = node.node
+            if inner.ref_doc_id is None or inner.start_char_idx is None:
+                passages.append(node)
+            else:
+                by_source[inner.ref_doc_id].append(node)
+
+        for group in by_source.values():
+            group.sort(key=lambda node: node.node.start_char_idx)
+            run = [group[0]]
+            text = group[0].node.get_content()
+            end = group[0].node.end_char_idx
+            for node in group[1:]:
+                # Character offsets refer to the source text before cleaning
+                if node.node.start_char_idx > end + 1:
+                    passages.append(self._passage(run, text, end))
+                    run, text = [node], node.node.get_content()
+                else:
+                    run.append(node)
+                    text = join_overlapping(
+                        text, node.node.get_content()
+                    ) or f"{text} {node.node.get_content()}"
+                end = max(end, node.node.end_char_idx)
+            passages.append(self._passage(run, text, end))
+        return passages
+
+    @staticmethod
+    def _passage(run: List[NodeWithScore], text: str, end: int) -> NodeWithScore:
+        """One passage for consecutive chunks, scored by its best chunk."""
+        if len(run) == 1:
+            return run[0]
+        first = run[0].node
+        node = TextNode(
+            text=text,
+            metadata=dict(first.metadata),
+            excluded_embed_metadata_keys=first.excluded_embed_metadata_keys,
+            excluded_llm_metadata_keys=first.excluded_llm_metadata_keys,
+            start_char_idx=first.start_char_idx,
+            end_char_idx=end,
+        )
+        return NodeWithScore(node=node, score=max(n.score or 0.0 for n in run))
+
+    def _deduplicate(self, passages: List[NodeWithScore]) -> List[NodeWithScore]:
+        """Drop passages mostly contained in a better scored one."""
+        kept: List[NodeWithScore] = []
+        kept_shingles: List[FrozenSet] = []
+        for passage in passages:
+            shingles = _shingles(passage.node.get_content())
+            if any(
+                _containment(shingles, other) >= self.config.dedup_threshold
+                for other in kept_shingles
+            ):
+                continue
+            kept.append(passage)
+            kept_shingles.append(shingles)
+        return kept
+
+    def _fit(self, passages: List[NodeWithScore]) -> List[NodeWithScore]:
+        """Keep the best passages that fit into the token budget."""
+        budget = self.config.max_tokens
+        separator = len(self.tokenizer(SEPARATOR))
+        packed: List[NodeWithScore] = []
+        used = 0
+        for passage in passages:
+            cost = len(self.tokenizer(passage.node.get_content()))
+            if packed:
+                cost += separator
+            if used + cost <= budget:
+                packed.append(passage)
+                used += cost
+            elif not packed:
+                packed.append(self._truncate(passage, budget))
+                used = budget
+        return packed
+
+    def _truncate(self, passage: NodeWithScore, budget: int) -> NodeWithScore:
+        """Cut a passage down to at most `budget` tokens."""
+        text = passage.node.get_content()
+        tokens = len(self.tokenizer(text))
+        while tokens > budget and text:
+            text = text[: int(len(text) * budget / tokens * 0.95)]
+            tokens = len(self.tokenizer(text))
+        node = TextNode(text=text, metadata=dict(passage.node.metadata))
+        return NodeWithScore(node=node, score=passage.score)
+
+
+def _shingles(text: str) -> FrozenSet:
+    """Word trigrams of a text, or its words if it is shorter."""
+    words = _WORD.findall(text.lower())
+    if len(words) < 3:
+        return frozenset(words)
+    return frozenset(zip(words, words[1:], words[2:]))
+
+
+def _containment(shingles: FrozenSet, other: FrozenSet) -> float:
+    """Fraction of `shingles` that also occur in `other`."""
+    if not shingles:
+        return 1.0
+    return len(shingles & other) / len(shingles)
@@ -1,10 +1,14 @@
 """LLM generation utilities"""
 
-from llama_index.core import Settings
+from typing import Any, AsyncIterator, Callable, Iterator, List, Optional, Tuple
+
+from llama_index.core.base.llms.types import CompletionResponse
 from llama_index.llms.openai import OpenAI
 
 from ..utils.config import LLMConfig
 from ..utils.logging import get_logger
+from ..utils.metrics import LLM_TOKENS, stage_timer
+from .context import model_tokenizer
 
 logger = get_logger(__name__)
 
@@ -20,7 +24,7 @@ class LLMGenerator:
         """
         self.config = llm_config
         self.llm = OpenAI(model=llm_config.model, temperature=llm_config.temperature)
-        Settings.llm = self.llm
+        self._tokenizer: Optional[Callable[[str], List[int]]] = None
         logger.info(f"Initialized LLM: {llm_config.model}")
 
     def generate(self, prompt: str) -> str:
@@ -33,9 +37,81 @@ class LLMGenerator:
             Generated text
         """
         logger.info("Generating response from LLM")
-        response = self.llm.complete(prompt)
+        with stage_timer("generate"):
+            response = self.llm.complete(prompt)
+        self._record_usage(prompt, response.text, response)
+        return str(response)
+
+    async def agenerate(self, prompt: str) -> str:
+        """Generate text from a prompt asynchronously.
+
+        Args:
+            prompt: Input prompt
+
+        Returns:
+            Generated text
+        """
+        logger.info("Generating response from LLM")
+        with stage_timer("generate"):
+            response = await self.llm.acomplete(prompt)
+        self._record_usage(prompt, response.text, response)
         return str(response)
 
+    def stream(self, prompt: str) -> Iterator[str]:
+        """Generate text from a prompt, yielding tokens as they arrive.
+
+        Args:
+            prompt: Input prompt
+
+        Yields:
+            Text deltas
+        """
+        logger.info("Streaming response from LLM")
+        response = None
+        try:
+            with stage_timer("generate"):
+                for response in self.llm.stream_complete(prompt):
+                    if response.delta:
+                        yield response.delta
+        finally:
+            # Also counts the tokens of a stream the client abandoned
+            self._record_usage(prompt, response.text if response else "", response)
+
+    async def astream(self, prompt: str) -> AsyncIterator[str]:
+        """Asynchronously generate text from a prompt, yielding tokens as they arrive.
+
+        Args:
+            prompt: Input prompt
+
+        Yields:
+            Text deltas
+        """
+        logger.info("Streaming response from LLM")
+        response = None
+        try:
+            with stage_timer("generate"):
+                async for response in await self.llm.astream_complete(prompt):
+                    if response.delta:
+                        yield response.delta
+        finally:
+            self._record_usage(prompt, response.text if response else "", response)
+
+    def _record_usage(
+        self, prompt: str, text: str, response: Optional[CompletionResponse]
+    ):
+        """Count input and output tokens of one generation.
+
+        Uses the usage the API reported when there is one, and counts with
+        the model's tokenizer otherwise (streamed responses, other LLMs).
+        """
+        usage = reported_usage(response)
+        if usage is None:
+            if self._tokenizer is None:
+                self._tokenizer = model_tokenizer(self.config.model)
+            usage = len(self._tokenizer(prompt)), len(self._tokenizer(text))
+        LLM_TOKENS.inc(usage[0], direction="input")
+        LLM_TOKENS.inc(usage[1], direction="output")
+
     def get_llm(self):
         """Get the underlying LLM instance.
 
@@ -44,3 +120,27 @@ class LLMGenerator:
         """
         return self.llm
 
+
+def reported_usage(response: Optional[CompletionResponse]) -> Optional[Tuple[int, int]]:
+    """Prompt and completion tokens reported with an LLM response.
+
+    Args:
+        response: Completion response; its `raw` API response carries the usage
+
+    Returns:
+        (prompt tokens, completion tokens), or None if no usage was reported
+    """
+    raw = getattr(response, "raw", None)
+    usage = _field(raw, "usage")
+    prompt_tokens = _field(usage, "prompt_tokens")
+    completion_tokens = _field(usage, "completion_tokens")
+    if prompt_tokens is None or completion_tokens is None:
+        return None
+    return int(prompt_tokens), int(completion_tokens)
+
+
+def _field(value: Any, name: str) -> Any:
+    """Attribute or key `name` of an object or dict, or None."""
+    if isinstance(value, dict):
+        return value.get(name)
+    return getattr(value, name, None)
@@ -1,7 +1,8 @@
 """Pipeline modules combining retrieval and generation"""
 
 from .pipeline import FusionRAGPipeline
+from .registry import CollectionRegistry
 
-__all__ = ["FusionRAGPipeline"]
+__all__ = ["FusionRAGPipeline", "CollectionRegistry"]
 
 
@@ -0,0 +1,456 @@
+"""Answer cache with exact and semantic lookup"""
+
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+from ..utils.concurrency import synchronized
+from ..utils.config import AnswerCacheConfig, _resolve_path
+from ..utils.logging import get_logger
+
+logger = get_logger(__name__)
+
+ANSWER_CACHE_BACKENDS = ("memory", "sqlite")
+
+
+def normalize_query(query: str) -> str:
+    """Canonical form of a query used as the exact-match key.
+
+    Lowercases, collapses whitespace and drops trailing punctuation, so
+    "What is X?" and "what is  x" share an entry.
+    """
+    return " ".join(query.lower().split()).rstrip("?!. ")
+
+
+@dataclass
+class CacheEntry:
+    """A cached answer and the query embedding it was produced for."""
+
+    key: str
+    result: Dict[str, Any]
+    embedding: Optional[np.ndarray]
+    corpus_version: str
+    created_at: float
+    last_used: float
+
+
+class AnswerCacheBackend(ABC):
+    """Storage for cache entries keyed by normalized query."""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[CacheEntry]:
+        """Return the entry for a key, if any."""
+
+    @abstractmethod
+    def put(self, entry: CacheEntry):
+        """Insert or replace an entry."""
+
+    @abstractmethod
+    def touch(self, key: str, last_used: float):
+        """Mark an entry as recently used."""
+
+    @abstractmethod
+    def delete(self, keys: Iterable[str]):
+        """Remove entries."""
+
+    @abstractmethod
+    def clear(self):
+        """Remove all entries."""
+
+    @abstractmethod
+    def entries(self) -> Iterator[CacheEntry]:
+        """Iterate over all entries."""
+
+    @abstractmethod
+    def lru_keys(self, n: int) -> List[str]:
+        """Keys of the `n` least recently used entries."""
+
+    @abstractmethod
+    def __len__(self) -> int:
+        """Number of entries."""
+
+
+class InMemoryBackend(AnswerCacheBackend):
+    """Process-local backend kept in recency order."""
+
+    def __init__(self):
+        self._entries: OrderedDict[str, CacheEntry] = OrderedDict()
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        return self._entries.get(key)
+
+    def put(self, entry: CacheEntry):
+        self._entries[entry.key] = entry
+        self._entries.move_to_end(entry.key)
+
+    def touch(self, key: str, last_used: float):
+        entry = self._entries.get(key)
+        if entry is not None:
+            entry.last_used = last_used
+            self._entries.move_to_end(key)
+
+    def delete(self, keys: Iterable[str]):
+        for key in keys:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def entries(self) -> Iterator[CacheEntry]:
+        return iter(list(self._entries.values()))
+
+    def lru_keys(self, n: int) -> List[str]:
+        return [key for key, _ in zip(self._entries, range(n))]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteBackend(AnswerCacheBackend):
+    """On-disk backend that survives restarts and can be shared by workers."""
+
+    def __init__(self, path: str | os.PathLike[str]):
+        """Open (or create) the cache database.
+
+        Args:
+            path: SQLite database file
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            "key TEXT PRIMARY KEY, result TEXT NOT NULL, embedding BLOB, "
+            "corpus_version TEXT NOT NULL, created_at REAL NOT NULL, "
+            "last_used REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS answers_last_used ON answers(last_used)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def _entry(row) -> CacheEntry:
+        key, result, embedding, corpus_version, created_at, last_used = row
+        return CacheEntry(
+            key=key,
+            result=json.loads(result),
+            embedding=(
+                None if embedding is None else np.frombuffer(embedding, np.float32)
+            ),
+            corpus_version=corpus_version,
+            created_at=created_at,
+            last_used=last_used,
+        )
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        row = self._conn.execute(
+            "SELECT * FROM answers WHERE key = ?", (key,)
+        ).fetchone()
+        return None if row is None else self._entry(row)
+
+    def put(self, entry: CacheEntry):
+        embedding = (
+            None
+            if entry.embedding is None
+            else np.asarray(entry.embedding, dtype=np.float32).tobytes()
+        )
+        self._conn.execute(
+            "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                entry.key,
+                json.dumps(entry.result),
+                embedding,
+                entry.corpus_version,
+                entry.created_at,
+                entry.last_used,
+            ),
+        )
+        self._conn.commit()
+
+    def touch(self, key: str, last_used: float):
+        self._conn.execute(
+            "UPDATE answers SET last_used = ? WHERE key = ?", (last_used, key)
+        )
+        self._conn.commit()
+
+    def delete(self, keys: Iterable[str]):
+        self._conn.executemany(
+            "DELETE FROM answers WHERE key = ?", [(key,) for key in keys]
+        )
+        self._conn.commit()
+
+    def clear(self):
+        self._conn.execute("DELETE FROM answers")
+        self._conn.commit()
+
+    def entries(self) -> Iterator[CacheEntry]:
+        rows = self._conn.execute("SELECT * FROM answers").fetchall()
+        return (self._entry(row) for row in rows)
+
+    def lru_keys(self, n: int) -> List[str]:
+        rows = self._conn.execute(
+            "SELECT key FROM answers ORDER BY last_used ASC LIMIT ?", (n,)
+        ).fetchall()
+        return [key for (key,) in rows]
+
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+
+
+class AnswerCache:
+    """Two-tier answer cache in front of the RAG pipeline.
+
+    `get()` matches the normalized query text exactly; `get_similar()`
+    finds the cached query with the most similar embedding and returns its
+    answer if the cosine similarity reaches `similarity_threshold`. Entries
+    expire after `ttl_seconds`, the least recently used ones are evicted
+    beyond `max_entries`, and every entry is tagged with the corpus version
+    it was answered against, so changing the corpus invalidates it.
+    """
+
+    def __init__(
+        self,
+        backend: AnswerCacheBackend,
+        ttl_seconds: float = 3600,
+        max_entries: int = 10_000,
+        similarity_threshold: float = 0.95,
+    ):
+        """Initialize answer cache.
+
+        Args:
+            backend: Entry storage
+            ttl_seconds: Entry lifetime (0 disables expiry)
+            max_entries: Maximum number of entries (0 disables eviction)
+            similarity_threshold: Minimum cosine similarity for a semantic hit
+        """
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.corpus_version: Optional[str] = None
+
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+        # Semantic index over the embeddings of cached queries
+        self._keys: List[str] = []
+        self._embeddings: List[np.ndarray] = []
+        self._matrix: Optional[np.ndarray] = None
+        self._index_stale = True
+        self._lock = threading.RLock()
+
+    @synchronized
+    def set_corpus_version(self, version: str):
+        """Invalidate entries answered against any other corpus version.
+
+        Args:
+            version: Fingerprint of the current corpus
+        """
+        if version == self.corpus_version:
+            return
+        self.corpus_version = version
+        stale = [
+            entry.key
+            for entry in self.backend.entries()
+            if entry.corpus_version != version
+        ]
+        if stale:
+            self.backend.delete(stale)
+            self.invalidations += len(stale)
+            logger.info(f"Invalidated {len(stale)} cached answers after corpus change")
+        self._index_stale = True
+
+    @synchronized
+    def get(self, query: str) -> Optional[Dict[str, Any]]:
+        """Look up an answer for exactly this (normalized) query.
+
+        Args:
+            query: Query string
+
+        Returns:
+            Cached result for `query`, or None
+        """
+        entry = self._live_entry(normalize_query(query))
+        if entry is None:
+            return None
+        self.exact_hits += 1
+        return self._hit(query, entry, "exact")
+
+    @synchronized
+    def get_similar(
+        self, query: str, query_embedding: Sequence[float]
+    ) -> Optional[Dict[str, Any]]:
+        """Look up an answer for the most similar cached query.
+
+        Args:
+            query: Query string
+            query_embedding: Embedding of `query`
+
+        Returns:
+            Cached result if a cached query is similar enough, else None
+        """
+        matrix = self._semantic_index()
+        if matrix is not None:
+            vector = _unit(np.asarray(query_embedding, dtype=np.float32))
+            similarities = matrix @ vector
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.similarity_threshold:
+                entry = self._live_entry(self._keys[best])
+                if entry is not None:
+                    self.semantic_hits += 1
+                    return self._hit(query, entry, "semantic")
+        self.misses += 1
+        return None
+
+    @synchronized
+    def put(
+        self,
+        query: str,
+        query_embedding: Optional[Sequence[float]],
+        result: Dict[str, Any],
+    ):
+        """Cache the result of a query.
+
+        Args:
+            query: Query string
+            query_embedding: Embedding of `query`, enables semantic hits
+            result: Result dictionary to return for future hits
+        """
+        now = time.time()
+        embedding = None
+        if query_embedding is not None:
+            embedding = _unit(np.asarray(query_embedding, dtype=np.float32))
+        entry = CacheEntry(
+            key=normalize_query(query),
+            result={k: v for k, v in result.items() if k != "cached"},
+            embedding=embedding,
+            corpus_version=self.corpus_version or "",
+            created_at=now,
+            last_used=now,
+        )
+        replaced = self.backend.get(entry.key) is not None
+        self.backend.put(entry)
+        if replaced:
+            self._index_stale = True
+        elif embedding is not None and not self._index_stale:
+            self._keys.append(entry.key)
+            self._embeddings.append(embedding)
+            self._matrix = None
+
+        overflow = len(self.backend) - self.max_entries
+        if self.max_entries > 0 and overflow > 0:
+            self.backend.delete(self.backend.lru_keys(overflow))
+            self.evictions += overflow
+            self._index_stale = True
+
+    @synchronized
+    def clear(self):
+        """Remove every cached answer."""
+        self.backend.clear()
+        self._index_stale = True
+
+    @synchronized
+    def stats(self) -> Dict[str, Any]:
+        """Hit, miss and eviction counters.
+
+        Returns:
+            Dictionary of counters, current size and hit rate
+        """
+        hits = self.exact_hits + self.semantic_hits
+        lookups = hits + self.misses
+        return {
+            "entries": len(self.backend),
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+    def _live_entry(self, key: str) -> Optional[CacheEntry]:
+        """Fetch an entry, dropping it if expired or from another corpus."""
+        entry = self.backend.get(key)
+        if entry is None:
+            return None
+        expired = (
+            self.ttl_seconds > 0 and time.time() - entry.created_at > self.ttl_seconds
+        )
+        if expired or entry.corpus_version != (self.corpus_version or ""):
+            self.backend.delete([key])
+            self._index_stale = True
+            if expired:
+                self.expirations += 1
+            return None
+        return entry
+
+    def _hit(self, query: str, entry: CacheEntry, tier: str) -> Dict[str, Any]:
+        self.backend.touch(entry.key, time.time())
+        return {**entry.result, "query": query, "cached": tier}
+
+    def _semantic_index(self) -> Optional[np.ndarray]:
+        """Matrix of unit query embeddings, rebuilt after deletions."""
+        if self._index_stale:
+            self._keys, self._embeddings = [], []
+            for entry in self.backend.entries():
+                if entry.embedding is not None:
+                    self._keys.append(entry.key)
+                    self._embeddings.append(entry.embedding)
+            self._matrix = None
+            self._index_stale = False
+        if self._matrix is None and self._embeddings:
+            self._matrix = np.vstack(self._embeddings)
+        return self._matrix
+
+
+def _unit(vector: np.ndarray) -> np.ndarray:
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+def create_answer_cache(config: AnswerCacheConfig) -> Optional[AnswerCache]:
+    """Build the answer cache described by configuration.
+
+    Args:
+        config: Answer cache configuration
+
+    Returns:
+        AnswerCache instance, or None if the cache is disabled
+    """
+    if not config.enabled:
+        return None
+    if config.backend == "memory":
+        backend: AnswerCacheBackend = InMemoryBackend()
+    elif config.backend == "sqlite":
+        backend = SQLiteBackend(_resolve_path(config.path))
+    else:
+        raise ValueError(
+            f"Unsupported answer cache backend: {config.backend}. "
+            f"Options: {', '.join(ANSWER_CACHE_BACKENDS)}"
+        )
+    logger.info(f"Using {config.backend} answer cache")
+    return AnswerCache(
+        backend,
+        ttl_seconds=config.ttl_seconds,
+        max_entries=config.max_entries,
+        similarity_threshold=config.similarity_threshold,
+    )
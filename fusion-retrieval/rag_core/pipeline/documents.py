@@ -0,0 +1,107 @@
+"""Document registry for incremental ingestion"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+DOCUMENTS_FILENAME = "documents.json"
+
+
+def file_hash(path: str | os.PathLike[str], chunk_size: int = 1 << 20) -> str:
+    """Compute the SHA-256 digest of a file's contents.
+
+    Args:
+        path: File path
+        chunk_size: Read size in bytes
+
+    Returns:
+        Hex digest
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def normalize_path(path: str | os.PathLike[str]) -> str:
+    """Canonical registry key for a document path."""
+    return str(Path(path).resolve())
+
+
+@dataclass
+class DocumentRecord:
+    """An ingested source file and the nodes created from it."""
+
+    path: str
+    content_hash: str
+    node_ids: List[int] = field(default_factory=list)
+    updated_at: str = field(
+        default_factory=lambda: datetime.now(timezone.utc).isoformat()
+    )
+
+
+class DocumentRegistry:
+    """Tracks which nodes belong to which source file, keyed by path."""
+
+    def __init__(self, records: Optional[List[DocumentRecord]] = None):
+        """Initialize registry.
+
+        Args:
+            records: Initial document records
+        """
+        self._records: Dict[str, DocumentRecord] = {
+            record.path: record for record in records or []
+        }
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __iter__(self) -> Iterator[DocumentRecord]:
+        return iter(self._records.values())
+
+    def get(self, path: str | os.PathLike[str]) -> Optional[DocumentRecord]:
+        """Get the record for a document path, if any."""
+        return self._records.get(normalize_path(path))
+
+    def put(self, record: DocumentRecord):
+        """Insert or replace a document record."""
+        self._records[record.path] = record
+
+    def remove(self, path: str | os.PathLike[str]) -> Optional[DocumentRecord]:
+        """Remove and return the record for a document path, if any."""
+        return self._records.pop(normalize_path(path), None)
+
+    def clear(self):
+        """Forget all documents."""
+        self._records.clear()
+
+    def persist(self, persist_path: str | os.PathLike[str]):
+        """Write the registry as JSON.
+
+        Args:
+            persist_path: Target file
+        """
+        with open(persist_path, "w", encoding="utf-8") as f:
+            json.dump([asdict(record) for record in self], f, indent=2)
+
+    @classmethod
+    def load(cls, persist_path: str | os.PathLike[str]) -> "DocumentRegistry":
+        """Read a registry written by `persist()`, or an empty one if absent.
+
+        Args:
+            persist_path: Registry file
+
+        Returns:
+            DocumentRegistry instance
+        """
+        if not Path(persist_path).exists():
+            return cls()
+        with open(persist_path, "r", encoding="utf-8") as f:
+            return cls([DocumentRecord(**record) for record in json.load(f)])
@@ -1,18 +1,42 @@
 """Fusion RAG pipeline combining retrieval and generation"""
 
-from llama_index.core import Settings
-from llama_index.core.ingestion import IngestionPipeline
+import asyncio
+import hashlib
+import json
+import threading
+from dataclasses import asdict
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from llama_index.core.async_utils import asyncio_run
 from llama_index.core.schema import BaseNode
-from llama_index.embeddings.openai import OpenAIEmbedding
-from llama_index.llms.openai import OpenAI
 
+from ..generator.context import SEPARATOR, ContextPacker
 from ..generator.llm import LLMGenerator
-from ..retriever.loaders import DocumentLoader
+from ..retriever.bm25 import BM25Index, node_text
+from ..retriever.fusion import FusionParams
+from ..retriever.loaders import DocumentLoader, resolve_paths
+from ..retriever.node_store import create_node_store, load_node_store
 from ..retriever.retriever import FusionRetriever
+from ..retriever.rewriter import create_query_rewriter
+from ..retriever.sharded import ShardedBM25Index, ShardPool
 from ..retriever.splitter import TextSplitter
 from ..retriever.vectorstore import VectorStoreManager
-from ..utils.config import FusionRAGConfig
+from ..utils.concurrency import synchronized
+from ..utils.config import FusionRAGConfig, _resolve_path
 from ..utils.logging import get_logger
+from ..utils.metrics import stage_timer
+from .answer_cache import AnswerCache, create_answer_cache
+from .documents import (
+    DOCUMENTS_FILENAME,
+    DocumentRecord,
+    DocumentRegistry,
+    file_hash,
+    normalize_path,
+)
+from .progress import IngestProgress
+from .snapshot import BM25_DIRNAME, NODES_DIRNAME, VECTOR_DIRNAME, SnapshotManager
 
 logger = get_logger(__name__)
 
@@ -28,75 +52,636 @@ class FusionRAGPipeline:
         """
         self.config = config
 
-        # Set global settings
-        Settings.llm = OpenAI(
-            model=config.llm.model, temperature=config.llm.temperature
-        )
-        Settings.embed_model = OpenAIEmbedding(
-            model=config.embedding.model, dimensions=config.embedding.dimensions
+        # Components are instance-scoped; the global llama-index `Settings`
+        # are left alone so several pipelines can share a process
+        self.document_loader = DocumentLoader(
+            max_workers=config.data.loader_workers,
+            pdf_pages_per_task=config.data.pdf_pages_per_task,
         )
-
-        # Initialize components
-        self.document_loader = DocumentLoader()
         self.text_splitter = TextSplitter(
             chunk_size=config.data.chunk_size,
             chunk_overlap=config.data.chunk_overlap,
         )
-        self.vector_store_manager = VectorStoreManager(config.embedding)
+        # With several shards, FAISS and BM25 indexes live in worker processes
+        self.shard_pool = None
+        if config.sharding.num_shards > 1:
+            self.shard_pool = ShardPool(config.sharding.num_shards, config.embedding)
+        self.vector_store_manager = VectorStoreManager(
+            config.embedding, shard_pool=self.shard_pool
+        )
         self.llm_generator = LLMGenerator(config.llm)
+        self.context_packer = ContextPacker(config.context, model=config.llm.model)
+        self.snapshot_manager = SnapshotManager(
+            _resolve_path(config.snapshot.directory),
+            keep_last=config.snapshot.keep_last,
+        )
+        self.answer_cache = create_answer_cache(config.answer_cache)
+        self.query_rewriter = create_query_rewriter(
+            config.retriever, llm=self.llm_generator.llm
+        )
 
         # Pipeline state
-        self.nodes: list[BaseNode] = []
-        self.vector_index = None
+        self.nodes = create_node_store(config.node_store)
         self.retriever: FusionRetriever = None
+        self.documents = DocumentRegistry()
+        self.ingest_progress: Optional[IngestProgress] = None
+        # Whether the indexes changed since the last save to or load from
+        # the snapshot directory
+        self.dirty = False
+        # Serializes index updates; queries only read the indexes
+        self._lock = threading.RLock()
 
         logger.info("Fusion RAG pipeline initialized")
 
+    @synchronized
     def ingest(self, data_path: str):
         """Ingest documents and create indexes.
 
         Args:
-            data_path: Path to document or directory
+            data_path: Path to a document, a directory or a glob pattern
         """
         logger.info(f"Ingesting documents from {data_path}")
 
         # Load documents
-        documents = self.document_loader.load_from_file(data_path)
-
-        # Create ingestion pipeline
-        pipeline = IngestionPipeline(
-            transformations=[
-                self.text_splitter.splitter,
-                self.text_splitter.cleaner,
-            ],
-            vector_store=self.vector_store_manager.vector_store,
-            documents=documents,
+        documents = self.document_loader.load(data_path)
+        if not documents:
+            raise ValueError(f"No documents found at {data_path}")
+
+        # Run ingestion pipeline to get nodes
+        nodes = self._build_nodes(documents)
+        logger.info(f"Ingestion complete: {len(nodes)} nodes created")
+
+        self._build_indexes(nodes)
+        self._register_documents(nodes)
+        self._refresh_answer_cache()
+        logger.info("Pipeline ready for queries")
+
+        if self.config.snapshot.save_on_ingest:
+            self.save()
+
+    @synchronized
+    def ingest_stream(
+        self,
+        data_path: str,
+        batch_size: Optional[int] = None,
+        resume: bool = True,
+        progress: Optional[Callable[[IngestProgress], None]] = None,
+    ) -> IngestProgress:
+        """Ingest documents in bounded batches instead of all at once.
+
+        Files are parsed in parallel and consumed as soon as they finish;
+        their chunks are embedded and indexed `batch_size` at a time. The
+        loader only runs a few tasks ahead of indexing, so apart from the
+        indexes themselves, memory holds at most one batch of documents,
+        chunks and embeddings however large the corpus is.
+
+        A snapshot is saved every `data.checkpoint_every` batches. With
+        `resume`, the latest snapshot is loaded first (if none is in
+        memory) and files already ingested with the same content are
+        skipped, so a crashed run continues from its last checkpoint;
+        changed files replace their previous version. Without `resume` the
+        corpus is rebuilt from scratch, as with `ingest()`.
+
+        Args:
+            data_path: Path to a document, a directory or a glob pattern
+            batch_size: Chunks per batch; defaults to `data.stream_batch_size`
+            resume: Continue from the latest snapshot instead of starting over
+            progress: Called with the progress counters after every batch
+
+        Returns:
+            Final progress counters
+
+        Raises:
+            ValueError: If no files are found, or none of them yields a chunk
+                while nothing is indexed yet
+        """
+        batch_size = batch_size or self.config.data.stream_batch_size
+        paths = [normalize_path(path) for path in resolve_paths(data_path)]
+        if not paths:
+            raise ValueError(f"No documents found at {data_path}")
+
+        if not resume:
+            self._reset()
+        elif self.retriever is None:
+            self.load()
+
+        # Skip files that are already indexed with the same content
+        hashes: Dict[str, str] = {}
+        for path in paths:
+            record = self.documents.get(path)
+            content_hash = file_hash(path)
+            if record is None or record.content_hash != content_hash:
+                hashes[path] = content_hash
+
+        state = IngestProgress(
+            files_total=len(paths), files_skipped=len(paths) - len(hashes)
+        )
+        self.ingest_progress = state
+        logger.info(
+            f"Streaming ingestion of {len(hashes)} files from {data_path} "
+            f"({state.files_skipped} already ingested)"
         )
 
-        # Run pipeline to get nodes
-        self.nodes = pipeline.run()
-        logger.info(f"Ingestion complete: {len(self.nodes)} nodes created")
+        # IVF indexes are trained on the first batch, so give it enough vectors
+        first_batch_size = batch_size
+        embed_config = self.config.embedding
+        if self.retriever is None and embed_config.index_type.startswith("ivf"):
+            first_batch_size = max(batch_size, embed_config.train_sample_size)
 
-        # Create vector index
-        self.vector_index = self.vector_store_manager.create_index(self.nodes)
-        vector_retriever = self.vector_index.as_retriever(
-            similarity_top_k=self.config.retriever.similarity_top_k
+        batch: List[Tuple[str, List[BaseNode]]] = []
+        batch_nodes = 0
+        for path, documents in self.document_loader.iter_files(list(hashes)):
+            nodes = self._build_nodes(documents)
+            batch.append((path, nodes))
+            batch_nodes += len(nodes)
+            limit = first_batch_size if self.retriever is None else batch_size
+            if batch_nodes >= limit:
+                self._index_batch(batch, hashes, state, progress)
+                batch, batch_nodes = [], 0
+        if batch:
+            self._index_batch(batch, hashes, state, progress)
+
+        state.finish()
+        if self.retriever is None:
+            # Every file was empty or failed to load
+            self._reset()
+            raise ValueError(
+                f"No nodes ingested from {data_path}; "
+                f"{state.files_failed} files failed to load"
+            )
+        if state.files_done:
+            self._maybe_compact()
+            self._refresh_answer_cache()
+            if self.config.snapshot.save_on_ingest or self.config.data.checkpoint_every:
+                self.save()
+        logger.info(
+            f"Streaming ingestion complete: {state.files_done} files, "
+            f"{state.nodes_indexed} nodes in {state.elapsed:.1f}s, "
+            f"{state.files_failed} files failed"
+        )
+        if progress is not None:
+            progress(state)
+        return state
+
+    def _index_batch(
+        self,
+        batch: List[Tuple[str, List[BaseNode]]],
+        hashes: Dict[str, str],
+        state: IngestProgress,
+        progress: Optional[Callable[[IngestProgress], None]] = None,
+    ):
+        """Index the chunks of a batch of files and record the files."""
+        nodes = [node for _, file_nodes in batch for node in file_nodes]
+        for path, _ in batch:
+            existing = self.documents.get(path)
+            if existing is not None:
+                self._remove_nodes(existing.node_ids)
+
+        if nodes:
+            if self.retriever is None:
+                self._build_indexes(nodes)
+            else:
+                self._add_nodes(nodes)
+        self.dirty = True
+
+        for path, file_nodes in batch:
+            self.documents.put(
+                DocumentRecord(
+                    path=path,
+                    content_hash=hashes[path],
+                    node_ids=[int(node.node_id) for node in file_nodes],
+                )
+            )
+
+        state.files_done += len(batch)
+        state.nodes_indexed += len(nodes)
+        state.batches += 1
+        logger.info(
+            f"Indexed batch {state.batches}: "
+            f"{state.files_done + state.files_skipped}/{state.files_total} files, "
+            f"{state.nodes_indexed} nodes, {state.nodes_per_second:.1f} nodes/s"
+        )
+        if progress is not None:
+            progress(state)
+
+        every = self.config.data.checkpoint_every
+        if every and state.batches % every == 0 and self.retriever is not None:
+            self.save()
+
+    def _reset(self):
+        """Drop all indexed state before rebuilding the corpus."""
+        self.nodes = create_node_store(self.config.node_store)
+        self.retriever = None
+        self.documents = DocumentRegistry()
+
+    @synchronized
+    def upsert_document(self, file_path: str) -> Dict[str, Any]:
+        """Add or update a single document without rebuilding the indexes.
+
+        The file is skipped if its content hash is unchanged. Otherwise
+        the chunks from its previous version are removed and only its new
+        chunks are embedded and indexed.
+
+        Args:
+            file_path: Path to the document file
+
+        Returns:
+            Dictionary with the document path, status and node counts
+
+        Raises:
+            ValueError: If the file fails to parse or yields no documents;
+                its previous chunks are kept
+        """
+        path = normalize_path(file_path)
+        content_hash = file_hash(path)
+        existing = self.documents.get(path)
+        if existing is not None and existing.content_hash == content_hash:
+            logger.info(f"Document unchanged, skipping: {path}")
+            return {
+                "path": path,
+                "status": "unchanged",
+                "nodes_added": 0,
+                "nodes_removed": 0,
+            }
+
+        # Parse before touching any index, so a failed load changes nothing
+        documents = dict(self.document_loader.iter_files([path])).get(path)
+        if not documents:
+            raise ValueError(f"Could not load any documents from {path}")
+        nodes = self._build_nodes(documents)
+        nodes_removed = self._remove_nodes(existing.node_ids) if existing else 0
+
+        if self.retriever is None:
+            self._build_indexes(nodes)
+        else:
+            self._add_nodes(nodes)
+        self.dirty = True
+
+        self.documents.put(
+            DocumentRecord(
+                path=path,
+                content_hash=content_hash,
+                node_ids=[int(node.node_id) for node in nodes],
+            )
+        )
+        self._maybe_compact()
+        self._refresh_answer_cache()
+        logger.info(
+            f"Upserted document {path}: {len(nodes)} nodes added, "
+            f"{nodes_removed} removed"
         )
 
+        if self.config.snapshot.save_on_update:
+            self.save()
+
+        return {
+            "path": path,
+            "status": "updated" if existing else "added",
+            "nodes_added": len(nodes),
+            "nodes_removed": nodes_removed,
+        }
+
+    @synchronized
+    def delete_document(self, file_path: str) -> int:
+        """Remove a document's chunks from all indexes.
+
+        Args:
+            file_path: Path of a previously ingested document
+
+        Returns:
+            Number of nodes removed
+        """
+        record = self.documents.remove(file_path)
+        if record is None:
+            raise KeyError(f"Document not found: {file_path}")
+
+        nodes_removed = self._remove_nodes(record.node_ids)
+        self.dirty = True
+        self._maybe_compact()
+        self._refresh_answer_cache()
+        logger.info(f"Deleted document {record.path}: {nodes_removed} nodes removed")
+
+        if self.config.snapshot.save_on_update:
+            self.save()
+        return nodes_removed
+
+    def list_documents(self) -> List[DocumentRecord]:
+        """List all ingested documents.
+
+        Returns:
+            List of document records
+        """
+        return list(self.documents)
+
+    @synchronized
+    def compact(self) -> bool:
+        """Drop tombstoned chunks from the indexes regardless of threshold.
+
+        Returns:
+            True if anything was compacted
+        """
+        if self.retriever is None:
+            return False
+        vector_compacted = self.vector_store_manager.compact()
+        compacted = self.retriever.compact() or vector_compacted
+        if compacted:
+            self.nodes.compact()
+        return compacted
+
+    def _build_nodes(self, documents) -> List[BaseNode]:
+        """Split and clean documents into nodes."""
+        return self.text_splitter.split_documents(documents)
+
+    def _build_indexes(self, nodes: List[BaseNode]):
+        """Build the node store, vector index and fusion retriever from scratch."""
+        node_store = create_node_store(self.config.node_store)
+        node_ids = node_store.add(nodes)
+
+        # Create vector index
+        previous_vector_store = self.vector_store_manager.vector_store
+        self.vector_store_manager.create_index(node_ids, nodes)
+
+        try:
+            if self.shard_pool is not None:
+                bm25_index = ShardedBM25Index.create(self.shard_pool)
+            else:
+                bm25_index = BM25Index()
+            bm25_index.add(node_ids, [node_text(node) for node in nodes])
+        except Exception:
+            # Keep serving the indexes that were built before
+            self.vector_store_manager.vector_store = previous_vector_store
+            raise
+
         # Create fusion retriever
         self.retriever = FusionRetriever(
-            nodes=self.nodes,
-            vector_retriever=vector_retriever,
+            nodes=node_store,
+            vector_store=self.vector_store_manager.vector_store,
+            embed_model=self.vector_store_manager.query_embed_model,
             retriever_config=self.config.retriever,
+            bm25_index=bm25_index,
+            rewriter=self.query_rewriter,
         )
+        self.nodes = node_store
+        self.dirty = True
 
-        logger.info("Pipeline ready for queries")
+    def _add_nodes(self, nodes: List[BaseNode]):
+        """Store, embed and index new nodes."""
+        node_ids = self.nodes.add(nodes)
+        try:
+            self.vector_store_manager.add_nodes(node_ids, nodes)
+        except Exception:
+            # Nothing else references the new IDs yet
+            self.nodes.delete(node_ids)
+            raise
+        self.retriever.add_nodes(node_ids, nodes)
+
+    def _register_documents(self, nodes: List[BaseNode]):
+        """Rebuild the document registry from the source files of nodes."""
+        node_ids_by_path: Dict[str, List[int]] = {}
+        for node in nodes:
+            file_path = node.metadata.get("file_path")
+            if file_path:
+                node_ids_by_path.setdefault(normalize_path(file_path), []).append(
+                    int(node.node_id)
+                )
+
+        self.documents.clear()
+        for path, node_ids in node_ids_by_path.items():
+            self.documents.put(
+                DocumentRecord(path=path, content_hash=file_hash(path), node_ids=node_ids)
+            )
+
+    def _remove_nodes(self, node_ids: List[int]) -> int:
+        """Tombstone nodes in every index and drop them from the node store."""
+        if self.retriever is None or not node_ids:
+            return 0
+        self.vector_store_manager.delete_nodes(node_ids)
+        self.nodes.delete(node_ids)
+        return self.retriever.delete_nodes(node_ids)
+
+    def _maybe_compact(self):
+        """Compact the indexes once enough chunks are tombstoned."""
+        threshold = self.config.retriever.compaction_threshold
+        vector_compacted = self.vector_store_manager.compact(threshold)
+        if self.retriever.compact(threshold) or vector_compacted:
+            self.nodes.compact()
+            logger.info("Compacted indexes after reaching tombstone threshold")
+
+    def _refresh_answer_cache(self):
+        """Drop cached answers that were produced for a different corpus."""
+        if self.answer_cache is not None:
+            self.answer_cache.set_corpus_version(self._corpus_version())
+
+    def _corpus_version(self) -> str:
+        """Fingerprint of the indexed documents and answer-relevant settings."""
+        digest = hashlib.sha256()
+        settings = {
+            "embedding": [self.config.embedding.provider, self.config.embedding.model],
+            "llm": asdict(self.config.llm),
+            "retriever": asdict(self.config.retriever),
+            "data": asdict(self.config.data),
+            "context": asdict(self.config.context),
+            "nodes_count": len(self.nodes),
+        }
+        digest.update(json.dumps(settings, sort_keys=True).encode("utf-8"))
+        for record in sorted(self.documents, key=lambda record: record.path):
+            digest.update(f"{record.path}\0{record.content_hash}\0".encode("utf-8"))
+        return digest.hexdigest()
+
+    @synchronized
+    def save(self, path: Optional[str] = None) -> Path:
+        """Save the current indexes as a snapshot.
+
+        Args:
+            path: Directory to write the snapshot to. Defaults to a new
+                snapshot under the configured snapshot directory, which
+                also becomes the latest one.
+
+        Returns:
+            Path of the written snapshot
+        """
+        if self.retriever is None:
+            raise ValueError("Pipeline not initialized. Call ingest() first.")
+
+        if path is not None:
+            snapshot_dir = Path(path)
+            snapshot_dir.mkdir(parents=True, exist_ok=True)
+            self._write_snapshot(snapshot_dir)
+            self.snapshot_manager.write_manifest(snapshot_dir, self._manifest())
+            logger.info(f"Saved snapshot to {snapshot_dir}")
+            return snapshot_dir
+
+        staging_dir = self.snapshot_manager.begin()
+        try:
+            self._write_snapshot(staging_dir)
+            snapshot_dir = self.snapshot_manager.commit(staging_dir, self._manifest())
+        except Exception:
+            self.snapshot_manager.abort(staging_dir)
+            raise
+        self.dirty = False
+        return snapshot_dir
+
+    @synchronized
+    def load(self, path: Optional[str] = None) -> bool:
+        """Load indexes from a snapshot without re-embedding anything.
+
+        Args:
+            path: Snapshot directory. Defaults to the latest snapshot under
+                the configured snapshot directory.
+
+        Returns:
+            True if a snapshot was loaded, False if none was found
+        """
+        snapshot_dir = Path(path) if path is not None else self.snapshot_manager.latest()
+        if snapshot_dir is None:
+            logger.info("No snapshot found to load")
+            return False
+
+        manifest = self.snapshot_manager.read_manifest(snapshot_dir)
+        embedding = manifest.get("embedding", {})
+        if (
+            embedding.get("provider", "openai") != self.config.embedding.provider
+            or embedding.get("model") != self.config.embedding.model
+            or embedding.get("dimensions") != self.config.embedding.dimensions
+        ):
+            raise ValueError(
+                f"Snapshot {snapshot_dir} was built with embedding {embedding}, "
+                f"which does not match the configured embedding model"
+            )
+        num_shards = manifest.get("sharding", {}).get("num_shards", 1)
+        if num_shards != self.config.sharding.num_shards:
+            raise ValueError(
+                f"Snapshot {snapshot_dir} has {num_shards} shards but "
+                f"{self.config.sharding.num_shards} are configured; re-ingest "
+                f"to change the number of shards"
+            )
+        backend = manifest.get("node_store", {}).get("backend", "memory")
+        if backend != self.config.node_store.backend:
+            raise ValueError(
+                f"Snapshot {snapshot_dir} has a {backend} node store but the "
+                f"{self.config.node_store.backend} backend is configured; re-ingest "
+                f"to change the node store backend"
+            )
+
+        mmap = self.config.snapshot.mmap
+        logger.info(f"Loading snapshot from {snapshot_dir}")
+        previous_vector_store = self.vector_store_manager.vector_store
+        self.vector_store_manager.load_vector_store(
+            str(snapshot_dir / VECTOR_DIRNAME), mmap=mmap
+        )
+        try:
+            nodes = load_node_store(
+                snapshot_dir / NODES_DIRNAME, self.config.node_store, mmap=mmap
+            )
+            retriever = FusionRetriever.from_persist_dir(
+                str(snapshot_dir / BM25_DIRNAME),
+                nodes=nodes,
+                vector_store=self.vector_store_manager.vector_store,
+                embed_model=self.vector_store_manager.query_embed_model,
+                retriever_config=self.config.retriever,
+                rewriter=self.query_rewriter,
+                shard_pool=self.shard_pool,
+                mmap=mmap,
+            )
+            documents = DocumentRegistry.load(snapshot_dir / DOCUMENTS_FILENAME)
+        except Exception:
+            # Keep serving the indexes that were loaded before
+            self.vector_store_manager.vector_store = previous_vector_store
+            raise
+        self.retriever = retriever
+        self.nodes = retriever.nodes
+        self.documents = documents
+        self.dirty = False
+        self._refresh_answer_cache()
+        logger.info(f"Snapshot loaded: {len(self.nodes)} nodes")
+        return True
+
+    def _write_snapshot(self, snapshot_dir: Path):
+        """Write all index components into a snapshot directory."""
+        self.vector_store_manager.persist(str(snapshot_dir / VECTOR_DIRNAME))
+        self.retriever.persist(str(snapshot_dir / BM25_DIRNAME))
+        self.nodes.persist(snapshot_dir / NODES_DIRNAME)
+        self.documents.persist(snapshot_dir / DOCUMENTS_FILENAME)
+
+    def _manifest(self) -> dict:
+        """Describe the indexed corpus for the snapshot manifest."""
+        return {
+            "nodes_count": len(self.nodes),
+            "documents_count": len(self.documents),
+            "embedding": {
+                "provider": self.config.embedding.provider,
+                "model": self.config.embedding.model,
+                "dimensions": self.config.embedding.dimensions,
+                "index_type": self.config.embedding.index_type,
+            },
+            "data": {
+                "chunk_size": self.config.data.chunk_size,
+                "chunk_overlap": self.config.data.chunk_overlap,
+            },
+            "sharding": {"num_shards": self.config.sharding.num_shards},
+            "node_store": {"backend": self.config.node_store.backend},
+        }
+
+    def memory_bytes(self) -> int:
+        """Approximate memory held by the indexes and nodes of this pipeline.
+
+        Counts the FAISS and BM25 indexes and the node store. Memory-mapped
+        snapshot files and node databases are not counted, as they live in
+        the page cache shared by every process serving the snapshot.
+
+        Returns:
+            Estimated size in bytes; 0 before anything is ingested
+        """
+        if self.retriever is None:
+            return 0
+        return (
+            self.vector_store_manager.vector_store.memory_bytes
+            + self.retriever.bm25_index.memory_bytes
+            + self.nodes.memory_bytes
+        )
 
-    def query(self, query: str) -> dict:
+    def warm_query_embeddings(self, queries: List[str]) -> int:
+        """Pre-compute embeddings for known frequent queries.
+
+        Args:
+            queries: Query strings
+
+        Returns:
+            Number of queries that were not cached yet
+        """
+        return self.vector_store_manager.warm_query_cache(
+            [query for query in queries if query.strip()]
+        )
+
+    def fusion_params(self, **overrides) -> FusionParams:
+        """Configured fusion settings with some of them replaced.
+
+        Args:
+            **overrides: `FusionParams` fields to change; None values keep
+                the configured setting
+
+        Returns:
+            Validated fusion settings for a single query
+        """
+        return FusionParams.from_config(self.config.retriever).override(**overrides)
+
+    def _answer_cache_for(
+        self, params: Optional[FusionParams]
+    ) -> Optional[AnswerCache]:
+        """Answer cache to use, or None if fusion settings are overridden.
+
+        Cached answers were retrieved with the configured settings only.
+        """
+        if params is None or params == FusionParams.from_config(self.config.retriever):
+            return self.answer_cache
+        return None
+
+    def query(self, query: str, params: Optional[FusionParams] = None) -> dict:
         """Query the RAG pipeline.
 
         Args:
             query: Query string
+            params: Fusion settings overriding the configured ones
 
         Returns:
             Dictionary containing answer, context, and query
@@ -106,14 +691,366 @@ class FusionRAGPipeline:
 
         logger.info(f"Processing query: {query}")
 
-        # Retrieve relevant nodes
-        retrieved_nodes = self.retriever.retrieve(query)
+        # Serve repeated and near-duplicate questions from the answer cache
+        query_embedding = None
+        cache = self._answer_cache_for(params)
+        if cache is not None:
+            cached = cache.get(query)
+            if cached is None:
+                query_embedding = self.vector_store_manager.embed_query(query)
+                cached = cache.get_similar(query, query_embedding)
+            if cached is not None:
+                logger.info(f"Query answered from {cached['cached']} cache")
+                return cached
 
-        # Extract context from retrieved nodes
-        context = "\n\n".join([node.text for node in retrieved_nodes])
+        # Retrieve relevant nodes
+        retrieved_nodes = self.retriever.retrieve(query, query_embedding, params)
+        context = self.context_packer.pack(retrieved_nodes)
 
         # Generate answer using LLM
-        prompt = f"""Based on the following context, please answer the question.
+        answer = self.llm_generator.generate(self._build_prompt(query, context))
+
+        logger.info("Query processed successfully")
+        result = self._format_result(query, answer, context)
+        if cache is not None:
+            cache.put(query, query_embedding, result)
+        return result
+
+    async def aquery(self, query: str, params: Optional[FusionParams] = None) -> dict:
+        """Query the RAG pipeline without blocking the event loop.
+
+        Retrieval and generation use the async paths of the retriever and
+        the LLM, and answer cache lookups and context packing run in worker
+        threads, so many queries can be in flight on a single worker.
+
+        Args:
+            query: Query string
+            params: Fusion settings overriding the configured ones
+
+        Returns:
+            Dictionary containing answer, context, and query
+        """
+        if self.retriever is None:
+            raise ValueError("Pipeline not initialized. Call ingest() first.")
+
+        logger.info(f"Processing query: {query}")
+
+        query_embedding = None
+        cache = self._answer_cache_for(params)
+        if cache is not None:
+            cached, query_embedding = await self._alookup_answer(cache, query)
+            if cached is not None:
+                logger.info(f"Query answered from {cached['cached']} cache")
+                return cached
+
+        retrieved_nodes = await self.retriever.aretrieve(
+            query, query_embedding, params
+        )
+        context = await asyncio.to_thread(self.context_packer.pack, retrieved_nodes)
+        answer = await self.llm_generator.agenerate(
+            self._build_prompt(query, context)
+        )
+
+        logger.info("Query processed successfully")
+        result = self._format_result(query, answer, context)
+        if cache is not None:
+            await asyncio.to_thread(cache.put, query, query_embedding, result)
+        return result
+
+    async def _alookup_answer(
+        self, cache: AnswerCache, query: str
+    ) -> Tuple[Optional[Dict[str, Any]], Optional[np.ndarray]]:
+        """Look up a cached answer without blocking the event loop.
+
+        The cache may be backed by SQLite, so its lookups run in a worker
+        thread; the query is embedded only if there is no exact match.
+
+        Args:
+            cache: Answer cache to search
+            query: Query string
+
+        Returns:
+            The cached result or None, and the query embedding if computed
+        """
+        query_embedding = None
+        cached = await asyncio.to_thread(cache.get, query)
+        if cached is None:
+            query_embedding = await self.vector_store_manager.aembed_query(query)
+            cached = await asyncio.to_thread(cache.get_similar, query, query_embedding)
+        return cached, query_embedding
+
+    def query_batch(
+        self,
+        queries: List[str],
+        max_concurrency: Optional[int] = None,
+        params: Optional[FusionParams] = None,
+    ) -> List[Dict[str, Any]]:
+        """Answer many queries at once.
+
+        See `aquery_batch()`.
+
+        Args:
+            queries: Query strings
+            max_concurrency: Maximum concurrent LLM calls; defaults to
+                `llm.max_concurrency`
+            params: Fusion settings overriding the configured ones
+
+        Returns:
+            One result dictionary per query, in input order
+        """
+        return asyncio_run(self.aquery_batch(queries, max_concurrency, params))
+
+    async def aquery_batch(
+        self,
+        queries: List[str],
+        max_concurrency: Optional[int] = None,
+        params: Optional[FusionParams] = None,
+    ) -> List[Dict[str, Any]]:
+        """Answer many queries at once.
+
+        All queries are embedded with batched embedding calls and retrieved
+        with one vector search and one BM25 matrix product; answers are then
+        generated concurrently, with at most `max_concurrency` LLM calls in
+        flight. Queries found in the answer cache skip retrieval and
+        generation. If batched embedding or retrieval fails, that step is
+        retried one query at a time, so a query that fails gets an `error`
+        entry instead of an answer without failing the rest of the batch.
+
+        Args:
+            queries: Query strings
+            max_concurrency: Maximum concurrent LLM calls; defaults to
+                `llm.max_concurrency`
+            params: Fusion settings overriding the configured ones
+
+        Returns:
+            One result dictionary per query, in input order
+        """
+        if self.retriever is None:
+            raise ValueError("Pipeline not initialized. Call ingest() first.")
+
+        logger.info(f"Processing batch of {len(queries)} queries")
+        results: List[Optional[Dict[str, Any]]] = [None] * len(queries)
+        pending = [i for i, query in enumerate(queries) if query.strip()]
+        for i in set(range(len(queries))) - set(pending):
+            results[i] = {"query": queries[i], "error": "Query is empty"}
+
+        cache = self._answer_cache_for(params)
+        if cache is not None:
+            cached = await asyncio.to_thread(
+                lambda: [cache.get(queries[i]) for i in pending]
+            )
+            for i, result in zip(pending, cached):
+                results[i] = result
+            pending = [i for i in pending if results[i] is None]
+
+        def fail(i: int, error: Exception):
+            logger.warning(f"Batch query {i} failed: {error}")
+            results[i] = {"query": queries[i], "error": str(error)}
+
+        embeddings: Dict[int, np.ndarray] = {}
+        if pending:
+            try:
+                vectors = await self.vector_store_manager.aembed_queries(
+                    [queries[i] for i in pending]
+                )
+                embeddings = dict(zip(pending, vectors))
+            except Exception as e:
+                # Find the failing queries by embedding them one at a time
+                logger.warning(f"Batched query embedding failed, retrying singly: {e}")
+
+                async def embed(i: int) -> None:
+                    try:
+                        embeddings[i] = await self.vector_store_manager.aembed_query(
+                            queries[i]
+                        )
+                    except Exception as e:
+                        fail(i, e)
+
+                await asyncio.gather(*(embed(i) for i in pending))
+                pending = [i for i in pending if i in embeddings]
+            if cache is not None:
+                similar = await asyncio.to_thread(
+                    lambda: [
+                        cache.get_similar(queries[i], embeddings[i]) for i in pending
+                    ]
+                )
+                for i, result in zip(pending, similar):
+                    results[i] = result
+                pending = [i for i in pending if results[i] is None]
+
+        retrieved = []
+        if pending:
+            try:
+                retrieved = await asyncio.to_thread(
+                    self.retriever.retrieve_batch,
+                    [queries[i] for i in pending],
+                    np.stack([embeddings[i] for i in pending]),
+                    params,
+                )
+            except Exception as e:
+                logger.warning(f"Batched retrieval failed, retrying singly: {e}")
+                retrieved_by_query = {}
+                for i in pending:
+                    try:
+                        retrieved_by_query[i] = await asyncio.to_thread(
+                            self.retriever.retrieve, queries[i], embeddings[i], params
+                        )
+                    except Exception as e:
+                        fail(i, e)
+                pending = list(retrieved_by_query)
+                retrieved = list(retrieved_by_query.values())
+
+        semaphore = asyncio.Semaphore(max_concurrency or self.config.llm.max_concurrency)
+
+        async def answer(i: int, retrieved_nodes) -> None:
+            context = await asyncio.to_thread(self.context_packer.pack, retrieved_nodes)
+            async with semaphore:
+                try:
+                    answer = await self.llm_generator.agenerate(
+                        self._build_prompt(queries[i], context)
+                    )
+                except Exception as e:
+                    fail(i, e)
+                    return
+            results[i] = self._format_result(queries[i], answer, context)
+            if cache is not None:
+                await asyncio.to_thread(
+                    cache.put, queries[i], embeddings[i], results[i]
+                )
+
+        await asyncio.gather(
+            *(answer(i, nodes) for i, nodes in zip(pending, retrieved))
+        )
+        logger.info("Batch processed successfully")
+        return results
+
+    def query_stream(
+        self, query: str, params: Optional[FusionParams] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """Query the RAG pipeline, streaming the answer as it is generated.
+
+        Yields a `context` event with the retrieved context and scores as
+        soon as retrieval finishes, then one `token` event per answer
+        delta, and finally a `done` event with the full answer. A cached
+        answer is replayed as a single `token` event.
+
+        Args:
+            query: Query string
+            params: Fusion settings overriding the configured ones
+
+        Yields:
+            Event dictionaries keyed by `event`
+        """
+        if self.retriever is None:
+            raise ValueError("Pipeline not initialized. Call ingest() first.")
+
+        logger.info(f"Processing streaming query: {query}")
+        query_embedding = None
+        cache = self._answer_cache_for(params)
+        if cache is not None:
+            cached = cache.get(query)
+            if cached is None:
+                query_embedding = self.vector_store_manager.embed_query(query)
+                cached = cache.get_similar(query, query_embedding)
+            if cached is not None:
+                yield from self._cached_events(cached)
+                return
+
+        retrieved_nodes = self.retriever.retrieve(query, query_embedding, params)
+        context = self.context_packer.pack(retrieved_nodes)
+        yield self._context_event(query, context)
+
+        tokens = []
+        prompt = self._build_prompt(query, context)
+        for delta in self.llm_generator.stream(prompt):
+            tokens.append(delta)
+            yield {"event": "token", "delta": delta}
+
+        logger.info("Streaming query processed successfully")
+        answer = "".join(tokens)
+        if cache is not None:
+            cache.put(
+                query,
+                query_embedding,
+                self._format_result(query, answer, context),
+            )
+        yield {"event": "done", "answer": answer}
+
+    async def aquery_stream(
+        self, query: str, params: Optional[FusionParams] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Async variant of `query_stream()` used by the streaming API.
+
+        Args:
+            query: Query string
+            params: Fusion settings overriding the configured ones
+
+        Yields:
+            Event dictionaries keyed by `event`
+        """
+        if self.retriever is None:
+            raise ValueError("Pipeline not initialized. Call ingest() first.")
+
+        logger.info(f"Processing streaming query: {query}")
+        query_embedding = None
+        cache = self._answer_cache_for(params)
+        if cache is not None:
+            cached, query_embedding = await self._alookup_answer(cache, query)
+            if cached is not None:
+                for event in self._cached_events(cached):
+                    yield event
+                return
+
+        retrieved_nodes = await self.retriever.aretrieve(
+            query, query_embedding, params
+        )
+        context = await asyncio.to_thread(self.context_packer.pack, retrieved_nodes)
+        yield self._context_event(query, context)
+
+        tokens = []
+        prompt = self._build_prompt(query, context)
+        async for delta in self.llm_generator.astream(prompt):
+            tokens.append(delta)
+            yield {"event": "token", "delta": delta}
+
+        logger.info("Streaming query processed successfully")
+        answer = "".join(tokens)
+        if cache is not None:
+            await asyncio.to_thread(
+                cache.put,
+                query,
+                query_embedding,
+                self._format_result(query, answer, context),
+            )
+        yield {"event": "done", "answer": answer}
+
+    @classmethod
+    def _context_event(cls, query: str, context) -> Dict[str, Any]:
+        """First streaming event: the packed context before any answer text."""
+        result = cls._format_result(query, "", context)
+        del result["answer"]
+        return {"event": "context", **result}
+
+    @staticmethod
+    def _cached_events(cached: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Streaming events that replay a cached answer."""
+        answer = cached["answer"]
+        context = {k: v for k, v in cached.items() if k != "answer"}
+        logger.info(f"Streaming query answered from {cached['cached']} cache")
+        return [
+            {"event": "context", **context},
+            {"event": "token", "delta": answer},
+            {"event": "done", "answer": answer},
+        ]
+
+    @staticmethod
+    def _build_prompt(query: str, context_nodes) -> str:
+        """Build the answer prompt from the packed context."""
+        with stage_timer("build_prompt"):
+            # Join the context passages
+            context = SEPARATOR.join([node.text for node in context_nodes])
+
+            return f"""Based on the following context, please answer the question.
         
 Context:
 {context}
@@ -122,15 +1059,12 @@ Question: {query}
 
 Answer:"""
 
-        answer = self.llm_generator.generate(prompt)
-
-        result = {
+    @staticmethod
+    def _format_result(query: str, answer: str, retrieved_nodes) -> dict:
+        """Assemble the query result returned to callers."""
+        return {
             "query": query,
             "answer": answer,
             "context": [node.text for node in retrieved_nodes],
-            "scores": [node.score for node in retrieved_nodes] if hasattr(retrieved_nodes[0], 'score') else None,
+            "scores": [node.score for node in retrieved_nodes] if retrieved_nodes and hasattr(retrieved_nodes[0], 'score') else None,
         }
-
-        logger.info("Query processed successfully")
-        return result
-
@@ -0,0 +1,53 @@
+"""Progress tracking for streaming ingestion"""
+
+from __future__ import annotations
+
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Optional
+
+
+@dataclass
+class IngestProgress:
+    """Counters of a streaming ingestion run."""
+
+    files_total: int
+    files_skipped: int = 0
+    files_done: int = 0
+    nodes_indexed: int = 0
+    batches: int = 0
+    started_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+    @property
+    def files_failed(self) -> int:
+        """Files that could not be loaded; only known once the run finished."""
+        if not self.finished:
+            return 0
+        return self.files_total - self.files_skipped - self.files_done
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished_at or time.time()) - self.started_at
+
+    @property
+    def nodes_per_second(self) -> float:
+        return self.nodes_indexed / self.elapsed if self.elapsed > 0 else 0.0
+
+    def finish(self):
+        """Mark the run as finished."""
+        self.finished_at = time.time()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Counters plus derived rates, for logging and the API."""
+        return {
+            **asdict(self),
+            "finished": self.finished,
+            "files_failed": self.files_failed,
+            "elapsed_seconds": self.elapsed,
+            "nodes_per_second": self.nodes_per_second,
+        }
@@ -0,0 +1,261 @@
+"""Registry of named collections served from one process"""
+
+from __future__ import annotations
+
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import replace
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from ..utils.config import FusionRAGConfig, _resolve_path
+from ..utils.logging import get_logger
+from .pipeline import FusionRAGPipeline
+from .snapshot import LATEST_FILENAME
+
+logger = get_logger(__name__)
+
+# Collection names double as directory names
+COLLECTION_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_-]{0,63}$")
+
+
+class CollectionRegistry:
+    """Named collections, each served by its own `FusionRAGPipeline`.
+
+    Every collection has its own indexes, snapshots and answer cache;
+    snapshots of a collection live in `collections.directory/<name>`, except
+    for the default collection, which keeps using `snapshot.directory`.
+    Collections are loaded from their latest snapshot the first time they
+    are requested. When the estimated memory of all loaded collections
+    exceeds `collections.memory_budget_mb`, or more than
+    `collections.max_loaded` are loaded, the least recently used ones are
+    evicted, after saving changes that are not in a snapshot yet. Requests
+    already holding an evicted pipeline finish normally.
+    """
+
+    def __init__(self, config: FusionRAGConfig):
+        """Initialize collection registry.
+
+        Args:
+            config: Configuration shared by all collections
+        """
+        self.config = config
+        self.default = config.collections.default
+        self._pipelines: OrderedDict[str, FusionRAGPipeline] = OrderedDict()
+        self._loading: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def config_for(self, name: str) -> FusionRAGConfig:
+        """Configuration of a collection.
+
+        Args:
+            name: Collection name
+
+        Returns:
+            The shared configuration with collection-specific paths
+        """
+        if name == self.default:
+            return self.config
+        directory = self.collection_dir(name)
+        return replace(
+            self.config,
+            snapshot=replace(self.config.snapshot, directory=str(directory)),
+            answer_cache=replace(
+                self.config.answer_cache, path=str(directory / "answers.sqlite")
+            ),
+        )
+
+    def collection_dir(self, name: str) -> Path:
+        """Snapshot directory of a collection."""
+        if name == self.default:
+            return _resolve_path(self.config.snapshot.directory)
+        return _resolve_path(self.config.collections.directory) / name
+
+    def get(
+        self, name: Optional[str] = None, create: bool = False
+    ) -> FusionRAGPipeline:
+        """Pipeline of a collection, loading it on first use.
+
+        Args:
+            name: Collection name; the default collection if None
+            create: Return an empty pipeline for a collection that has no
+                snapshot yet instead of raising, e.g. to ingest into it; the
+                default collection is always created
+
+        Returns:
+            Pipeline serving the collection
+
+        Raises:
+            ValueError: If the name is not a valid collection name
+            KeyError: If the collection has no snapshot and `create` is False
+        """
+        name = self.validate(name)
+        pipeline = self.get_loaded(name)
+        if pipeline is not None:
+            return pipeline
+
+        # One thread loads a collection while others asking for it wait
+        with self._lock:
+            loading = self._loading.setdefault(name, threading.Lock())
+        with loading:
+            pipeline = self.get_loaded(name)
+            if pipeline is not None:
+                return pipeline
+            try:
+                pipeline = FusionRAGPipeline(self.config_for(name))
+                # The default collection always exists, even when empty
+                loaded = pipeline.load()
+                if not loaded and not create and name != self.default:
+                    raise KeyError(f"Collection not found: {name}")
+                with self._lock:
+                    self._pipelines[name] = pipeline
+            finally:
+                with self._lock:
+                    self._loading.pop(name, None)
+        logger.info(f"Opened collection {name} ({len(pipeline.nodes)} nodes)")
+        self.evict(keep=name)
+        return pipeline
+
+    def get_loaded(self, name: Optional[str] = None) -> Optional[FusionRAGPipeline]:
+        """Pipeline of a collection if it is in memory, without loading it.
+
+        Args:
+            name: Collection name; the default collection if None
+
+        Returns:
+            Pipeline serving the collection, or None if it is not loaded
+        """
+        name = self.validate(name)
+        with self._lock:
+            pipeline = self._pipelines.get(name)
+            if pipeline is not None:
+                self._pipelines.move_to_end(name)
+            return pipeline
+
+    def validate(self, name: Optional[str]) -> str:
+        """Collection name to use for a request.
+
+        Args:
+            name: Requested collection name, or None for the default one
+
+        Returns:
+            Validated collection name
+        """
+        if name is None:
+            return self.default
+        if not COLLECTION_NAME.match(name):
+            raise ValueError(
+                f"Invalid collection name {name!r}: use up to 64 letters, "
+                f"digits, '-' and '_'"
+            )
+        return name
+
+    def evict(self, keep: Optional[str] = None) -> List[str]:
+        """Evict least recently used collections beyond the memory budget.
+
+        Call after a collection grew, e.g. after ingestion.
+
+        Args:
+            keep: Collection never evicted, usually the one just used
+
+        Returns:
+            Names of the evicted collections
+        """
+        budget = self.config.collections.memory_budget_mb * 2**20
+        max_loaded = self.config.collections.max_loaded
+        if not budget and not max_loaded:
+            return []
+
+        with self._lock:
+            candidates = list(self._pipelines.items())
+        sizes = {name: pipeline.memory_bytes() for name, pipeline in candidates}
+        total = sum(sizes.values())
+        loaded = len(candidates)
+        evicted = []
+        # Least recently used first
+        for name, pipeline in candidates:
+            over_budget = budget and total > budget
+            if not over_budget and not (max_loaded and loaded > max_loaded):
+                break
+            if name == keep:
+                continue
+            # Hold the pipeline's lock so no update slips in after the save
+            with pipeline._lock:
+                if pipeline.dirty and pipeline.retriever is not None:
+                    try:
+                        pipeline.save()
+                    except Exception as e:
+                        logger.warning(f"Keeping collection {name}, saving failed: {e}")
+                        continue
+                with self._lock:
+                    if self._pipelines.get(name) is pipeline:
+                        del self._pipelines[name]
+            total -= sizes[name]
+            loaded -= 1
+            evicted.append(name)
+            logger.info(f"Evicted collection {name} ({sizes[name] / 2**20:.1f} MB)")
+        return evicted
+
+    def save_dirty(self) -> List[str]:
+        """Save every loaded collection with changes not in a snapshot yet.
+
+        Call before shutting down, since document updates are only saved
+        with `snapshot.save_on_update`.
+
+        Returns:
+            Names of the saved collections
+        """
+        with self._lock:
+            candidates = list(self._pipelines.items())
+        saved = []
+        for name, pipeline in candidates:
+            with pipeline._lock:
+                if not pipeline.dirty or pipeline.retriever is None:
+                    continue
+                try:
+                    pipeline.save()
+                except Exception as e:
+                    logger.warning(f"Saving collection {name} failed: {e}")
+                    continue
+            saved.append(name)
+        return saved
+
+    def names(self) -> List[str]:
+        """Names of all collections, loaded or with a snapshot on disk."""
+        names = {self.default}
+        root = _resolve_path(self.config.collections.directory)
+        if root.is_dir():
+            names.update(
+                path.name
+                for path in root.iterdir()
+                if COLLECTION_NAME.match(path.name)
+                and (path / LATEST_FILENAME).exists()
+            )
+        with self._lock:
+            names.update(self._pipelines)
+        return sorted(names)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Load state and size of every collection.
+
+        Returns:
+            One dictionary per collection with its name, whether it is
+            loaded, its node count and its estimated memory in MB
+        """
+        with self._lock:
+            loaded = dict(self._pipelines)
+        stats = []
+        for name in self.names():
+            pipeline = loaded.get(name)
+            stats.append(
+                {
+                    "name": name,
+                    "loaded": pipeline is not None,
+                    "nodes_count": len(pipeline.nodes) if pipeline else None,
+                    "memory_mb": (
+                        pipeline.memory_bytes() / 2**20 if pipeline else None
+                    ),
+                }
+            )
+        return stats
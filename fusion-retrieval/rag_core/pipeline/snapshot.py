@@ -0,0 +1,155 @@
+"""On-disk snapshots of pipeline indexes"""
+
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from ..utils.logging import get_logger
+
+logger = get_logger(__name__)
+
+SNAPSHOT_FORMAT_VERSION = 4
+MANIFEST_FILENAME = "manifest.json"
+LATEST_FILENAME = "LATEST"
+VECTOR_DIRNAME = "vector"
+BM25_DIRNAME = "bm25"
+NODES_DIRNAME = "nodes"
+
+
+class SnapshotManager:
+    """Manages versioned index snapshots under a single root directory.
+
+    Each snapshot is a directory holding the FAISS index, the BM25
+    statistics, the node store and a `manifest.json`, all in a
+    memory-mappable layout. Snapshots are
+    written to a temporary directory first and renamed into place, and the
+    `LATEST` pointer is only updated once the rename succeeded, so a crash
+    mid-save never leaves a half-written snapshot behind as the latest one.
+    """
+
+    def __init__(self, root_dir: str | os.PathLike[str], keep_last: int = 3):
+        """Initialize snapshot manager.
+
+        Args:
+            root_dir: Directory holding all snapshots
+            keep_last: Number of most recent snapshots to keep (0 keeps all)
+        """
+        self.root_dir = Path(root_dir)
+        self.keep_last = keep_last
+
+    def begin(self) -> Path:
+        """Create an empty staging directory for a new snapshot.
+
+        Returns:
+            Path of the staging directory
+        """
+        staging_dir = self.root_dir / f".staging-{uuid.uuid4().hex}"
+        staging_dir.mkdir(parents=True)
+        return staging_dir
+
+    def commit(self, staging_dir: Path, manifest: Dict[str, Any]) -> Path:
+        """Finalize a staged snapshot and mark it as the latest one.
+
+        Args:
+            staging_dir: Directory returned by `begin()`
+            manifest: Snapshot metadata to store alongside the indexes
+
+        Returns:
+            Path of the committed snapshot
+        """
+        snapshot_id = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+        self.write_manifest(staging_dir, {"snapshot_id": snapshot_id, **manifest})
+
+        snapshot_dir = self.root_dir / snapshot_id
+        staging_dir.rename(snapshot_dir)
+        self._write_latest(snapshot_id)
+        self._prune()
+        logger.info(f"Committed snapshot {snapshot_id}")
+        return snapshot_dir
+
+    def abort(self, staging_dir: Path):
+        """Discard a staged snapshot.
+
+        Args:
+            staging_dir: Directory returned by `begin()`
+        """
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+    @staticmethod
+    def write_manifest(snapshot_dir: str | os.PathLike[str], manifest: Dict[str, Any]):
+        """Write a snapshot manifest.
+
+        Args:
+            snapshot_dir: Snapshot directory
+            manifest: Snapshot metadata
+        """
+        manifest = {
+            "format_version": SNAPSHOT_FORMAT_VERSION,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            **manifest,
+        }
+        with (Path(snapshot_dir) / MANIFEST_FILENAME).open("w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+
+    def latest(self) -> Optional[Path]:
+        """Get the most recently committed snapshot.
+
+        Returns:
+            Path of the latest snapshot, or None if there is none
+        """
+        latest_file = self.root_dir / LATEST_FILENAME
+        if not latest_file.exists():
+            return None
+        snapshot_dir = self.root_dir / latest_file.read_text(encoding="utf-8").strip()
+        if not (snapshot_dir / MANIFEST_FILENAME).exists():
+            logger.warning(f"LATEST points to a missing snapshot: {snapshot_dir}")
+            return None
+        return snapshot_dir
+
+    @staticmethod
+    def read_manifest(snapshot_dir: str | os.PathLike[str]) -> Dict[str, Any]:
+        """Read and validate a snapshot manifest.
+
+        Args:
+            snapshot_dir: Snapshot directory
+
+        Returns:
+            Manifest dictionary
+        """
+        manifest_path = Path(snapshot_dir) / MANIFEST_FILENAME
+        if not manifest_path.exists():
+            raise FileNotFoundError(f"Snapshot manifest not found: {manifest_path}")
+        with manifest_path.open("r", encoding="utf-8") as f:
+            manifest: Dict[str, Any] = json.load(f)
+        if manifest.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+            raise ValueError(
+                f"Unsupported snapshot format version: {manifest.get('format_version')}"
+            )
+        return manifest
+
+    def _write_latest(self, snapshot_id: str):
+        """Atomically point `LATEST` at a snapshot."""
+        tmp_file = self.root_dir / f".{LATEST_FILENAME}.tmp"
+        tmp_file.write_text(snapshot_id, encoding="utf-8")
+        os.replace(tmp_file, self.root_dir / LATEST_FILENAME)
+
+    def _prune(self):
+        """Delete snapshots beyond `keep_last`, oldest first."""
+        if self.keep_last <= 0:
+            return
+        snapshots = sorted(
+            p
+            for p in self.root_dir.iterdir()
+            if p.is_dir()
+            and not p.name.startswith(".")
+            and (p / MANIFEST_FILENAME).exists()
+        )
+        for old_dir in snapshots[: -self.keep_last]:
+            logger.info(f"Removing old snapshot {old_dir.name}")
+            shutil.rmtree(old_dir, ignore_errors=True)
@@ -1,12 +1,16 @@
 """Retriever modules for vector and BM25 retrieval"""
 
 from .loaders import DocumentLoader
+from .node_store import BaseNodeStore, NodeStore, SQLiteNodeStore
 from .splitter import TextSplitter
 from .vectorstore import VectorStoreManager
 from .retriever import FusionRetriever
 
 __all__ = [
+    "BaseNodeStore",
     "DocumentLoader",
+    "NodeStore",
+    "SQLiteNodeStore",
     "TextSplitter",
     "VectorStoreManager",
     "FusionRetriever",
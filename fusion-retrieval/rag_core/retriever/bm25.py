@@ -0,0 +1,625 @@
+"""Sparse-matrix BM25 keyword index"""
+
+from __future__ import annotations
+
+import json
+import os
+import re
+import threading
+from dataclasses import dataclass
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+import Stemmer
+from bm25s.stopwords import STOPWORDS_EN
+from llama_index.core.schema import BaseNode, MetadataMode
+
+from ..utils.concurrency import synchronized
+from ..utils.logging import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_TOKEN_PATTERN = r"(?u)\b\w\w+\b"
+BM25_META_FILENAME = "bm25.json"
+BM25_ARRAY_NAMES = ("term_indptr", "term_docs", "term_tfs", "doc_lens", "doc_ids")
+# Written since tombstones are persisted; older snapshots have every document live
+BM25_ALIVE_NAME = "alive"
+
+# Approximate size of one entry of a Python list or dictionary of strings
+_PY_ENTRY_BYTES = 120
+
+
+def _is_mapped(array: np.ndarray) -> bool:
+    """Whether an array is a view of a memory-mapped file."""
+    while isinstance(array, np.ndarray):
+        if isinstance(array, np.memmap):
+            return True
+        array = array.base
+    return False
+
+
+@dataclass
+class CorpusStats:
+    """BM25 statistics of a corpus split across several indexes.
+
+    Passing the statistics of the whole corpus to each part's search makes
+    the scores of all parts comparable, as if it were one index.
+
+    Attributes:
+        num_docs: Live documents in the corpus
+        total_len: Total token count of the live documents
+        doc_freqs: Documents containing each term; only the query terms are
+            needed for a search
+    """
+
+    num_docs: int
+    total_len: int
+    doc_freqs: Dict[str, int]
+
+    @property
+    def avgdl(self) -> float:
+        return self.total_len / self.num_docs if self.num_docs else 1.0
+
+
+class BM25Tokenizer:
+    """Lowercasing, stopword-filtering, stemming tokenizer."""
+
+    def __init__(
+        self,
+        language: str = "english",
+        stopwords: Iterable[str] = STOPWORDS_EN,
+        token_pattern: str = DEFAULT_TOKEN_PATTERN,
+    ):
+        """Initialize tokenizer.
+
+        Args:
+            language: PyStemmer language, or None to skip stemming
+            stopwords: Words dropped before stemming
+            token_pattern: Regex matching a single token
+        """
+        self.stemmer = Stemmer.Stemmer(language) if language else None
+        self.stopwords = frozenset(stopwords)
+        self.pattern = re.compile(token_pattern)
+
+    def __call__(self, text: str) -> List[str]:
+        tokens = [
+            token
+            for token in self.pattern.findall(text.lower())
+            if token not in self.stopwords
+        ]
+        if self.stemmer is not None:
+            tokens = self.stemmer.stemWords(tokens)
+        return tokens
+
+
+class BM25Index:
+    """BM25 index stored as a sparse term-document matrix.
+
+    The corpus is a term-major CSR matrix of raw term frequencies (one row
+    per term, one column per document). A query slices the rows of its
+    terms, turns them into BM25 weights using precomputed per-document
+    length norms and scores every document with a single sparse-dense
+    product against the query's IDF vector. Top-k selection uses
+    `np.argpartition` instead of sorting every score, and `search_batch()`
+    scores many queries with one sparse matrix product.
+
+    New documents go to a small tail segment that is merged into the
+    matrix once it holds `merge_threshold` documents. Term statistics are
+    updated in place on every `add()` and `delete()`, so scores always
+    reflect the live corpus. Deleted documents are only tombstoned; their
+    columns stay in place until `compact()` drops them. All public methods
+    are thread-safe, so searches can run in an executor while documents
+    are being updated.
+    """
+
+    def __init__(
+        self,
+        k1: float = 1.5,
+        b: float = 0.75,
+        tokenizer: Optional[BM25Tokenizer] = None,
+        merge_threshold: int = 10_000,
+    ):
+        """Initialize an empty index.
+
+        Args:
+            k1: Term frequency saturation
+            b: Document length normalization
+            tokenizer: Tokenizer used for documents and queries
+            merge_threshold: Tail documents buffered before merging into
+                the CSR matrix
+        """
+        self.k1 = k1
+        self.b = b
+        self.tokenizer = tokenizer or BM25Tokenizer()
+        self.merge_threshold = merge_threshold
+
+        self.vocab: Dict[str, int] = {}
+        # Terms by ID, filled in lazily from `vocab`
+        self._terms: List[str] = []
+        self.doc_freqs = np.zeros(0, dtype=np.int64)
+
+        # Node ID of each document, and document of each node ID (-1 if none)
+        self.doc_ids = np.zeros(0, dtype=np.int64)
+        self.doc_lens = np.zeros(0, dtype=np.int64)
+        self.alive = np.zeros(0, dtype=bool)
+        self._doc_of = np.zeros(0, dtype=np.int64)
+
+        # Merged segment: term-major tf matrix plus a doc-major view of it,
+        # built on the first delete
+        self._matrix = sp.csr_matrix((0, 0), dtype=np.float32)
+        self._by_doc: Optional[sp.csc_matrix] = None
+        # Tail segment: (doc, term, tf) triples per batch awaiting a merge
+        self._tail_docs: List[np.ndarray] = []
+        self._tail_terms: List[np.ndarray] = []
+        self._tail_tfs: List[np.ndarray] = []
+        self._tail_matrix: Optional[sp.csr_matrix] = None
+
+        # Cached IDF and length norms, invalidated whenever statistics change
+        self._idf: Optional[np.ndarray] = None
+        self._norms: Optional[np.ndarray] = None
+        # Length norms for an external average document length
+        self._shared_norms: Optional[Tuple[float, np.ndarray]] = None
+
+        self.num_docs = 0
+        self.total_len = 0
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return self.num_docs
+
+    def __contains__(self, node_id: object) -> bool:
+        return (
+            isinstance(node_id, (int, np.integer))
+            and 0 <= node_id < len(self._doc_of)
+            and self._doc_of[node_id] >= 0
+        )
+
+    @property
+    def memory_bytes(self) -> int:
+        """Approximate memory held by the index, in bytes."""
+        with self._lock:
+            arrays = [
+                self.doc_freqs,
+                self.doc_ids,
+                self.doc_lens,
+                self.alive,
+                self._doc_of,
+                *self._tail_docs,
+                *self._tail_terms,
+                *self._tail_tfs,
+            ]
+            for matrix in (self._matrix, self._by_doc, self._tail_matrix):
+                if matrix is not None:
+                    arrays += [matrix.data, matrix.indices, matrix.indptr]
+            # Mapped arrays live in the page cache shared with other processes
+            size = sum(array.nbytes for array in arrays if not _is_mapped(array))
+            # Vocabulary entries
+            return size + len(self.vocab) * _PY_ENTRY_BYTES
+
+    @property
+    def tombstone_ratio(self) -> float:
+        """Fraction of stored documents that are tombstoned."""
+        if not len(self.doc_ids):
+            return 0.0
+        return 1.0 - self.num_docs / len(self.doc_ids)
+
+    @property
+    def _num_merged(self) -> int:
+        return self._matrix.shape[1]
+
+    @synchronized
+    def add(self, node_ids: Sequence[int], texts: Sequence[str]):
+        """Index new documents, replacing any live document with the same ID.
+
+        Args:
+            node_ids: Non-negative integer node IDs
+            texts: Document texts
+        """
+        node_ids = np.asarray(node_ids, dtype=np.int64)
+        if not len(node_ids):
+            return
+        self.delete(node_ids)
+        first_doc = len(self.doc_ids)
+        token_ids: List[int] = []
+        doc_lens: List[int] = []
+        for text in texts:
+            tokens = self.tokenizer(text)
+            token_ids.extend(
+                self.vocab.setdefault(token, len(self.vocab)) for token in tokens
+            )
+            doc_lens.append(len(tokens))
+
+        size = int(node_ids.max()) + 1
+        if size > len(self._doc_of):
+            grown = np.full(max(size, 2 * len(self._doc_of)), -1, dtype=np.int64)
+            grown[: len(self._doc_of)] = self._doc_of
+            self._doc_of = grown
+        self._doc_of[node_ids] = np.arange(first_doc, first_doc + len(node_ids))
+        self.doc_ids = np.concatenate([self.doc_ids, node_ids])
+
+        # Count (document, term) pairs for the whole batch in one pass
+        num_terms = max(len(self.vocab), 1)
+        docs = np.repeat(np.arange(first_doc, len(self.doc_ids)), doc_lens)
+        pairs, tfs = np.unique(
+            docs * num_terms + np.asarray(token_ids, dtype=np.int64), return_counts=True
+        )
+        docs, terms = np.divmod(pairs, num_terms)
+        self._tail_docs.append(docs)
+        self._tail_terms.append(terms)
+        self._tail_tfs.append(tfs.astype(np.float32))
+        self._tail_matrix = None
+
+        self.doc_freqs = np.pad(
+            self.doc_freqs, (0, len(self.vocab) - len(self.doc_freqs))
+        )
+        self.doc_freqs += np.bincount(terms, minlength=len(self.vocab))
+        self.doc_lens = np.concatenate(
+            [self.doc_lens, np.asarray(doc_lens, dtype=np.int64)]
+        )
+        self.alive = np.concatenate([self.alive, np.ones(len(doc_lens), dtype=bool)])
+        self.num_docs += len(doc_lens)
+        self.total_len += int(sum(doc_lens))
+        self._invalidate()
+
+        if len(self.doc_ids) - self._num_merged >= self.merge_threshold:
+            self._merge_tail()
+
+    @synchronized
+    def delete(self, node_ids: Iterable[int]) -> int:
+        """Tombstone documents.
+
+        Args:
+            node_ids: Node IDs to delete; unknown IDs are ignored
+
+        Returns:
+            Number of documents deleted
+        """
+        node_ids = np.fromiter(node_ids, dtype=np.int64)
+        node_ids = node_ids[(node_ids >= 0) & (node_ids < len(self._doc_of))]
+        docs = np.unique(self._doc_of[node_ids])
+        docs = docs[docs >= 0]
+        if not len(docs):
+            return 0
+        self._doc_of[self.doc_ids[docs]] = -1
+        self.alive[docs] = False
+
+        merged = docs[docs < self._num_merged]
+        if self._by_doc is None:
+            self._by_doc = self._matrix.tocsc()
+        removed_terms = [self._by_doc[:, merged].indices]
+        if self._tail_docs:
+            tail_docs = np.concatenate(self._tail_docs)
+            removed_terms.append(
+                np.concatenate(self._tail_terms)[np.isin(tail_docs, docs)]
+            )
+        self.doc_freqs -= np.bincount(
+            np.concatenate(removed_terms), minlength=len(self.doc_freqs)
+        )
+        self.num_docs -= len(docs)
+        self.total_len -= int(self.doc_lens[docs].sum())
+        self._invalidate()
+        return len(docs)
+
+    @synchronized
+    def compact(self):
+        """Merge the tail segment, then drop tombstoned documents and renumber."""
+        self._merge_tail()
+        if self.num_docs == len(self.doc_ids):
+            return
+        removed = len(self.doc_ids) - self.num_docs
+        alive = np.flatnonzero(self.alive)
+        self._matrix = self._matrix[:, alive].tocsr()
+        self._by_doc = None
+        self.doc_ids = self.doc_ids[alive]
+        self.doc_lens = self.doc_lens[alive]
+        self.alive = np.ones(len(alive), dtype=bool)
+        self._doc_of[self.doc_ids] = np.arange(len(alive))
+        self._invalidate()
+        logger.info(f"Compacted BM25 index: removed {removed} tombstoned documents")
+
+    @synchronized
+    def search(
+        self, query: str, k: int, stats: Optional[CorpusStats] = None
+    ) -> List[Tuple[int, float]]:
+        """Score live documents against a query.
+
+        Args:
+            query: Query text
+            k: Number of results
+            stats: Statistics of a larger corpus this index is part of;
+                the index's own statistics are used if None
+
+        Returns:
+            List of (node ID, score) pairs, best first
+        """
+        terms = self._query_terms(query)
+        if self.num_docs == 0 or k <= 0 or not len(terms):
+            return []
+        idf = self._term_idf(terms, stats)
+        scores = np.concatenate(
+            [weights.T @ idf for weights in self._segment_weights(terms, stats)]
+        )
+        docs = np.flatnonzero(scores)
+        return self._top_k(docs, scores[docs], k)
+
+    @synchronized
+    def search_batch(
+        self, queries: Sequence[str], k: int, stats: Optional[CorpusStats] = None
+    ) -> List[List[Tuple[int, float]]]:
+        """Score many queries at once with a single sparse matrix product.
+
+        Args:
+            queries: Query texts
+            k: Number of results per query
+            stats: Statistics of a larger corpus this index is part of;
+                the index's own statistics are used if None
+
+        Returns:
+            One list of (node ID, score) pairs per query, best first
+        """
+        query_terms = [self._query_terms(query) for query in queries]
+        if self.num_docs == 0 or k <= 0 or not any(len(t) for t in query_terms):
+            return [[] for _ in queries]
+
+        terms = np.unique(np.concatenate(query_terms))
+        idf = self._term_idf(terms, stats)
+        rows = np.repeat(np.arange(len(queries)), [len(t) for t in query_terms])
+        cols = np.searchsorted(terms, np.concatenate(query_terms))
+        query_matrix = sp.csr_matrix(
+            (idf[cols], (rows, cols)), shape=(len(queries), len(terms))
+        )
+        scores = sp.hstack(
+            [
+                query_matrix @ weights
+                for weights in self._segment_weights(terms, stats)
+            ],
+            format="csr",
+        )
+        results = []
+        for row in range(len(queries)):
+            start, end = scores.indptr[row], scores.indptr[row + 1]
+            results.append(
+                self._top_k(scores.indices[start:end], scores.data[start:end], k)
+            )
+        return results
+
+    def _query_terms(self, query: str) -> np.ndarray:
+        """Sorted IDs of distinct query terms present in the live corpus."""
+        tokens = set(self.tokenizer(query))
+        terms = np.fromiter(
+            (self.vocab[token] for token in tokens if token in self.vocab),
+            dtype=np.int64,
+        )
+        terms.sort()
+        return terms[self.doc_freqs[terms] > 0]
+
+    @synchronized
+    def term_doc_freqs(self, previous: Optional[np.ndarray] = None) -> Dict[str, int]:
+        """Live document frequency of each term, or its change.
+
+        Args:
+            previous: Copy of `doc_freqs` taken earlier; if given, only the
+                change since then is returned
+
+        Returns:
+            Terms mapped to their document frequency, or to its change;
+            terms with a zero value are left out
+        """
+        counts = self.doc_freqs
+        if previous is not None:
+            counts = counts - np.pad(previous, (0, len(counts) - len(previous)))
+        terms = self._term_names()
+        return {terms[term]: int(counts[term]) for term in np.flatnonzero(counts)}
+
+    def _term_names(self) -> List[str]:
+        """Term of each term ID."""
+        if len(self._terms) < len(self.vocab):
+            self._terms.extend(islice(self.vocab, len(self._terms), None))
+        return self._terms
+
+    def _term_idf(self, terms: np.ndarray, stats: Optional[CorpusStats]) -> np.ndarray:
+        """IDF of the given terms, from the live corpus or from `stats`."""
+        if stats is None:
+            return self._statistics()[0][terms]
+        names = self._term_names()
+        df = np.fromiter(
+            (stats.doc_freqs.get(names[term], 0) for term in terms),
+            dtype=np.float64,
+            count=len(terms),
+        )
+        return np.log1p((stats.num_docs - df + 0.5) / (df + 0.5))
+
+    def _doc_norms(self, stats: Optional[CorpusStats]) -> np.ndarray:
+        """Length norm per document, from the live corpus or from `stats`."""
+        if stats is None:
+            return self._statistics()[1]
+        avgdl = stats.avgdl
+        if self._shared_norms is None or self._shared_norms[0] != avgdl:
+            norms = self.k1 * (1 - self.b + self.b * self.doc_lens / avgdl)
+            norms[~self.alive] = np.inf
+            self._shared_norms = (avgdl, norms)
+        return self._shared_norms[1]
+
+    def _statistics(self) -> Tuple[np.ndarray, np.ndarray]:
+        """IDF per term and length norm per document for the live corpus."""
+        if self._idf is None:
+            df = self.doc_freqs
+            self._idf = np.log1p((self.num_docs - df + 0.5) / (df + 0.5))
+            avgdl = self.total_len / self.num_docs if self.num_docs else 1.0
+            norms = self.k1 * (1 - self.b + self.b * self.doc_lens / avgdl)
+            # An infinite norm zeroes every weight of a tombstoned document
+            norms[~self.alive] = np.inf
+            self._norms = norms
+        return self._idf, self._norms
+
+    def _segment_weights(
+        self, terms: np.ndarray, stats: Optional[CorpusStats] = None
+    ) -> List[sp.csr_matrix]:
+        """BM25 term weights for the given terms, one block per segment."""
+        norms = self._doc_norms(stats)
+        if self._matrix.shape[0] < len(self.vocab):
+            # Terms first seen in the tail have empty rows in the merged matrix
+            self._matrix.resize((len(self.vocab), self._num_merged))
+        blocks = []
+        offset = 0
+        for matrix in (self._matrix, self._tail_segment()):
+            block = matrix[terms]
+            tfs = block.data
+            block.data = tfs / (tfs + norms[offset + block.indices])
+            blocks.append(block)
+            offset += matrix.shape[1]
+        return blocks
+
+    def _tail_segment(self) -> sp.csr_matrix:
+        """Term-major matrix of the tail documents, built on demand."""
+        if self._tail_matrix is None:
+            empty = np.zeros(0, dtype=np.int64)
+            docs = np.concatenate(self._tail_docs) if self._tail_docs else empty
+            terms = np.concatenate(self._tail_terms) if self._tail_terms else empty
+            tfs = (
+                np.concatenate(self._tail_tfs)
+                if self._tail_tfs
+                else np.zeros(0, dtype=np.float32)
+            )
+            self._tail_matrix = sp.csr_matrix(
+                (tfs, (terms, docs - self._num_merged)),
+                shape=(len(self.vocab), len(self.doc_ids) - self._num_merged),
+            )
+        return self._tail_matrix
+
+    def _merge_tail(self):
+        """Fold the tail segment into the CSR matrix."""
+        if not self._tail_docs:
+            return
+        tail = self._tail_segment()
+        self._matrix.resize((len(self.vocab), self._num_merged))
+        self._matrix = sp.hstack([self._matrix, tail], format="csr", dtype=np.float32)
+        self._by_doc = None
+        self._tail_docs = []
+        self._tail_terms = []
+        self._tail_tfs = []
+        self._tail_matrix = None
+        logger.debug(f"Merged {tail.shape[1]} documents into BM25 matrix")
+
+    def _invalidate(self):
+        self._idf = None
+        self._norms = None
+        self._shared_norms = None
+
+    def _top_k(
+        self, docs: np.ndarray, scores: np.ndarray, k: int
+    ) -> List[Tuple[int, float]]:
+        """Select the k best positive scores without a full sort."""
+        keep = scores > 0
+        docs, scores = docs[keep], scores[keep]
+        if len(scores) > k:
+            best = np.argpartition(-scores, k - 1)[:k]
+            docs, scores = docs[best], scores[best]
+        order = np.argsort(-scores, kind="stable")
+        docs, scores = docs[order], scores[order]
+        return list(zip(self.doc_ids[docs].tolist(), scores.tolist()))
+
+    @synchronized
+    def persist(self, persist_dir: str | os.PathLike[str]):
+        """Write the index to a directory.
+
+        The CSR arrays are stored as separate `.npy` files so they can be
+        loaded without parsing. Tombstoned documents are written along with
+        their tombstones; dropping them is left to `compact()`.
+
+        Args:
+            persist_dir: Target directory
+        """
+        persist_path = Path(persist_dir)
+        persist_path.mkdir(parents=True, exist_ok=True)
+        self._merge_tail()
+        self._matrix.resize((len(self.vocab), self._matrix.shape[1]))
+        arrays = {
+            "term_indptr": self._matrix.indptr,
+            "term_docs": self._matrix.indices,
+            "term_tfs": self._matrix.data,
+            "doc_lens": self.doc_lens,
+            "doc_ids": self.doc_ids,
+            BM25_ALIVE_NAME: self.alive,
+        }
+        for name, array in arrays.items():
+            np.save(persist_path / f"{name}.npy", array)
+        with (persist_path / BM25_META_FILENAME).open("w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "k1": self.k1,
+                    "b": self.b,
+                    "vocab": list(self.vocab),
+                },
+                f,
+            )
+
+    @classmethod
+    def load(
+        cls,
+        persist_dir: str | os.PathLike[str],
+        tokenizer: Optional[BM25Tokenizer] = None,
+        mmap: bool = False,
+    ) -> "BM25Index":
+        """Load an index written by `persist()`.
+
+        With `mmap`, the postings and document lengths are memory-mapped
+        copy-on-write instead of read, so processes loading the same files
+        share their pages until one of them modifies the index.
+
+        Args:
+            persist_dir: Directory written by `persist()`
+            tokenizer: Tokenizer used for new documents and queries
+            mmap: Memory-map the arrays instead of reading them
+
+        Returns:
+            BM25Index instance
+        """
+        persist_path = Path(persist_dir)
+        with (persist_path / BM25_META_FILENAME).open("r", encoding="utf-8") as f:
+            meta = json.load(f)
+        mmap_mode = "c" if mmap else None
+        arrays = {
+            name: np.load(persist_path / f"{name}.npy", mmap_mode=mmap_mode)
+            for name in BM25_ARRAY_NAMES
+        }
+
+        index = cls(k1=meta["k1"], b=meta["b"], tokenizer=tokenizer)
+        index.vocab = {token: term for term, token in enumerate(meta["vocab"])}
+        index._terms = list(meta["vocab"])
+        index.doc_ids = np.asarray(arrays["doc_ids"], dtype=np.int64)
+        num_docs = len(index.doc_ids)
+        index._doc_of = np.full(
+            int(index.doc_ids.max()) + 1 if num_docs else 0, -1, dtype=np.int64
+        )
+        index._doc_of[index.doc_ids] = np.arange(num_docs)
+        index._matrix = sp.csr_matrix(
+            (arrays["term_tfs"], arrays["term_docs"], arrays["term_indptr"]),
+            shape=(len(index.vocab), num_docs),
+        )
+        index.doc_freqs = np.diff(index._matrix.indptr).astype(np.int64)
+        index.doc_lens = np.asarray(arrays["doc_lens"], dtype=np.int64)
+        index.alive = np.ones(num_docs, dtype=bool)
+        alive_path = persist_path / f"{BM25_ALIVE_NAME}.npy"
+        if alive_path.exists():
+            index.alive = np.load(alive_path).astype(bool)
+        dead = np.flatnonzero(~index.alive)
+        if len(dead):
+            # Statistics cover live documents only, as after `delete()`
+            index._doc_of[index.doc_ids[dead]] = -1
+            terms = np.repeat(np.arange(len(index.vocab)), index.doc_freqs)
+            index.doc_freqs -= np.bincount(
+                terms[~index.alive[index._matrix.indices]],
+                minlength=len(index.vocab),
+            )
+        index.num_docs = int(index.alive.sum())
+        index.total_len = int(index.doc_lens[index.alive].sum())
+        return index
+
+
+def node_text(node: BaseNode) -> str:
+    """Text of a node as indexed by BM25, including embeddable metadata."""
+    return node.get_content(metadata_mode=MetadataMode.EMBED)
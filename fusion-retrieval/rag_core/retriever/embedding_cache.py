@@ -0,0 +1,480 @@
+"""Persistent content-addressed embedding cache"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from pydantic import PrivateAttr
+
+from ..utils.logging import get_logger
+
+logger = get_logger(__name__)
+
+# SQLite caps the number of bound parameters per statement
+_SQL_BATCH_SIZE = 500
+# Hits only get a new `last_used` once their stamp is older than this, in
+# seconds, so repeated lookups don't turn every read into a write
+_TOUCH_INTERVAL = 300.0
+
+
+def embedding_key(model: str, dimensions: int, text: str) -> str:
+    """Build the cache key for a text embedded by a given model.
+
+    Args:
+        model: Embedding model name
+        dimensions: Embedding dimensions
+        text: Embedded text
+
+    Returns:
+        Hex SHA-256 digest identifying the embedding
+    """
+    digest = hashlib.sha256()
+    digest.update(f"{model}\x00{dimensions}\x00".encode("utf-8"))
+    digest.update(text.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def normalize_query_text(text: str) -> str:
+    """Canonical form of a query used for its embedding cache key.
+
+    Lowercases and collapses whitespace, so trivially different spellings
+    of the same query share one embedding.
+    """
+    return " ".join(text.lower().split())
+
+
+class EmbeddingCache:
+    """SQLite-backed embedding store keyed by `embedding_key()`.
+
+    Vectors are stored as float32 blobs. Lookups refresh the `last_used`
+    timestamp of hits whose stamp is older than a few minutes, so most reads
+    don't write, and writes evict the least recently used entries once the
+    cache grows past `max_entries`. The row count is kept in memory rather
+    than counted on every write.
+    """
+
+    def __init__(self, path: str | os.PathLike[str], max_entries: int = 1_000_000):
+        """Open (or create) an embedding cache.
+
+        Args:
+            path: SQLite database file
+            max_entries: Maximum number of cached embeddings (0 disables eviction)
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)"
+        )
+        self._conn.commit()
+        # Rows in the cache, kept up to date by writes
+        self._count = self._conn.execute(
+            "SELECT COUNT(*) FROM embeddings"
+        ).fetchone()[0]
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, Embedding]:
+        """Look up a batch of embeddings.
+
+        Args:
+            keys: Cache keys
+
+        Returns:
+            Mapping from key to embedding for every key found
+        """
+        found: Dict[str, Embedding] = {}
+        unique_keys = list(dict.fromkeys(keys))
+        now = time.time()
+        stale: List[str] = []
+        with self._lock:
+            for start in range(0, len(unique_keys), _SQL_BATCH_SIZE):
+                batch = unique_keys[start : start + _SQL_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    "SELECT key, vector, last_used FROM embeddings "
+                    f"WHERE key IN ({placeholders})",
+                    batch,
+                ).fetchall()
+                for key, blob, last_used in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+                    if now - last_used > _TOUCH_INTERVAL:
+                        stale.append(key)
+            if stale:
+                for start in range(0, len(stale), _SQL_BATCH_SIZE):
+                    batch = stale[start : start + _SQL_BATCH_SIZE]
+                    self._conn.execute(
+                        f"UPDATE embeddings SET last_used = ? "
+                        f"WHERE key IN ({','.join('?' * len(batch))})",
+                        [now, *batch],
+                    )
+                self._conn.commit()
+        return found
+
+    def put_many(self, items: Dict[str, Embedding]):
+        """Write back a batch of embeddings and evict if over capacity.
+
+        Args:
+            items: Mapping from cache key to embedding
+        """
+        if not items:
+            return
+        now = time.time()
+        rows = [
+            (key, np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for key, vector in items.items()
+        ]
+        keys = list(items)
+        with self._lock:
+            # Replaced keys don't grow the cache
+            existing = 0
+            for start in range(0, len(keys), _SQL_BATCH_SIZE):
+                batch = keys[start : start + _SQL_BATCH_SIZE]
+                existing += self._conn.execute(
+                    "SELECT COUNT(*) FROM embeddings "
+                    f"WHERE key IN ({','.join('?' * len(batch))})",
+                    batch,
+                ).fetchone()[0]
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) "
+                "VALUES (?, ?, ?)",
+                rows,
+            )
+            self._count += len(rows) - existing
+            self._evict()
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self):
+        """Close the underlying database connection."""
+        with self._lock:
+            self._conn.close()
+
+    def _evict(self):
+        """Drop least recently used entries beyond `max_entries`."""
+        if self.max_entries <= 0:
+            return
+        overflow = self._count - self.max_entries
+        if overflow > 0:
+            deleted = self._conn.execute(
+                "DELETE FROM embeddings WHERE key IN ("
+                "SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                (overflow,),
+            ).rowcount
+            self._count -= deleted
+            logger.info(f"Evicted {deleted} embeddings from cache")
+
+
+class CachedEmbedding(BaseEmbedding):
+    """Embedding model wrapper that serves text embeddings from an `EmbeddingCache`.
+
+    Each batch is looked up in the cache first; only the misses are sent to
+    the wrapped model, and their embeddings are written back afterwards.
+    Query embeddings are passed straight through.
+    """
+
+    dimensions: Optional[int] = None
+    _model: BaseEmbedding = PrivateAttr()
+    _cache: EmbeddingCache = PrivateAttr()
+
+    def __init__(
+        self,
+        model: BaseEmbedding,
+        cache: EmbeddingCache,
+        dimensions: Optional[int] = None,
+        embed_batch_size: int = 256,
+    ):
+        """Initialize cached embedding model.
+
+        Args:
+            model: Embedding model used for cache misses
+            cache: Embedding cache
+            dimensions: Embedding dimensions, part of the cache key
+            embed_batch_size: Number of texts looked up in the cache at once
+        """
+        super().__init__(
+            model_name=model.model_name,
+            dimensions=dimensions,
+            embed_batch_size=embed_batch_size,
+            callback_manager=model.callback_manager,
+        )
+        self._model = model
+        self._cache = cache
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    @property
+    def cache(self) -> EmbeddingCache:
+        """The underlying embedding cache."""
+        return self._cache
+
+    def _key(self, text: str) -> str:
+        return embedding_key(self.model_name, self.dimensions or 0, text)
+
+    def _lookup(self, texts: List[str]) -> tuple[List[Optional[Embedding]], List[int]]:
+        """Resolve texts from the cache, returning embeddings and miss positions."""
+        keys = [self._key(text) for text in texts]
+        found = self._cache.get_many(keys)
+        embeddings = [found.get(key) for key in keys]
+        misses = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        logger.debug(f"Embedding cache: {len(texts) - len(misses)} hits, {len(misses)} misses")
+        return embeddings, misses
+
+    def _store(
+        self,
+        texts: List[str],
+        embeddings: List[Optional[Embedding]],
+        misses: List[int],
+        computed: List[Embedding],
+    ) -> List[Embedding]:
+        """Fill computed embeddings into place and write them back."""
+        for i, embedding in zip(misses, computed):
+            embeddings[i] = embedding
+        self._cache.put_many({self._key(texts[i]): embeddings[i] for i in misses})
+        return embeddings
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        return self._model.get_query_embedding(query)
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        return await self._model.aget_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> Embedding:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        embeddings, misses = self._lookup(texts)
+        if not misses:
+            return embeddings
+        computed = self._model.get_text_embedding_batch([texts[i] for i in misses])
+        return self._store(texts, embeddings, misses, computed)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        embeddings, misses = await self._alookup(texts)
+        if not misses:
+            return embeddings
+        computed = await self._model.aget_text_embedding_batch(
+            [texts[i] for i in misses]
+        )
+        return await self._astore(texts, embeddings, misses, computed)
+
+
+class CachedQueryEmbedding(BaseEmbedding):
+    """Embedding model wrapper with an in-process LRU cache for queries.
+
+    Embeddings are keyed by model, dimensions and normalized query text and
+    kept in memory up to `max_entries`, evicting the least recently used.
+    With an `EmbeddingCache` attached, misses are looked up there before
+    calling the wrapped model and new embeddings are written back, so the
+    cache survives restarts. The batch text entry point is cached as well:
+    it is what batched query embedding uses, since OpenAI embeds queries
+    and documents with the same model.
+    """
+
+    dimensions: Optional[int] = None
+    max_entries: int = 10_000
+    _model: BaseEmbedding = PrivateAttr()
+    _cache: Optional[EmbeddingCache] = PrivateAttr()
+    _entries: OrderedDict = PrivateAttr()
+    _lock: threading.Lock = PrivateAttr()
+    _hits: int = PrivateAttr(default=0)
+    _misses: int = PrivateAttr(default=0)
+
+    def __init__(
+        self,
+        model: BaseEmbedding,
+        max_entries: int = 10_000,
+        cache: Optional[EmbeddingCache] = None,
+        dimensions: Optional[int] = None,
+    ):
+        """Initialize cached query embedding model.
+
+        Args:
+            model: Embedding model used for cache misses
+            max_entries: Maximum number of embeddings kept in memory
+            cache: Optional persistent cache behind the in-memory one
+            dimensions: Embedding dimensions, part of the cache key
+        """
+        super().__init__(
+            model_name=model.model_name,
+            dimensions=dimensions,
+            max_entries=max_entries,
+            embed_batch_size=model.embed_batch_size,
+            callback_manager=model.callback_manager,
+        )
+        self._model = model
+        self._cache = cache
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedQueryEmbedding"
+
+    def warm(self, queries: Sequence[str]) -> int:
+        """Pre-compute embeddings for known frequent queries.
+
+        Args:
+            queries: Query strings
+
+        Returns:
+            Number of queries that were not cached yet and got embedded
+        """
+        texts = list(queries)
+        embeddings, misses = self._lookup(texts)
+        for start in range(0, len(misses), self.embed_batch_size):
+            batch = misses[start : start + self.embed_batch_size]
+            computed = self._model.get_text_embedding_batch([texts[i] for i in batch])
+            self._store(texts, embeddings, batch, computed)
+        logger.info(f"Warmed query embedding cache with {len(misses)} queries")
+        return len(misses)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit and miss counters of the in-process cache.
+
+        Returns:
+            Dictionary of counters, current size and hit rate
+        """
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+            }
+
+    def _key(self, text: str) -> str:
+        return embedding_key(
+            self.model_name, self.dimensions or 0, normalize_query_text(text)
+        )
+
+    def _lookup(self, texts: List[str]) -> tuple[List[Optional[Embedding]], List[int]]:
+        """Resolve texts from memory, then the persistent cache."""
+        keys = [self._key(text) for text in texts]
+        embeddings: List[Optional[Embedding]] = []
+        with self._lock:
+            for key in keys:
+                vector = self._entries.get(key)
+                if vector is not None:
+                    self._entries.move_to_end(key)
+                embeddings.append(None if vector is None else vector.tolist())
+
+        misses = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if misses and self._cache is not None:
+            found = self._cache.get_many([keys[i] for i in misses])
+            if found:
+                self._remember(found)
+                for i in misses:
+                    embeddings[i] = found.get(keys[i])
+                misses = [i for i in misses if embeddings[i] is None]
+
+        with self._lock:
+            self._hits += len(texts) - len(misses)
+            self._misses += len(misses)
+        return embeddings, misses
+
+    def _store(
+        self,
+        texts: List[str],
+        embeddings: List[Optional[Embedding]],
+        misses: List[int],
+        computed: List[Embedding],
+    ) -> List[Embedding]:
+        """Fill computed embeddings into place and remember them."""
+        for i, embedding in zip(misses, computed):
+            embeddings[i] = embedding
+        items = {self._key(texts[i]): embeddings[i] for i in misses}
+        self._remember(items)
+        if self._cache is not None:
+            self._cache.put_many(items)
+        return embeddings
+
+    async def _alookup(
+        self, texts: List[str]
+    ) -> tuple[List[Optional[Embedding]], List[int]]:
+        """`_lookup()` off the event loop when it may query the SQLite cache."""
+        if self._cache is None:
+            return self._lookup(texts)
+        return await asyncio.to_thread(self._lookup, texts)
+
+    async def _astore(
+        self,
+        texts: List[str],
+        embeddings: List[Optional[Embedding]],
+        misses: List[int],
+        computed: List[Embedding],
+    ) -> List[Embedding]:
+        """`_store()` off the event loop when it writes to the SQLite cache."""
+        if self._cache is None:
+            return self._store(texts, embeddings, misses, computed)
+        return await asyncio.to_thread(self._store, texts, embeddings, misses, computed)
+
+    def _remember(self, items: Dict[str, Embedding]):
+        """Add embeddings to the in-memory LRU, evicting beyond `max_entries`."""
+        with self._lock:
+            for key, embedding in items.items():
+                self._entries[key] = np.asarray(embedding, dtype=np.float32)
+                self._entries.move_to_end(key)
+            while self.max_entries > 0 and len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        embeddings, misses = self._lookup([query])
+        if not misses:
+            return embeddings[0]
+        computed = [self._model.get_query_embedding(query)]
+        return self._store([query], embeddings, misses, computed)[0]
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        embeddings, misses = await self._alookup([query])
+        if not misses:
+            return embeddings[0]
+        computed = [await self._model.aget_query_embedding(query)]
+        return (await self._astore([query], embeddings, misses, computed))[0]
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> Embedding:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        embeddings, misses = self._lookup(texts)
+        if not misses:
+            return embeddings
+        computed = self._model.get_text_embedding_batch([texts[i] for i in misses])
+        return self._store(texts, embeddings, misses, computed)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        embeddings, misses = await self._alookup(texts)
+        if not misses:
+            return embeddings
+        computed = await self._model.aget_text_embedding_batch(
+            [texts[i] for i in misses]
+        )
+        return await self._astore(texts, embeddings, misses, computed)
@@ -0,0 +1,268 @@
+"""Rate-limit-aware batched embedding for ingestion"""
+
+from __future__ import annotations
+
+import asyncio
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import openai
+from llama_index.core.async_utils import asyncio_run
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from llama_index.core.utils import get_tokenizer
+from pydantic import PrivateAttr
+
+from ..utils.logging import get_logger
+from ..utils.metrics import STAGE_ERRORS, STAGE_SECONDS, count_items
+
+logger = get_logger(__name__)
+
+# Errors worth retrying besides rate limits
+_TRANSIENT_ERRORS = (openai.APIConnectionError, openai.InternalServerError)
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Delay requested by a rate-limited response, if it sent one.
+
+    Args:
+        error: Exception raised by the provider client
+
+    Returns:
+        Seconds from `retry-after-ms` or `retry-after`, or None
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+
+def is_rate_limit(error: Exception) -> bool:
+    """Whether an exception is an HTTP 429 from the provider."""
+    return isinstance(error, openai.RateLimitError) or (
+        getattr(error, "status_code", None) == 429
+    )
+
+
+class RateLimitedEmbedding(BaseEmbedding):
+    """Embedding model wrapper that schedules batches within provider rate limits.
+
+    Texts are packed into requests of at most `max_batch_tokens` tokens and
+    `max_batch_size` inputs, and requests run concurrently. Concurrency
+    follows AIMD: it grows by one request per window of successful
+    requests and halves on a 429 response, after which all requests wait
+    for the `Retry-After` delay (or an exponential backoff). Connection and
+    server errors are retried with backoff; after `max_retries` attempts
+    the error is raised. The wrapped model should not retry on its own.
+    """
+
+    max_batch_tokens: int = 100_000
+    max_batch_size: int = 512
+    max_concurrency: int = 8
+    max_retries: int = 8
+    _model: BaseEmbedding = PrivateAttr()
+    _tokenizer: Callable[[str], List[int]] = PrivateAttr()
+    _lock: threading.Lock = PrivateAttr()
+    _limit: float = PrivateAttr()
+    _epoch: int = PrivateAttr(default=0)
+    _paused_until: float = PrivateAttr(default=0.0)
+    _tokens: int = PrivateAttr(default=0)
+    _requests: int = PrivateAttr(default=0)
+    _rate_limited: int = PrivateAttr(default=0)
+    _busy_seconds: float = PrivateAttr(default=0.0)
+
+    def __init__(
+        self,
+        model: BaseEmbedding,
+        max_batch_tokens: int = 100_000,
+        max_batch_size: int = 512,
+        max_concurrency: int = 8,
+        max_retries: int = 8,
+    ):
+        """Initialize rate-limited embedding model.
+
+        Args:
+            model: Embedding model that sends the requests
+            max_batch_tokens: Token budget of one request
+            max_batch_size: Maximum inputs per request
+            max_concurrency: Upper bound for concurrent requests
+            max_retries: Attempts per request before giving up
+        """
+        super().__init__(
+            model_name=model.model_name,
+            # Hand the scheduler enough texts per call to fill every slot
+            embed_batch_size=min(max_batch_size * max_concurrency, 2048),
+            callback_manager=model.callback_manager,
+            max_batch_tokens=max_batch_tokens,
+            max_batch_size=max_batch_size,
+            max_concurrency=max_concurrency,
+            max_retries=max_retries,
+        )
+        self._model = model
+        self._tokenizer = get_tokenizer()
+        self._lock = threading.Lock()
+        self._limit = float(max_concurrency)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "RateLimitedEmbedding"
+
+    def stats(self) -> Dict[str, Any]:
+        """Throughput and rate-limit counters since creation.
+
+        Returns:
+            Dictionary with embedded tokens, tokens per second of embedding
+            time, request and 429 counts and the current concurrency limit
+        """
+        with self._lock:
+            return {
+                "tokens": self._tokens,
+                "requests": self._requests,
+                "rate_limited": self._rate_limited,
+                "tokens_per_second": (
+                    self._tokens / self._busy_seconds if self._busy_seconds else 0.0
+                ),
+                "concurrency": int(self._limit),
+            }
+
+    def _pack(self, texts: List[str]) -> List[Tuple[List[int], int]]:
+        """Group text positions into requests by token budget and size."""
+        batches: List[Tuple[List[int], int]] = []
+        indices: List[int] = []
+        tokens = 0
+        for i, text in enumerate(texts):
+            count = len(self._tokenizer(text))
+            if indices and (
+                tokens + count > self.max_batch_tokens
+                or len(indices) >= self.max_batch_size
+            ):
+                batches.append((indices, tokens))
+                indices, tokens = [], 0
+            indices.append(i)
+            tokens += count
+        if indices:
+            batches.append((indices, tokens))
+        return batches
+
+    async def _wait_until_resumed(self):
+        """Sleep while requests are paused after a rate limit."""
+        while True:
+            delay = self._paused_until - time.monotonic()
+            if delay <= 0:
+                return
+            await asyncio.sleep(delay)
+
+    def _on_success(self, tokens: int):
+        with self._lock:
+            self._limit = min(self.max_concurrency, self._limit + 1 / self._limit)
+            self._tokens += tokens
+            self._requests += 1
+
+    def _on_error(self, error: Exception, epoch: int, attempt: int) -> float:
+        """Adapt to a failed request and return the delay before retrying."""
+        if attempt + 1 >= self.max_retries:
+            raise error
+        backoff = min(60.0, 2**attempt) * (0.5 + random.random() / 2)
+        if is_rate_limit(error):
+            delay = retry_after_seconds(error) or backoff
+            with self._lock:
+                self._rate_limited += 1
+                # Halve once per window: requests already in flight when the
+                # limit was cut report the same overload
+                if epoch == self._epoch:
+                    self._limit = max(1.0, self._limit / 2)
+                    self._epoch += 1
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            logger.warning(
+                f"Embedding rate limited, retrying in {delay:.1f}s with "
+                f"concurrency {int(self._limit)}"
+            )
+            return delay
+        if isinstance(error, _TRANSIENT_ERRORS):
+            logger.warning(
+                f"Embedding request failed ({error}), retrying in {backoff:.1f}s"
+            )
+            return backoff
+        raise error
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        if not texts:
+            return []
+        start = time.perf_counter()
+        batches = self._pack(texts)
+        results: List[Optional[Embedding]] = [None] * len(texts)
+        slots = asyncio.Condition()
+        in_flight = 0
+
+        async def run(indices: List[int], tokens: int):
+            nonlocal in_flight
+            attempt = 0
+            while True:
+                await self._wait_until_resumed()
+                async with slots:
+                    await slots.wait_for(lambda: in_flight < int(self._limit))
+                    in_flight += 1
+                epoch = self._epoch
+                try:
+                    embeddings = await self._model.aget_text_embedding_batch(
+                        [texts[i] for i in indices]
+                    )
+                except Exception as e:
+                    delay = self._on_error(e, epoch, attempt)
+                else:
+                    self._on_success(tokens)
+                    for i, embedding in zip(indices, embeddings):
+                        results[i] = embedding
+                    return
+                finally:
+                    async with slots:
+                        in_flight -= 1
+                        slots.notify_all()
+                attempt += 1
+                await asyncio.sleep(delay)
+
+        tasks = [
+            asyncio.ensure_future(run(indices, tokens)) for indices, tokens in batches
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            STAGE_ERRORS.inc(stage="embed")
+            raise
+
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage="embed")
+        count_items("embed", len(texts))
+        tokens = sum(tokens for _, tokens in batches)
+        with self._lock:
+            self._busy_seconds += elapsed
+        logger.info(
+            f"Embedded {len(texts)} texts ({tokens} tokens) in {len(batches)} "
+            f"requests: {tokens / elapsed:.0f} tokens/s, "
+            f"concurrency {int(self._limit)}"
+        )
+        return results
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        return asyncio_run(self._aget_text_embeddings(texts))
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> Embedding:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        return self._get_text_embedding(query)
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        return await self._aget_text_embedding(query)
@@ -0,0 +1,593 @@
+"""FAISS vector store with configurable ANN index types"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import math
+import os
+import threading
+from typing import Any, Iterable, List, Optional, Sequence, Set
+
+import faiss
+import numpy as np
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    VectorStoreQuery,
+    VectorStoreQueryResult,
+)
+from pydantic import PrivateAttr
+
+from ..utils.concurrency import synchronized
+from ..utils.config import EmbeddingConfig
+from ..utils.logging import get_logger
+
+logger = get_logger(__name__)
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+VECTOR_STORE_FILENAME = "default__vector_store.json"
+IDS_SUFFIX = ".ids.json"
+
+# IVF k-means wants roughly this many training points per list
+_MIN_POINTS_PER_LIST = 39
+
+
+def factory_string(
+    embed_config: EmbeddingConfig, num_train: int, num_vectors: Optional[int] = None
+) -> str:
+    """Build a `faiss.index_factory` description from configuration.
+
+    Args:
+        embed_config: Embedding configuration
+        num_train: Number of vectors available for training
+        num_vectors: Expected index size, used to size IVF lists
+            (defaults to `num_train`)
+
+    Returns:
+        Index factory string
+    """
+    index_type = embed_config.index_type
+    if index_type == "flat":
+        return "Flat"
+    if index_type == "hnsw":
+        return f"HNSW{embed_config.hnsw_m},Flat"
+    if index_type in ("ivf_flat", "ivf_pq"):
+        num_vectors = num_vectors or num_train
+        nlist = embed_config.nlist or int(4 * math.sqrt(max(num_vectors, 1)))
+        # Never ask k-means for more lists than the training set supports
+        nlist = max(1, min(nlist, num_train // _MIN_POINTS_PER_LIST))
+        if index_type == "ivf_flat":
+            return f"IVF{nlist},Flat"
+        # PQ codebooks need at least 2**nbits training points
+        nbits = max(1, min(embed_config.pq_nbits, int(math.log2(max(num_train, 2)))))
+        return f"IVF{nlist},PQ{embed_config.pq_m}x{nbits}"
+    raise ValueError(
+        f"Unsupported index type: {index_type}. Options: {', '.join(INDEX_TYPES)}"
+    )
+
+
+def _io_flags(index_type: str) -> int:
+    """`faiss.read_index` flags that memory-map an index of the given type."""
+    # IVF lists are mapped as on-disk inverted lists; other indexes map their
+    # flat code storage in place
+    if index_type.startswith("ivf"):
+        return faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+    return faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY
+
+
+class FaissIndexStore(BasePydanticVectorStore):
+    """LlamaIndex vector store backed by a configurable FAISS index.
+
+    Vectors are compared by inner product, which equals cosine similarity
+    for the unit-length embeddings OpenAI returns, so returned scores are
+    similarities (higher is better). The index is wrapped in an
+    `IndexIDMap2` keyed directly by the integer node IDs of the node store.
+    Trainable indexes (IVF) are trained on the first batch they see unless
+    `train()` was called beforehand. Deleted nodes are tombstoned, and
+    searches skip them with an ID selector until `compact()` removes them
+    from FAISS. Index access is serialized by a lock, and `aquery()` runs
+    the search in a worker thread so it does not block the event loop.
+    """
+
+    stores_text: bool = False
+
+    _config: EmbeddingConfig = PrivateAttr()
+    _index: Optional[Any] = PrivateAttr(default=None)
+    # Whether each node ID has a live vector
+    _live: Any = PrivateAttr(default_factory=lambda: np.zeros(0, dtype=bool))
+    _num_live: int = PrivateAttr(default=0)
+    _tombstones: Set[int] = PrivateAttr(default_factory=set)
+    # Search parameters excluding tombstones, with the objects they point to
+    _search_filter: Optional[tuple] = PrivateAttr(default=None)
+    _mapped: bool = PrivateAttr(default=False)
+    _lock: Any = PrivateAttr(default_factory=threading.RLock)
+
+    def __init__(
+        self,
+        embed_config: EmbeddingConfig,
+        faiss_index: Optional[Any] = None,
+        mapped: bool = False,
+    ):
+        """Initialize FAISS store.
+
+        Args:
+            embed_config: Embedding configuration with index settings
+            faiss_index: Existing `IndexIDMap2` to wrap; built lazily if None
+            mapped: Whether `faiss_index` was read memory-mapped from disk
+        """
+        super().__init__()
+        self._config = embed_config
+        self._index = faiss_index
+        self._mapped = mapped and faiss_index is not None
+        if faiss_index is not None:
+            self._mark_live(faiss.vector_to_array(faiss_index.id_map))
+            self._apply_search_params()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "FaissIndexStore"
+
+    @property
+    def client(self) -> Any:
+        """The underlying FAISS index."""
+        return self._index
+
+    @property
+    def is_trained(self) -> bool:
+        """Whether the FAISS index exists and is ready for adds."""
+        return self._index is not None and self._index.is_trained
+
+    @property
+    def num_vectors(self) -> int:
+        """Number of live (non-tombstoned) vectors."""
+        return self._num_live
+
+    @synchronized
+    def train(self, embeddings: np.ndarray, num_vectors: Optional[int] = None):
+        """Create the FAISS index and train it on sample embeddings.
+
+        Args:
+            embeddings: Training sample of shape (n, dimensions)
+            num_vectors: Expected index size, used to size IVF lists
+        """
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        description = factory_string(self._config, len(embeddings), num_vectors)
+        logger.info(f"Building FAISS index {description} on {len(embeddings)} vectors")
+        base = faiss.index_factory(
+            self._config.dimensions, description, faiss.METRIC_INNER_PRODUCT
+        )
+        if isinstance(base, faiss.IndexHNSW):
+            base.hnsw.efConstruction = self._config.ef_construction
+        if not base.is_trained:
+            base.train(embeddings)
+        self._index = faiss.IndexIDMap2(base)
+        self._mapped = False
+        self._apply_search_params()
+
+    @synchronized
+    def add(self, nodes: List[BaseNode], **add_kwargs: Any) -> List[str]:
+        """Add nodes with embeddings to the index.
+
+        Args:
+            nodes: Nodes with embeddings
+
+        Returns:
+            Node IDs, used as vector store IDs
+        """
+        if not nodes:
+            return []
+        node_ids = [node.node_id for node in nodes]
+        self.add_embeddings(
+            [int(node_id) for node_id in node_ids],
+            np.asarray([node.get_embedding() for node in nodes], dtype=np.float32),
+        )
+        return node_ids
+
+    @synchronized
+    def add_embeddings(self, node_ids: Sequence[int], embeddings: np.ndarray):
+        """Add embeddings keyed by node ID, replacing existing ones.
+
+        Args:
+            node_ids: Non-negative integer node IDs
+            embeddings: Embeddings of shape (len(node_ids), dimensions)
+        """
+        node_ids = np.asarray(node_ids, dtype=np.int64)
+        if not len(node_ids):
+            return
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if self._index is None:
+            self.train(embeddings)
+        self._ensure_writable()
+
+        # FAISS IDs must stay unique, so replaced vectors are removed first
+        self.delete_nodes(node_ids.tolist())
+        if self._tombstones.intersection(node_ids.tolist()):
+            self.compact()
+        self._index.add_with_ids(embeddings, node_ids)
+        self._mark_live(node_ids)
+
+    def _mark_live(self, node_ids: np.ndarray):
+        if len(node_ids) and node_ids.max() >= len(self._live):
+            grown = np.zeros(max(node_ids.max() + 1, 2 * len(self._live)), dtype=bool)
+            grown[: len(self._live)] = self._live
+            self._live = grown
+        self._live[node_ids] = True
+        self._num_live += len(node_ids)
+        self._search_filter = None
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        """Delete by reference document is not tracked; use `delete_nodes()`."""
+        raise NotImplementedError(
+            "Delete by ref_doc_id is not supported, use delete_nodes()"
+        )
+
+    @synchronized
+    def delete_nodes(
+        self,
+        node_ids: Optional[Iterable[int]] = None,
+        filters: Optional[Any] = None,
+        **delete_kwargs: Any,
+    ) -> None:
+        """Tombstone nodes so they are no longer returned.
+
+        Args:
+            node_ids: IDs of nodes to delete; unknown IDs are ignored
+        """
+        if filters is not None:
+            raise ValueError("Metadata filters are not supported for FAISS deletes")
+        ids = np.fromiter((int(node_id) for node_id in node_ids or []), dtype=np.int64)
+        ids = np.unique(ids[(ids >= 0) & (ids < len(self._live))])
+        ids = ids[self._live[ids]]
+        self._live[ids] = False
+        self._num_live -= len(ids)
+        self._tombstones.update(ids.tolist())
+        self._search_filter = None
+
+    @property
+    def memory_bytes(self) -> int:
+        """Approximate memory held by the index and its ID map, in bytes."""
+        if self._index is None:
+            return 0
+        ntotal = self._index.ntotal
+        base = faiss.downcast_index(self._index.index)
+        if isinstance(base, faiss.IndexHNSW):
+            codes = ntotal * faiss.downcast_index(base.storage).code_size
+            size = base.hnsw.neighbors.size() * 4
+        else:
+            codes = ntotal * base.code_size
+            size = 0
+        # Mapped codes live in the page cache shared with other processes
+        if not self._mapped:
+            size += codes
+        if isinstance(base, faiss.IndexIVF):
+            # Coarse centroids and the inverted lists' IDs
+            size += base.nlist * base.d * 4 + ntotal * 8
+            if isinstance(base, faiss.IndexIVFPQ):
+                size += base.pq.M * base.pq.ksub * base.pq.dsub * 4
+        # FAISS ID map and the live flags
+        return size + ntotal * 8 + self._live.nbytes
+
+    @synchronized
+    def reconstruct(self, node_ids: Sequence[int]) -> np.ndarray:
+        """Stored vectors of live nodes.
+
+        PQ indexes return their decoded, approximate vectors. IVF indexes
+        build a map from position to list entry on first use, 8 bytes per
+        vector, which is kept until the index is compacted.
+
+        Args:
+            node_ids: IDs of live nodes
+
+        Returns:
+            Array of shape (len(node_ids), dimensions)
+
+        Raises:
+            KeyError: If a node has no live vector
+        """
+        ids = np.asarray(node_ids, dtype=np.int64)
+        known = (ids >= 0) & (ids < len(self._live))
+        known[known] = self._live[ids[known]]
+        if not known.all():
+            raise KeyError(int(ids[~known][0]))
+        if not len(ids):
+            return np.zeros((0, self._config.dimensions), dtype=np.float32)
+        base = faiss.downcast_index(self._index.index)
+        if (
+            isinstance(base, faiss.IndexIVF)
+            and base.direct_map.type == faiss.DirectMap.NoMap
+        ):
+            base.make_direct_map()
+        return self._index.reconstruct_batch(ids)
+
+    @property
+    def tombstone_ratio(self) -> float:
+        """Fraction of stored vectors that are tombstoned."""
+        if self._index is None or self._index.ntotal == 0:
+            return 0.0
+        return len(self._tombstones) / self._index.ntotal
+
+    @synchronized
+    def compact(self):
+        """Physically remove tombstoned vectors from the FAISS index."""
+        if not self._tombstones:
+            return
+        removed = len(self._tombstones)
+        ids = np.fromiter(self._tombstones, dtype=np.int64)
+        self._ensure_writable()
+        base = faiss.downcast_index(self._index.index)
+        if isinstance(base, faiss.IndexIVF):
+            self._remove_from_lists(base, ids)
+        else:
+            try:
+                self._index.remove_ids(faiss.IDSelectorBatch(ids))
+            except RuntimeError:
+                # HNSW graphs do not support removal; rebuild from live vectors
+                live_ids = np.flatnonzero(self._live)
+                self._index = self._rebuild(live_ids) if len(live_ids) else None
+        self._tombstones.clear()
+        logger.info(f"Compacted FAISS index: removed {removed} tombstoned vectors")
+
+    def _remove_from_lists(self, base: Any, ids: np.ndarray):
+        """Remove vectors from an IVF index and renumber the rest.
+
+        `IndexIDMap2.remove_ids()` relies on the wrapped index renumbering
+        its vectors after a removal, which IVF indexes don't, so the lists
+        are rewritten here with positions that match the compacted ID map.
+        """
+        id_map = faiss.vector_to_array(self._index.id_map)
+        keep = ~np.isin(id_map, ids)
+        positions = np.cumsum(keep) - 1
+        lists = base.invlists
+        for list_no in range(base.nlist):
+            size = lists.list_size(list_no)
+            if not size:
+                continue
+            list_ids = faiss.rev_swig_ptr(lists.get_ids(list_no), size).copy()
+            codes = faiss.rev_swig_ptr(
+                lists.get_codes(list_no), size * base.code_size
+            ).reshape(size, base.code_size)
+            live = keep[list_ids]
+            new_ids = np.ascontiguousarray(positions[list_ids[live]], dtype=np.int64)
+            new_codes = np.ascontiguousarray(codes[live])
+            lists.resize(list_no, 0)
+            if len(new_ids):
+                lists.add_entries(
+                    list_no,
+                    len(new_ids),
+                    faiss.swig_ptr(new_ids),
+                    faiss.swig_ptr(new_codes),
+                )
+        base.ntotal = self._index.ntotal = int(keep.sum())
+        faiss.copy_array_to_vector(id_map[keep], self._index.id_map)
+        self._index.construct_rev_map()
+        # Positions changed; `reconstruct()` builds the direct map again
+        if base.direct_map.type != faiss.DirectMap.NoMap:
+            base.make_direct_map(False)
+
+    def _ensure_writable(self):
+        """Copy a memory-mapped index into memory before it is modified.
+
+        FAISS aborts the process on writes to mapped storage, so every
+        method that changes the index calls this first.
+        """
+        if not self._mapped:
+            return
+        base = faiss.downcast_index(self._index.index)
+        if isinstance(base, faiss.IndexIVF):
+            # Mapped inverted lists can't be cloned; copy them list by list
+            lists = base.invlists
+            copied = faiss.ArrayInvertedLists(base.nlist, base.code_size)
+            for list_no in range(base.nlist):
+                size = lists.list_size(list_no)
+                if size:
+                    copied.add_entries(
+                        list_no, size, lists.get_ids(list_no), lists.get_codes(list_no)
+                    )
+            base.replace_invlists(copied, True)
+            copied.this.disown()
+        else:
+            self._index = faiss.deserialize_index(faiss.serialize_index(self._index))
+            self._apply_search_params()
+        self._mapped = False
+        logger.info("Copied memory-mapped FAISS index into memory for writing")
+
+    def _rebuild(self, live_ids: np.ndarray) -> Any:
+        """Build a fresh index holding only the given vectors."""
+        vectors = self._index.reconstruct_batch(live_ids)
+        self.train(vectors)
+        self._index.add_with_ids(vectors, live_ids)
+        return self._index
+
+    @synchronized
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        """Return the top-k most similar live nodes.
+
+        Args:
+            query: Vector store query with embedding and top-k
+
+        Returns:
+            Query result with node IDs and similarities
+        """
+        if query.filters is not None:
+            raise ValueError("Metadata filters are not supported for FAISS queries")
+        result = self._search([query.query_embedding], query.similarity_top_k)[0]
+        result.ids = [str(node_id) for node_id in result.ids]
+        return result
+
+    @synchronized
+    def query_batch(
+        self, query_embeddings: np.ndarray, k: int
+    ) -> List[VectorStoreQueryResult]:
+        """Search many query embeddings with a single FAISS call.
+
+        Args:
+            query_embeddings: Query embeddings of shape (n, dimensions)
+            k: Number of results per query
+
+        Returns:
+            One query result per embedding with integer node IDs, in input
+            order
+        """
+        return self._search(query_embeddings, k)
+
+    def _search(self, query_embeddings, k: int) -> List[VectorStoreQueryResult]:
+        """Top-k live nodes for each query embedding."""
+        if self._index is None or not self._num_live:
+            return [
+                VectorStoreQueryResult(similarities=[], ids=[])
+                for _ in range(len(query_embeddings))
+            ]
+
+        query_embeddings = np.ascontiguousarray(query_embeddings, dtype=np.float32)
+        scores, ids = self._index.search(
+            query_embeddings,
+            min(k, self._index.ntotal),
+            params=self._search_params(),
+        )
+
+        results = []
+        for row_scores, row_ids in zip(scores, ids):
+            # Missing results are padded with -1
+            found = row_ids >= 0
+            results.append(
+                VectorStoreQueryResult(
+                    similarities=row_scores[found].tolist(),
+                    ids=row_ids[found].tolist(),
+                )
+            )
+        return results
+
+    def _search_params(self) -> Optional[Any]:
+        """FAISS search parameters that skip tombstoned vectors.
+
+        The selector tests node IDs against the live flags packed into a
+        bitmap, so FAISS never returns a tombstoned vector and searches
+        don't slow down as tombstones accumulate. Built on the first search
+        after the live set changes.
+
+        Returns:
+            Search parameters, or None if nothing is tombstoned
+        """
+        if not self._tombstones:
+            return None
+        if self._search_filter is None:
+            base = faiss.downcast_index(self._index.index)
+            if isinstance(base, faiss.IndexIVF):
+                params = faiss.SearchParametersIVF()
+                params.nprobe = base.nprobe
+            elif isinstance(base, faiss.IndexHNSW):
+                params = faiss.SearchParametersHNSW()
+                params.efSearch = base.hnsw.efSearch
+            else:
+                params = faiss.SearchParameters()
+            bitmap = np.packbits(self._live, bitorder="little")
+            selector = faiss.IDSelectorBitmap(len(self._live), faiss.swig_ptr(bitmap))
+            params.sel = selector
+            self._search_filter = (params, selector, bitmap)
+        return self._search_filter[0]
+
+    async def aquery(
+        self, query: VectorStoreQuery, **kwargs: Any
+    ) -> VectorStoreQueryResult:
+        """Run `query()` in a worker thread; FAISS releases the GIL while searching."""
+        return await asyncio.to_thread(self.query, query, **kwargs)
+
+    @synchronized
+    def set_search_params(
+        self, nprobe: Optional[int] = None, ef_search: Optional[int] = None
+    ):
+        """Change query-time search parameters.
+
+        Args:
+            nprobe: Number of IVF lists to visit
+            ef_search: HNSW search beam width
+        """
+        if nprobe is not None:
+            self._config.nprobe = nprobe
+        if ef_search is not None:
+            self._config.ef_search = ef_search
+        self._apply_search_params()
+
+    def _apply_search_params(self):
+        """Push the configured `nprobe`/`efSearch` into the FAISS index."""
+        if self._index is None:
+            return
+        base = faiss.downcast_index(self._index.index)
+        if isinstance(base, faiss.IndexIVF):
+            base.nprobe = self._config.nprobe
+        elif isinstance(base, faiss.IndexHNSW):
+            base.hnsw.efSearch = self._config.ef_search
+        self._search_filter = None
+
+    @synchronized
+    def persist(self, persist_path: str, fs: Optional[Any] = None) -> None:
+        """Write the FAISS index and its metadata.
+
+        Tombstoned vectors are written along with the list of tombstones;
+        removing them is left to `compact()`.
+
+        Args:
+            persist_path: Target file for the FAISS index
+        """
+        os.makedirs(os.path.dirname(persist_path), exist_ok=True)
+        if self._index is not None:
+            faiss.write_index(self._index, persist_path)
+        with open(persist_path + IDS_SUFFIX, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "index_type": self._config.index_type,
+                    "tombstones": sorted(self._tombstones),
+                },
+                f,
+            )
+
+    @classmethod
+    def from_persist_dir(
+        cls, persist_dir: str, embed_config: EmbeddingConfig
+    ) -> "FaissIndexStore":
+        """Load a store written by `persist()` inside a storage directory.
+
+        Args:
+            persist_dir: Storage context directory
+            embed_config: Embedding configuration with query-time settings
+
+        Returns:
+            FaissIndexStore instance
+        """
+        return cls.load(os.path.join(persist_dir, VECTOR_STORE_FILENAME), embed_config)
+
+    @classmethod
+    def load(
+        cls, persist_path: str, embed_config: EmbeddingConfig, mmap: bool = False
+    ) -> "FaissIndexStore":
+        """Load a store written by `persist()`.
+
+        With `mmap`, the vectors (flat and HNSW storage, or IVF inverted
+        lists) are memory-mapped read-only instead of read into memory, so
+        processes loading the same file share them through the page cache.
+        The index is copied into memory on its first modification.
+
+        Args:
+            persist_path: File the FAISS index was written to
+            embed_config: Embedding configuration with query-time settings
+            mmap: Memory-map the index instead of reading it
+
+        Returns:
+            FaissIndexStore instance
+        """
+        with open(persist_path + IDS_SUFFIX, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta["index_type"] != embed_config.index_type:
+            logger.warning(
+                f"Loaded FAISS index type {meta['index_type']} differs from "
+                f"configured {embed_config.index_type}"
+            )
+        faiss_index = None
+        if os.path.exists(persist_path):
+            faiss_index = faiss.read_index(
+                persist_path, _io_flags(meta["index_type"]) if mmap else 0
+            )
+        store = cls(embed_config, faiss_index=faiss_index, mapped=mmap)
+        store.delete_nodes(meta.get("tombstones", []))
+        return store
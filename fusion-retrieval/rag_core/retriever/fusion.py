@@ -0,0 +1,272 @@
+"""Vectorized fusion of ranked result lists"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, replace
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..utils.config import RetrieverConfig
+
+FUSION_MODES = ("reciprocal_rerank", "relative_score", "dist_based_score", "simple")
+
+# Rank offset of reciprocal rank fusion (Cormack et al., 2009)
+RRF_K = 60.0
+# Fused candidates per result that MMR selects from by default
+MMR_CANDIDATE_FACTOR = 4
+
+
+@dataclass(frozen=True)
+class FusionParams:
+    """Fusion settings of one retrieval.
+
+    Attributes:
+        mode: Fusion mode, one of `FUSION_MODES`
+        vector_weight: Weight of the vector retriever
+        bm25_weight: Weight of the BM25 retriever
+        top_k: Number of fused results
+        vector_top_k: Vector candidates per query; defaults to `top_k`
+        bm25_top_k: BM25 candidates per query; defaults to `top_k`
+        mmr: Select the results from the fused candidates by maximal
+            marginal relevance
+        mmr_lambda: Weight of relevance against diversity in MMR, from 0
+            (most diverse) to 1 (fused order)
+        mmr_candidates: Fused candidates MMR selects from; defaults to
+            `MMR_CANDIDATE_FACTOR * top_k`
+    """
+
+    mode: str = "dist_based_score"
+    vector_weight: float = 0.6
+    bm25_weight: float = 0.4
+    top_k: int = 2
+    vector_top_k: Optional[int] = None
+    bm25_top_k: Optional[int] = None
+    mmr: bool = False
+    mmr_lambda: float = 0.5
+    mmr_candidates: Optional[int] = None
+
+    def __post_init__(self):
+        if self.mode not in FUSION_MODES:
+            raise ValueError(
+                f"Invalid fusion mode {self.mode!r}, expected one of {FUSION_MODES}"
+            )
+        if self.vector_weight < 0 or self.bm25_weight < 0:
+            raise ValueError("Retriever weights must not be negative")
+        if self.vector_weight + self.bm25_weight <= 0:
+            raise ValueError("At least one retriever weight must be positive")
+        if not 0 <= self.mmr_lambda <= 1:
+            raise ValueError("mmr_lambda must be between 0 and 1")
+        for name in ("top_k", "vector_top_k", "bm25_top_k", "mmr_candidates"):
+            value = getattr(self, name)
+            if value is not None and value < 1:
+                raise ValueError(f"{name} must be positive")
+
+    @classmethod
+    def from_config(cls, config: RetrieverConfig) -> "FusionParams":
+        return cls(
+            mode=config.mode,
+            vector_weight=config.vector_weight,
+            bm25_weight=config.bm25_weight,
+            top_k=config.similarity_top_k,
+            vector_top_k=config.vector_top_k,
+            bm25_top_k=config.bm25_top_k,
+            mmr=config.mmr,
+            mmr_lambda=config.mmr_lambda,
+            mmr_candidates=config.mmr_candidates,
+        )
+
+    def override(self, **changes) -> "FusionParams":
+        """Copy with the given non-None settings replaced.
+
+        Args:
+            **changes: Field values to change; None values are ignored
+
+        Returns:
+            New, validated fusion settings
+        """
+        changes = {name: value for name, value in changes.items() if value is not None}
+        return replace(self, **changes) if changes else self
+
+    @property
+    def weights(self) -> Tuple[float, float]:
+        """Vector and BM25 weights, normalized to sum to one."""
+        total = self.vector_weight + self.bm25_weight
+        return self.vector_weight / total, self.bm25_weight / total
+
+    @property
+    def fused_k(self) -> int:
+        """Number of fused candidates; MMR selects `top_k` of them."""
+        if not self.mmr:
+            return self.top_k
+        return max(self.mmr_candidates or MMR_CANDIDATE_FACTOR * self.top_k, self.top_k)
+
+    @property
+    def candidate_k(self) -> Tuple[int, int]:
+        """Vector and BM25 candidate depths."""
+        return self.vector_top_k or self.fused_k, self.bm25_top_k or self.fused_k
+
+
+def fuse(
+    ids: Sequence[Sequence[int]],
+    scores: Sequence[Sequence[float]],
+    weights: Sequence[float],
+    mode: str,
+    top_k: int,
+) -> Tuple[List[int], np.ndarray]:
+    """Merge ranked result lists into one top-k list.
+
+    Each result list is sorted best first. Scores are normalized per list
+    (min-max for `relative_score`, mean +/- 3 standard deviations for
+    `dist_based_score`, 1 / (rank + 60) for `reciprocal_rerank`), scaled by
+    the list's weight and summed per ID; reciprocal rank weights are taken
+    relative to their mean. `simple` keeps the maximum raw score of an ID
+    and ignores weights. Ties keep the order in which IDs first appear.
+
+    Args:
+        ids: One sequence of integer node IDs per result list
+        scores: Scores matching `ids`
+        weights: Weight of each result list
+        mode: Fusion mode, one of `FUSION_MODES`
+        top_k: Number of results to keep
+
+    Returns:
+        Fused IDs, best first, and their fused scores
+    """
+    lengths = np.fromiter((len(list_ids) for list_ids in ids), dtype=np.int64)
+    if not lengths.sum():
+        return [], np.empty(0)
+
+    all_ids = np.concatenate([np.asarray(list_ids, dtype=np.int64) for list_ids in ids])
+    raw = np.concatenate(
+        [np.asarray(list_scores, dtype=np.float64) for list_scores in scores]
+    )
+    # Position of each entry's result list, and its rank within that list
+    lists = np.repeat(np.arange(len(lengths)), lengths)
+    ranks = np.arange(len(raw)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+
+    unique_ids, first, inverse = np.unique(
+        all_ids, return_index=True, return_inverse=True
+    )
+    if mode == "simple":
+        fused = np.full(len(unique_ids), -np.inf)
+        np.maximum.at(fused, inverse, raw)
+    else:
+        weights = np.asarray(weights, dtype=np.float64)
+        if mode == "reciprocal_rerank":
+            normalized = 1.0 / (ranks + RRF_K)
+            # Relative to the mean weight, so equal weights give plain RRF
+            weights = weights / weights.mean()
+        elif mode in ("relative_score", "dist_based_score"):
+            normalized = _normalize(raw, lists, lengths, mode == "dist_based_score")
+        else:
+            raise ValueError(f"Invalid fusion mode: {mode}")
+        contributions = normalized * weights[lists]
+        fused = np.bincount(inverse, weights=contributions, minlength=len(unique_ids))
+
+    if len(fused) > top_k:
+        best = np.argpartition(-fused, top_k - 1)[:top_k]
+        # Keep every candidate tied with the k-th score so ties resolve by order
+        best = np.flatnonzero(fused >= fused[best].min())
+    else:
+        best = np.arange(len(fused))
+    order = best[np.lexsort((first[best], -fused[best]))][:top_k]
+    return unique_ids[order].tolist(), fused[order]
+
+
+def merge_candidates(
+    ids: Sequence[Sequence[int]], scores: Sequence[Sequence[float]]
+) -> Tuple[List[int], np.ndarray]:
+    """Merge candidate lists of one retriever into a single list.
+
+    Used for the lists a retriever returns for the variants of one query:
+    an ID found by several variants is kept once, with its best score.
+
+    Args:
+        ids: One sequence of integer node IDs per result list
+        scores: Scores matching `ids`
+
+    Returns:
+        Distinct IDs, best first, and their scores
+    """
+    total = sum(len(list_ids) for list_ids in ids)
+    return fuse(ids, scores, [1.0] * len(ids), "simple", max(total, 1))
+
+
+def mmr(
+    embeddings: np.ndarray, scores: Sequence[float], top_k: int, lambda_: float
+) -> np.ndarray:
+    """Select a diverse subset of candidates by maximal marginal relevance.
+
+    Candidates are picked greedily by `lambda_ * relevance - (1 - lambda_)
+    * similarity`, where similarity is the highest cosine similarity to
+    an already picked candidate. Relevance is the candidates' scores
+    min-max scaled to [0, 1], so `lambda_` means the same in every fusion
+    mode. All pairwise similarities come from one matrix product; each
+    pick then only updates a running maximum.
+
+    Args:
+        embeddings: Candidate embeddings, shape (n, dimensions)
+        scores: Candidate scores, higher is more relevant
+        top_k: Number of candidates to select
+        lambda_: Weight of relevance against diversity, from 0 to 1
+
+    Returns:
+        Positions of the selected candidates, in selection order
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    k = min(top_k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors = vectors / np.maximum(norms, 1e-12)
+    similarity = vectors @ vectors.T
+
+    span = scores.max() - scores.min()
+    relevance = (scores - scores.min()) / span if span > 0 else np.ones_like(scores)
+    relevance *= lambda_
+    selected = np.empty(k, dtype=np.int64)
+    picked = np.zeros(len(scores), dtype=bool)
+    max_similarity = np.zeros(len(scores), dtype=np.float32)
+    for step in range(k):
+        gain = relevance - (1 - lambda_) * max_similarity
+        gain[picked] = -np.inf
+        best = int(np.argmax(gain))
+        selected[step] = best
+        picked[best] = True
+        if step:
+            np.maximum(max_similarity, similarity[best], out=max_similarity)
+        else:
+            max_similarity = similarity[best].copy()
+    return selected
+
+
+def _normalize(
+    scores: np.ndarray, lists: np.ndarray, lengths: np.ndarray, dist_based: bool
+) -> np.ndarray:
+    """Scale the scores of each result list to [0, 1]."""
+    counts = np.maximum(lengths, 1)
+    if dist_based:
+        mean = np.bincount(lists, weights=scores, minlength=len(lengths)) / counts
+        variance = (
+            np.bincount(
+                lists, weights=(scores - mean[lists]) ** 2, minlength=len(lengths)
+            )
+            / counts
+        )
+        low = mean - 3 * np.sqrt(variance)
+        high = mean + 3 * np.sqrt(variance)
+    else:
+        low = np.full(len(lengths), np.inf)
+        high = np.full(len(lengths), -np.inf)
+        np.minimum.at(low, lists, scores)
+        np.maximum.at(high, lists, scores)
+
+    span = (high - low)[lists]
+    flat = span == 0
+    normalized = np.empty_like(scores)
+    np.divide(scores - low[lists], span, out=normalized, where=~flat)
+    # A list whose scores are all equal counts fully if they are positive
+    normalized[flat] = (high[lists][flat] > 0).astype(np.float64)
+    return normalized
@@ -1,22 +1,151 @@
 """Document loading utilities"""
 
+import glob
+import multiprocessing
+import os
+from collections import Counter, defaultdict
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
 from pathlib import Path
-from typing import List
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
 
 from llama_index.core.readers import SimpleDirectoryReader
+from llama_index.core.readers.file.base import default_file_metadata_func
 from llama_index.core.schema import Document
 
 from ..utils.logging import get_logger
+from ..utils.metrics import count_items, stage_timer
 
 logger = get_logger(__name__)
 
+# File metadata kept out of embedding and LLM text, as SimpleDirectoryReader does
+EXCLUDED_FILE_METADATA = [
+    "file_name",
+    "file_type",
+    "file_size",
+    "creation_date",
+    "last_modified_date",
+    "last_accessed_date",
+]
+
+# Below this many tasks per worker, files are parsed without a process pool
+MIN_TASKS_PER_WORKER = 2
+
+# A load task: (file path, first page, end page); pages are None for whole files
+LoadTask = Tuple[str, Optional[int], Optional[int]]
+
+Source = Union[str, os.PathLike, Sequence[Union[str, os.PathLike]]]
+
+
+def resolve_paths(
+    source: Source, required_exts: Optional[List[str]] = None
+) -> List[Path]:
+    """Expand a loader source into the exact list of files to read.
+
+    Args:
+        source: A file, a directory (searched recursively), a glob pattern,
+            or a list of any of these
+        required_exts: Extensions to keep when expanding directories and
+            globs (e.g. ['.pdf']); all files are kept if None
+
+    Returns:
+        Sorted, de-duplicated file paths
+    """
+    sources = [source] if isinstance(source, (str, os.PathLike)) else list(source)
+    exts = {ext.lower() for ext in required_exts} if required_exts else None
+
+    def wanted(path: Path) -> bool:
+        return (
+            path.is_file()
+            and not path.name.startswith(".")
+            and (exts is None or path.suffix.lower() in exts)
+        )
+
+    paths: Dict[Path, None] = {}
+    for item in sources:
+        item = str(item)
+        path = Path(item)
+        if path.is_file():
+            paths[path.resolve()] = None
+        elif path.is_dir():
+            for child in sorted(path.rglob("*")):
+                if wanted(child):
+                    paths[child.resolve()] = None
+        elif glob.has_magic(item):
+            for match in sorted(glob.glob(item, recursive=True)):
+                if wanted(Path(match)):
+                    paths[Path(match).resolve()] = None
+        else:
+            raise FileNotFoundError(f"No such file or directory: {item}")
+    return sorted(paths)
+
+
+def _load_file(path: str) -> List[Document]:
+    """Load a whole file with the reader SimpleDirectoryReader picks for it."""
+    reader = SimpleDirectoryReader(input_files=[path], raise_on_error=True)
+    return reader.load_data()
+
+
+def _pdf_page_count(path: str) -> int:
+    from pypdf import PdfReader
+
+    return len(PdfReader(path).pages)
+
+
+def _load_pdf_pages(path: str, start: int, end: int) -> List[Document]:
+    """Load pages [start, end) of a PDF as one document per page.
+
+    Produces the same text and metadata as the PDF reader used by
+    SimpleDirectoryReader, so page ranges of one file can be parsed in
+    separate processes.
+    """
+    from pypdf import PdfReader
+
+    pdf = PdfReader(path)
+    file_metadata = default_file_metadata_func(path)
+    documents = []
+    for page in range(start, min(end, len(pdf.pages))):
+        document = Document(
+            text=pdf.pages[page].extract_text(),
+            metadata={
+                "page_label": pdf.page_labels[page],
+                "file_name": Path(path).name,
+                **file_metadata,
+            },
+        )
+        document.excluded_embed_metadata_keys.extend(EXCLUDED_FILE_METADATA)
+        document.excluded_llm_metadata_keys.extend(EXCLUDED_FILE_METADATA)
+        documents.append(document)
+    return documents
+
+
+def _run_task(task: LoadTask) -> List[Document]:
+    path, start, end = task
+    if start is None:
+        return _load_file(path)
+    return _load_pdf_pages(path, start, end)
+
 
 class DocumentLoader:
-    """Handles loading documents from various sources."""
+    """Handles loading documents from various sources.
+
+    Files are parsed in a process pool: one task per file, and PDFs longer
+    than `pdf_pages_per_task` are split into page ranges so a single large
+    file is spread over several workers too.
+    """
+
+    def __init__(self, max_workers: int = 0, pdf_pages_per_task: int = 32):
+        """Initialize document loader.
+
+        Args:
+            max_workers: Parser processes; 0 uses one per CPU core
+            pdf_pages_per_task: Pages of a PDF parsed per task (0 disables
+                splitting PDFs)
+        """
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.pdf_pages_per_task = pdf_pages_per_task
 
-    @staticmethod
     def load_from_directory(
-        input_dir: str, required_exts: List[str] = None
+        self, input_dir: str, required_exts: List[str] = None
     ) -> List[Document]:
         """Load documents from a directory.
 
@@ -31,26 +160,166 @@ class DocumentLoader:
             required_exts = [".pdf"]
 
         logger.info(f"Loading documents from {input_dir}")
-        reader = SimpleDirectoryReader(input_dir=input_dir, required_exts=required_exts)
-        documents = reader.load_data()
-        logger.info(f"Loaded {len(documents)} documents")
-        return documents
+        return self.load_files(resolve_paths(input_dir, required_exts))
 
-    @staticmethod
-    def load_from_file(file_path: str) -> List[Document]:
+    def load_from_file(self, file_path: str) -> List[Document]:
         """Load a single document from file path.
 
         Args:
             file_path: Path to the document file
 
         Returns:
-            List containing the loaded document
+            Documents read from exactly this file (one per page for PDFs)
         """
-        file_path_obj = Path(file_path)
-        input_dir = str(file_path_obj.parent)
-        required_exts = [file_path_obj.suffix]
-
         logger.info(f"Loading document from {file_path}")
-        return DocumentLoader.load_from_directory(input_dir, required_exts)
+        if not Path(file_path).is_file():
+            raise FileNotFoundError(f"No such file: {file_path}")
+        return self.load_files([file_path])
 
+    def load(
+        self, source: Source, required_exts: Optional[List[str]] = None
+    ) -> List[Document]:
+        """Load a file, a directory, a glob pattern or a list of these.
+
+        Args:
+            source: What to load, see `resolve_paths()`
+            required_exts: Extensions to keep when expanding directories
+                and globs
+
+        Returns:
+            List of loaded documents, ordered by file and page
+        """
+        logger.info(f"Loading documents from {source}")
+        return self.load_files(resolve_paths(source, required_exts))
+
+    def load_files(
+        self, file_paths: Iterable[Union[str, os.PathLike]]
+    ) -> List[Document]:
+        """Load exactly the given files.
+
+        Args:
+            file_paths: Paths of the files to load
+
+        Returns:
+            List of loaded documents, ordered by file and page
+        """
+        with stage_timer("load"):
+            tasks = self._plan([str(path) for path in file_paths])
+            results = {i: docs for i, docs in self._run(tasks) if docs is not None}
+            documents = [doc for i in sorted(results) for doc in results[i]]
+        count_items("load", len(documents))
+        logger.info(f"Loaded {len(documents)} documents")
+        return documents
+
+    def iter_documents(
+        self, source: Source, required_exts: Optional[List[str]] = None
+    ) -> Iterator[Document]:
+        """Load documents, yielding them as soon as their task finishes.
+
+        Args:
+            source: What to load, see `resolve_paths()`
+            required_exts: Extensions to keep when expanding directories
+                and globs
+
+        Yields:
+            Loaded documents in completion order
+        """
+        paths = resolve_paths(source, required_exts)
+        tasks = self._plan([str(path) for path in paths])
+        for _, documents in self._run(tasks):
+            yield from documents or []
+
+    def iter_files(
+        self, file_paths: Iterable[Union[str, os.PathLike]]
+    ) -> Iterator[Tuple[str, List[Document]]]:
+        """Load files, yielding each one as soon as all of its pages are parsed.
+
+        Files whose parsing fails, even partially, are logged and skipped,
+        so a yielded file is always complete.
+
+        Args:
+            file_paths: Paths of the files to load
+
+        Yields:
+            (file path, documents ordered by page) in completion order
+        """
+        tasks = self._plan([str(path) for path in file_paths])
+        remaining = Counter(path for path, _, _ in tasks)
+        parts: Dict[str, Dict[int, List[Document]]] = defaultdict(dict)
+        failed = set()
+        for i, documents in self._run(tasks):
+            path = tasks[i][0]
+            if documents is None:
+                failed.add(path)
+            else:
+                parts[path][i] = documents
+            remaining[path] -= 1
+            if remaining[path] == 0:
+                file_parts = parts.pop(path, {})
+                if path in failed:
+                    logger.warning(f"Skipping {path}: some of its pages failed to load")
+                    continue
+                documents = [doc for j in sorted(file_parts) for doc in file_parts[j]]
+                count_items("load", len(documents))
+                yield path, documents
+
+    def _plan(self, file_paths: List[str]) -> List[LoadTask]:
+        """Split files into load tasks, PDFs by page range."""
+        logger.info(f"Loading {len(file_paths)} files")
+        tasks: List[LoadTask] = []
+        step = self.pdf_pages_per_task
+        for path in file_paths:
+            if step > 0 and path.lower().endswith(".pdf"):
+                try:
+                    num_pages = _pdf_page_count(path)
+                except Exception as e:
+                    logger.warning(f"Could not read {path}: {e}")
+                    continue
+                tasks.extend(
+                    (path, start, start + step) for start in range(0, num_pages, step)
+                )
+            else:
+                tasks.append((path, None, None))
+        return tasks
+
+    def _run(
+        self, tasks: List[LoadTask]
+    ) -> Iterator[Tuple[int, Optional[List[Document]]]]:
+        """Run load tasks, yielding (task index, documents) as they finish.
+
+        A task that fails is logged and yields None instead of documents.
+        Small loads run in this process: starting a worker costs about as
+        much as parsing a few dozen pages, so the pool only pays off with
+        several tasks per worker.
+        """
+        workers = min(self.max_workers, len(tasks))
+        if workers <= 1 or len(tasks) < MIN_TASKS_PER_WORKER * self.max_workers:
+            for i, task in enumerate(tasks):
+                try:
+                    documents = _run_task(task)
+                except Exception as e:
+                    logger.warning(f"Failed to load {task[0]}: {e}")
+                    documents = None
+                yield i, documents
+            return
 
+        # Spawned workers do not inherit locks held by the parent's threads
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            # Keep a bounded number of tasks queued so results stream out
+            pending: Dict[Future, int] = {}
+            next_task = 0
+            while pending or next_task < len(tasks):
+                while next_task < len(tasks) and len(pending) < workers * 2:
+                    future = pool.submit(_run_task, tasks[next_task])
+                    pending[future] = next_task
+                    next_task += 1
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    i = pending.pop(future)
+                    try:
+                        documents = future.result()
+                    except Exception as e:
+                        logger.warning(f"Failed to load {tasks[i][0]}: {e}")
+                        documents = None
+                    yield i, documents
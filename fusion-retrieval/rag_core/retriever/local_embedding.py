@@ -0,0 +1,140 @@
+"""Offline CPU embedding model over hashed n-gram features"""
+
+from __future__ import annotations
+
+import re
+import zlib
+from typing import Dict, List, Sequence
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+# Hash bit that gives a feature its sign; buckets use the low bits
+_SIGN_BIT = np.uint32(1 << 31)
+
+
+def _word_features(word: str) -> List[str]:
+    """A word and its character trigrams.
+
+    Trigrams are taken from the word padded with `<` and `>`, and are
+    prefixed with `#` so they never share a hash with a whole word.
+    """
+    padded = f"<{word}>"
+    return [word] + [f"#{padded[i : i + 3]}" for i in range(len(padded) - 2)]
+
+
+def _crc32(strings: Sequence[str]) -> np.ndarray:
+    return np.fromiter(
+        (zlib.crc32(string.encode("utf-8")) for string in strings),
+        dtype=np.uint32,
+        count=len(strings),
+    )
+
+
+class HashedNgramEmbedding(BaseEmbedding):
+    """Embedding model that hashes the n-grams of a text, fully on CPU.
+
+    A text is split into lowercase words, and its features are the words,
+    their character trigrams and the pairs of adjacent words. Each feature
+    is hashed with CRC32 into one of `dimensions` buckets, with a sign
+    taken from the hash, which amounts to a random projection of the
+    sparse n-gram counts. Bucket values are damped with a signed `log1p`
+    and vectors are L2-normalized, so inner products are cosine
+    similarities.
+
+    The model has nothing to fit or download: it works offline, gives the
+    same vector for a text in every process, and embeds queries and
+    documents alike. Within a batch, the features of each distinct word
+    are hashed once and gathered for its occurrences with NumPy, and all
+    vectors are built by one `np.bincount`.
+    """
+
+    dimensions: int = 512
+
+    def __init__(self, dimensions: int = 512, embed_batch_size: int = 512):
+        """Initialize hashed n-gram embedding model.
+
+        Args:
+            dimensions: Number of hash buckets, i.e. embedding dimensions
+            embed_batch_size: Number of texts embedded at once
+        """
+        super().__init__(
+            model_name="hashed-ngrams",
+            dimensions=dimensions,
+            embed_batch_size=embed_batch_size,
+        )
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "HashedNgramEmbedding"
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """Embed a batch of texts.
+
+        Args:
+            texts: Texts to embed
+
+        Returns:
+            Array of shape (len(texts), dimensions); texts without any word
+            get a zero vector
+        """
+        vocabulary: Dict[str, int] = {}
+        word_ids: List[int] = []
+        bigrams: List[str] = []
+        word_counts = np.zeros(len(texts), dtype=np.int64)
+        for i, text in enumerate(texts):
+            words = _TOKEN_PATTERN.findall(text.lower())
+            word_ids += [vocabulary.setdefault(word, len(vocabulary)) for word in words]
+            bigrams += [f"{first} {second}" for first, second in zip(words, words[1:])]
+            word_counts[i] = len(words)
+
+        features: List[str] = []
+        sizes = np.zeros(len(vocabulary), dtype=np.int64)
+        for j, word in enumerate(vocabulary):
+            word_features = _word_features(word)
+            features += word_features
+            sizes[j] = len(word_features)
+        word_hashes = _crc32(features)
+        # Gather the feature hashes of every word occurrence
+        occurrences = np.asarray(word_ids, dtype=np.int64)
+        lengths = sizes[occurrences]
+        starts = np.cumsum(sizes) - sizes
+        positions = np.arange(lengths.sum()) + np.repeat(
+            starts[occurrences] - (np.cumsum(lengths) - lengths), lengths
+        )
+        hashes = np.concatenate([word_hashes[positions], _crc32(bigrams)])
+        text_ids = np.arange(len(texts), dtype=np.int64)
+        rows = np.concatenate(
+            [
+                np.repeat(np.repeat(text_ids, word_counts), lengths),
+                np.repeat(text_ids, np.maximum(word_counts - 1, 0)),
+            ]
+        )
+
+        buckets = rows * self.dimensions + hashes % self.dimensions
+        signs = np.where(hashes & _SIGN_BIT, -1.0, 1.0)
+        vectors = np.bincount(
+            buckets, weights=signs, minlength=len(texts) * self.dimensions
+        ).reshape(len(texts), self.dimensions)
+        vectors = np.sign(vectors) * np.log1p(np.abs(vectors))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return (vectors / np.maximum(norms, 1e-12)).astype(np.float32)
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        return self.embed([query])[0].tolist()
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        return self._get_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self.embed([text])[0].tolist()
+
+    async def _aget_text_embedding(self, text: str) -> Embedding:
+        return self._get_text_embedding(text)
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        return self.embed(texts).tolist()
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        return self._get_text_embeddings(texts)
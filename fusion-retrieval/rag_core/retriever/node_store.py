@@ -0,0 +1,863 @@
+"""Node stores: compact in-memory arrays or an on-disk SQLite database"""
+
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import uuid
+import weakref
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+import numpy as np
+from llama_index.core.schema import (
+    BaseNode,
+    NodeRelationship,
+    RelatedNodeInfo,
+    TextNode,
+)
+
+from ..utils.concurrency import synchronized
+from ..utils.config import NodeStoreConfig, _resolve_path
+from ..utils.logging import get_logger
+
+logger = get_logger(__name__)
+
+NODES_META_FILENAME = "nodes.json"
+TEXT_FILENAME = "text.bin"
+NODE_ARRAY_NAMES = ("text_spans", "char_spans", "alive", "sources", "layouts")
+NODES_DB_FILENAME = "nodes.sqlite"
+NODE_STORE_BACKENDS = ("memory", "sqlite")
+
+# Approximate size of one entry of an intern table
+_PY_ENTRY_BYTES = 120
+# Approximate size of a cached TextNode besides its text
+_PY_NODE_BYTES = 1500
+# SQLite caps the number of bound parameters per statement
+_SQL_BATCH_SIZE = 500
+
+
+@dataclass(frozen=True)
+class _Layout:
+    """Node fields that are the same for most nodes of a document."""
+
+    metadata_keys: Tuple[str, ...]
+    excluded_embed_metadata_keys: Tuple[str, ...]
+    excluded_llm_metadata_keys: Tuple[str, ...]
+    metadata_template: str
+    metadata_separator: str
+    text_template: str
+
+    @classmethod
+    def of(cls, node: TextNode) -> "_Layout":
+        return cls(
+            metadata_keys=tuple(node.metadata),
+            excluded_embed_metadata_keys=tuple(node.excluded_embed_metadata_keys),
+            excluded_llm_metadata_keys=tuple(node.excluded_llm_metadata_keys),
+            metadata_template=node.metadata_template,
+            metadata_separator=node.metadata_separator,
+            text_template=node.text_template,
+        )
+
+
+def _json_key(value: Any) -> str:
+    # Metadata values may be unhashable; their JSON form is not
+    return json.dumps(value, sort_keys=True)
+
+
+def _hashable(value: Hashable) -> Hashable:
+    return value
+
+
+class _InternTable:
+    """Distinct values with a stable integer code each."""
+
+    def __init__(
+        self,
+        values: Iterable[Any] = (),
+        key: Callable[[Any], Hashable] = _json_key,
+    ):
+        """Initialize table.
+
+        Args:
+            values: Initial values, coded in order
+            key: Hashable form of a value; equal keys share a code
+        """
+        self._key = key
+        self.values: List[Any] = list(values)
+        self._codes = {key(value): code for code, value in enumerate(self.values)}
+
+    def code(self, value: Any) -> int:
+        key = self._key(value)
+        code = self._codes.get(key)
+        if code is None:
+            code = self._codes[key] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+def _reserve(array: np.ndarray, size: int, fill: Any) -> np.ndarray:
+    """The array itself if it holds `size` rows, else a grown copy."""
+    if size <= len(array):
+        return array
+    grown = np.full((max(size, 2 * len(array)), *array.shape[1:]), fill, array.dtype)
+    grown[: len(array)] = array
+    return grown
+
+
+def _is_mapped(array: np.ndarray) -> bool:
+    """Whether an array is a view of a memory-mapped file."""
+    while isinstance(array, np.ndarray):
+        if isinstance(array, np.memmap):
+            return True
+        array = array.base
+    return False
+
+
+class BaseNodeStore(ABC):
+    """Text nodes addressed by dense integer node IDs.
+
+    IDs are assigned by `add()` in increasing order and never reused, so
+    the FAISS and BM25 indexes key their entries by the same integers.
+    Nodes are only rebuilt as `TextNode` objects when looked up, e.g. for
+    the final top-k of a query; their `node_id` is the integer ID as a
+    string. Deleted nodes keep their ID slot. All public methods are
+    thread-safe.
+    """
+
+    def __init__(self):
+        """Initialize an empty store."""
+        self._size = 0
+        self._num_live = 0
+        self._alive = np.zeros(0, dtype=bool)
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return self._num_live
+
+    def __contains__(self, node_id: object) -> bool:
+        return (
+            isinstance(node_id, (int, np.integer))
+            and 0 <= node_id < self._size
+            and bool(self._alive[node_id])
+        )
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.node_ids().tolist())
+
+    def __getitem__(self, node_id: int) -> TextNode:
+        return self.get_many([node_id])[0]
+
+    @property
+    @abstractmethod
+    def memory_bytes(self) -> int:
+        """Approximate memory held by the store, in bytes."""
+
+    def node_ids(self) -> np.ndarray:
+        """IDs of the live nodes, in increasing order."""
+        with self._lock:
+            return np.flatnonzero(self._alive[: self._size])
+
+    @abstractmethod
+    def add(self, nodes: Sequence[BaseNode]) -> np.ndarray:
+        """Store nodes under new IDs.
+
+        Each node's `id_` is set to its new ID, so the caller's node
+        objects match the ones `get_many()` rebuilds.
+
+        Args:
+            nodes: Text nodes to store
+
+        Returns:
+            The new node IDs, in input order
+        """
+
+    @synchronized
+    def delete(self, node_ids: Iterable[int]) -> int:
+        """Delete nodes; IDs that are unknown or already deleted are ignored.
+
+        Args:
+            node_ids: IDs of nodes to delete
+
+        Returns:
+            Number of nodes deleted
+        """
+        return len(self._mark_deleted(node_ids))
+
+    def _mark_deleted(self, node_ids: Iterable[int]) -> np.ndarray:
+        """Flag live nodes as deleted and return their IDs."""
+        node_ids = np.unique(np.asarray(list(node_ids), dtype=np.int64))
+        node_ids = node_ids[(node_ids >= 0) & (node_ids < self._size)]
+        node_ids = node_ids[self._alive[node_ids]]
+        self._alive[node_ids] = False
+        self._num_live -= len(node_ids)
+        return node_ids
+
+    @abstractmethod
+    def get_many(self, node_ids: Iterable[int]) -> List[TextNode]:
+        """Rebuild nodes.
+
+        Args:
+            node_ids: IDs of live nodes
+
+        Returns:
+            Nodes in input order
+
+        Raises:
+            KeyError: If a node does not exist or was deleted
+        """
+
+    @abstractmethod
+    def compact(self):
+        """Release the storage of deleted nodes."""
+
+    @abstractmethod
+    def persist(self, persist_dir: str | os.PathLike[str]):
+        """Write the live nodes to a directory.
+
+        Args:
+            persist_dir: Target directory
+        """
+
+
+class NodeStore(BaseNodeStore):
+    """Text nodes in flat in-memory arrays.
+
+    Node texts live in one contiguous UTF-8 buffer with a (start, end)
+    span per node. Metadata is stored as one column of interned value
+    codes per metadata key, and the rest of a node (metadata key order,
+    excluded keys and templates, source document, character offsets) as
+    interned or integer columns too, so a node costs a few dozen bytes
+    besides its text instead of a Python object graph. The text of
+    deleted nodes is dropped when the store is compacted or persisted.
+    """
+
+    def __init__(self):
+        """Initialize an empty store."""
+        super().__init__()
+        # Text of loaded nodes (possibly memory-mapped), then of added ones
+        self._base_text = np.zeros(0, dtype=np.uint8)
+        self._tail_text = bytearray()
+
+        self._text_spans = np.zeros((0, 2), dtype=np.int64)
+        # Character offsets in the source document; -1 if unknown
+        self._char_spans = np.zeros((0, 2), dtype=np.int64)
+        # Codes into the source document and layout tables; -1 if none
+        self._sources = np.zeros(0, dtype=np.int32)
+        self._layouts = np.zeros(0, dtype=np.int32)
+        self._source_table = _InternTable()
+        self._layout_table = _InternTable(key=_hashable)
+        # One column of value codes per metadata key
+        self._metadata: Dict[str, np.ndarray] = {}
+        self._values: Dict[str, _InternTable] = {}
+
+    @property
+    def _base_len(self) -> int:
+        return len(self._base_text)
+
+    @property
+    def memory_bytes(self) -> int:
+        """Approximate memory held by the store, in bytes.
+
+        Memory-mapped arrays are not counted: they live in the page cache,
+        which the OS shares between processes and can reclaim.
+        """
+        with self._lock:
+            arrays = [
+                self._base_text,
+                self._text_spans,
+                self._char_spans,
+                self._alive,
+                self._sources,
+                self._layouts,
+                *self._metadata.values(),
+            ]
+            size = sum(array.nbytes for array in arrays if not _is_mapped(array))
+            entries = len(self._source_table) + len(self._layout_table)
+            entries += sum(len(table) for table in self._values.values())
+            return size + len(self._tail_text) + entries * _PY_ENTRY_BYTES
+
+    @synchronized
+    def add(self, nodes: Sequence[BaseNode]) -> np.ndarray:
+        first = self._size
+        node_ids = np.arange(first, first + len(nodes), dtype=np.int64)
+        self._reserve(first + len(nodes))
+        for node_id, node in zip(node_ids.tolist(), nodes):
+            text = node.get_content().encode("utf-8")
+            start = self._base_len + len(self._tail_text)
+            self._tail_text += text
+            self._text_spans[node_id] = (start, start + len(text))
+            self._char_spans[node_id] = (
+                -1 if node.start_char_idx is None else node.start_char_idx,
+                -1 if node.end_char_idx is None else node.end_char_idx,
+            )
+            source = node.ref_doc_id
+            self._sources[node_id] = (
+                -1 if source is None else self._source_table.code(source)
+            )
+            self._layouts[node_id] = self._layout_table.code(_Layout.of(node))
+            for key, value in node.metadata.items():
+                column = self._column(key)
+                column[node_id] = self._values[key].code(value)
+            node.id_ = str(node_id)
+        self._alive[first : first + len(nodes)] = True
+        self._size += len(nodes)
+        self._num_live += len(nodes)
+        return node_ids
+
+    def _reserve(self, size: int):
+        """Grow every column to hold at least `size` nodes."""
+        self._text_spans = _reserve(self._text_spans, size, 0)
+        self._char_spans = _reserve(self._char_spans, size, -1)
+        self._alive = _reserve(self._alive, size, False)
+        self._sources = _reserve(self._sources, size, -1)
+        self._layouts = _reserve(self._layouts, size, -1)
+        for key, column in self._metadata.items():
+            self._metadata[key] = _reserve(column, size, -1)
+
+    def _column(self, key: str) -> np.ndarray:
+        """Value codes of a metadata key, created on its first use."""
+        column = self._metadata.get(key)
+        if column is None:
+            column = np.full(len(self._alive), -1, dtype=np.int32)
+            self._metadata[key] = column
+            self._values[key] = _InternTable()
+        return column
+
+    @synchronized
+    def get_many(self, node_ids: Iterable[int]) -> List[TextNode]:
+        """Rebuild nodes from their columns.
+
+        Args:
+            node_ids: IDs of live nodes
+
+        Returns:
+            Nodes in input order
+
+        Raises:
+            KeyError: If a node does not exist or was deleted
+        """
+        return [self._materialize(node_id) for node_id in node_ids]
+
+    def _materialize(self, node_id: int) -> TextNode:
+        if node_id not in self:
+            raise KeyError(node_id)
+        layout: _Layout = self._layout_table.values[self._layouts[node_id]]
+        start, end = self._text_spans[node_id].tolist()
+        start_char, end_char = self._char_spans[node_id].tolist()
+        relationships = {}
+        source = self._sources[node_id]
+        if source >= 0:
+            relationships[NodeRelationship.SOURCE] = RelatedNodeInfo(
+                node_id=self._source_table.values[source]
+            )
+        return TextNode(
+            id_=str(node_id),
+            text=self._text(start, end),
+            metadata={
+                key: self._values[key].values[self._metadata[key][node_id]]
+                for key in layout.metadata_keys
+            },
+            relationships=relationships,
+            excluded_embed_metadata_keys=list(layout.excluded_embed_metadata_keys),
+            excluded_llm_metadata_keys=list(layout.excluded_llm_metadata_keys),
+            metadata_template=layout.metadata_template,
+            metadata_separator=layout.metadata_separator,
+            text_template=layout.text_template,
+            start_char_idx=None if start_char < 0 else start_char,
+            end_char_idx=None if end_char < 0 else end_char,
+        )
+
+    def _text(self, start: int, end: int) -> str:
+        """Decode a span of the text buffer; spans never cross segments."""
+        if start >= self._base_len:
+            start -= self._base_len
+            end -= self._base_len
+            return self._tail_text[start:end].decode("utf-8")
+        return self._base_text[start:end].tobytes().decode("utf-8")
+
+    @synchronized
+    def compact(self):
+        """Drop the text of deleted nodes added since the store was loaded.
+
+        Text of loaded nodes is left in place, so a memory-mapped buffer is
+        never copied; persisting the store drops it.
+        """
+        tail = np.flatnonzero(self._text_spans[: self._size, 0] >= self._base_len)
+        tail = tail[self._alive[tail]]
+        compacted = bytearray()
+        spans = self._text_spans[tail] - self._base_len
+        for node_id, (start, end) in zip(tail.tolist(), spans.tolist()):
+            self._text_spans[node_id] = (
+                self._base_len + len(compacted),
+                self._base_len + len(compacted) + end - start,
+            )
+            compacted += self._tail_text[start:end]
+        removed = len(self._tail_text) - len(compacted)
+        self._tail_text = compacted
+        logger.info(f"Compacted node store: dropped {removed} bytes of text")
+
+    @synchronized
+    def persist(self, persist_dir: str | os.PathLike[str]):
+        """Write the store to a directory.
+
+        Columns are stored as separate `.npy` files and the texts of live
+        nodes as one buffer, so all of them can be memory-mapped on load.
+
+        Args:
+            persist_dir: Target directory
+        """
+        persist_path = Path(persist_dir)
+        persist_path.mkdir(parents=True, exist_ok=True)
+        spans = np.zeros((self._size, 2), dtype=np.int64)
+        offset = 0
+        path = persist_path / TEXT_FILENAME
+        with path.open("wb") as f, memoryview(self._tail_text) as tail:
+            for node_id in self.node_ids().tolist():
+                start, end = self._text_spans[node_id].tolist()
+                if start >= self._base_len:
+                    f.write(tail[start - self._base_len : end - self._base_len])
+                else:
+                    f.write(self._base_text[start:end])
+                spans[node_id] = (offset, offset + end - start)
+                offset += end - start
+
+        arrays = {
+            "text_spans": spans,
+            "char_spans": self._char_spans[: self._size],
+            "alive": self._alive[: self._size],
+            "sources": self._sources[: self._size],
+            "layouts": self._layouts[: self._size],
+        }
+        for name, array in arrays.items():
+            np.save(persist_path / f"{name}.npy", array)
+        keys = list(self._metadata)
+        for i, key in enumerate(keys):
+            column = self._metadata[key][: self._size]
+            np.save(persist_path / f"metadata_{i}.npy", column)
+        with (persist_path / NODES_META_FILENAME).open("w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "size": self._size,
+                    "sources": self._source_table.values,
+                    "layouts": [asdict(layout) for layout in self._layout_table.values],
+                    "metadata_keys": keys,
+                    "metadata_values": [self._values[key].values for key in keys],
+                },
+                f,
+            )
+
+    @classmethod
+    def load(
+        cls, persist_dir: str | os.PathLike[str], mmap: bool = False
+    ) -> "NodeStore":
+        """Load a store written by `persist()`.
+
+        With `mmap`, the text buffer is memory-mapped read-only and the
+        columns copy-on-write instead of being read, so processes loading
+        the same files share their pages. Texts are only read from disk
+        when their nodes are looked up.
+
+        Args:
+            persist_dir: Directory written by `persist()`
+            mmap: Memory-map the files instead of reading them
+
+        Returns:
+            NodeStore instance
+        """
+        persist_path = Path(persist_dir)
+        with (persist_path / NODES_META_FILENAME).open("r", encoding="utf-8") as f:
+            meta = json.load(f)
+        mmap_mode = "c" if mmap else None
+        arrays = {
+            name: np.load(persist_path / f"{name}.npy", mmap_mode=mmap_mode)
+            for name in NODE_ARRAY_NAMES
+        }
+
+        store = cls()
+        text_path = persist_path / TEXT_FILENAME
+        # Empty files cannot be mapped
+        if mmap and text_path.stat().st_size:
+            store._base_text = np.memmap(text_path, dtype=np.uint8, mode="r")
+        else:
+            store._base_text = np.fromfile(text_path, dtype=np.uint8)
+        store._size = meta["size"]
+        store._text_spans = arrays["text_spans"]
+        store._char_spans = arrays["char_spans"]
+        store._alive = arrays["alive"]
+        store._sources = arrays["sources"]
+        store._layouts = arrays["layouts"]
+        store._num_live = int(np.count_nonzero(store._alive))
+        store._source_table = _InternTable(meta["sources"])
+        store._layout_table = _InternTable(
+            (
+                _Layout(**{name: _freeze(value) for name, value in layout.items()})
+                for layout in meta["layouts"]
+            ),
+            key=_hashable,
+        )
+        for i, (key, values) in enumerate(
+            zip(meta["metadata_keys"], meta["metadata_values"])
+        ):
+            store._metadata[key] = np.load(
+                persist_path / f"metadata_{i}.npy", mmap_mode=mmap_mode
+            )
+            store._values[key] = _InternTable(values)
+        logger.info(f"Loaded {store._num_live} nodes from {persist_path}")
+        return store
+
+
+def _freeze(value: Any) -> Any:
+    """Layout field as stored in `_Layout`; JSON turns tuples into lists."""
+    return tuple(value) if isinstance(value, list) else value
+
+
+def _node_record(node: BaseNode) -> str:
+    """JSON row of a node with the fields `NodeStore` keeps."""
+    layout = asdict(_Layout.of(node))
+    del layout["metadata_keys"]
+    return json.dumps(
+        {
+            "text": node.get_content(),
+            "metadata": node.metadata,
+            "source": node.ref_doc_id,
+            "start_char_idx": node.start_char_idx,
+            "end_char_idx": node.end_char_idx,
+            **layout,
+        }
+    )
+
+
+def _node_from_record(node_id: int, record: str) -> TextNode:
+    fields = json.loads(record)
+    source = fields.pop("source")
+    relationships = {}
+    if source is not None:
+        relationships[NodeRelationship.SOURCE] = RelatedNodeInfo(node_id=source)
+    return TextNode(id_=str(node_id), relationships=relationships, **fields)
+
+
+def _close_database(conn: sqlite3.Connection, path: Optional[Path]):
+    """Close a node database and delete it if it is a working copy."""
+    conn.close()
+    if path is not None:
+        for suffix in ("", "-wal", "-shm"):
+            Path(f"{path}{suffix}").unlink(missing_ok=True)
+
+
+class SQLiteNodeStore(BaseNodeStore):
+    """Text nodes on disk in SQLite, with an LRU cache of hot nodes.
+
+    Each node is one row keyed by its integer ID. Memory holds only a
+    live flag per ID and up to `cache_max_entries` recently looked up
+    nodes, so the store's footprint does not grow with the corpus.
+    `get_many()` fetches the nodes missing from the cache with one query
+    per 500 IDs, i.e. a single indexed lookup for the top-k of a query.
+
+    A loaded store reads the snapshot database in place, read-only, so
+    every process serving a snapshot shares it. The first write copies it
+    to a working database under `directory`, private to the store and
+    deleted when the store is closed or garbage collected. Rows of deleted
+    nodes are dropped when the store is compacted or persisted.
+    """
+
+    def __init__(
+        self,
+        directory: str | os.PathLike[str],
+        cache_max_entries: int = 10_000,
+        snapshot_path: Optional[str | os.PathLike[str]] = None,
+        mmap: bool = False,
+    ):
+        """Create an empty store, or open a persisted one read-only.
+
+        Args:
+            directory: Directory for the working database
+            cache_max_entries: Maximum number of cached nodes (0 disables
+                the cache)
+            snapshot_path: Database written by `persist()` to read in place
+            mmap: Memory-map the snapshot database
+        """
+        super().__init__()
+        self.directory = Path(directory)
+        self.cache_max_entries = cache_max_entries
+        self._cache: OrderedDict[int, TextNode] = OrderedDict()
+        self._cache_bytes = 0
+        # Deleted nodes whose rows are still in the database
+        self._deleted: set[int] = set()
+        self._path: Optional[Path] = None
+        self._finalizer = None
+        if snapshot_path is None:
+            self._open_working()
+            return
+        uri = f"{Path(snapshot_path).resolve().as_uri()}?mode=ro&immutable=1"
+        self._conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        if mmap:
+            size = Path(snapshot_path).stat().st_size
+            self._conn.execute(f"PRAGMA mmap_size={size}")
+        self._finalizer = weakref.finalize(self, _close_database, self._conn, None)
+
+    def _open_working(self, source: Optional[sqlite3.Connection] = None):
+        """Switch to a new working database, copied from `source` if given."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"nodes-{uuid.uuid4().hex}.sqlite"
+        conn = sqlite3.connect(str(path), check_same_thread=False)
+        if source is not None:
+            source.backup(conn)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS nodes ("
+            "id INTEGER PRIMARY KEY, node TEXT NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta ("
+            "key TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+        )
+        conn.commit()
+        if self._finalizer is not None:
+            self._finalizer()
+        self._conn = conn
+        self._path = path
+        self._finalizer = weakref.finalize(self, _close_database, conn, path)
+
+    def _ensure_writable(self):
+        """Copy a read-only snapshot database before it is modified."""
+        if self._path is not None:
+            return
+        self._open_working(source=self._conn)
+        logger.info(f"Copied snapshot node database to {self._path} for writing")
+
+    @property
+    def memory_bytes(self) -> int:
+        """Approximate memory held by the store, in bytes.
+
+        The database itself is not counted: its pages live in the page
+        cache, which the OS shares between processes and can reclaim.
+        """
+        with self._lock:
+            return self._alive.nbytes + self._cache_bytes
+
+    @synchronized
+    def add(self, nodes: Sequence[BaseNode]) -> np.ndarray:
+        first = self._size
+        node_ids = np.arange(first, first + len(nodes), dtype=np.int64)
+        rows = []
+        for node_id, node in zip(node_ids.tolist(), nodes):
+            node.id_ = str(node_id)
+            rows.append((node_id, _node_record(node)))
+        self._ensure_writable()
+        self._conn.executemany("INSERT INTO nodes (id, node) VALUES (?, ?)", rows)
+        self._conn.commit()
+        self._alive = _reserve(self._alive, first + len(nodes), False)
+        self._alive[first : first + len(nodes)] = True
+        self._size += len(nodes)
+        self._num_live += len(nodes)
+        return node_ids
+
+    @synchronized
+    def delete(self, node_ids: Iterable[int]) -> int:
+        deleted = self._mark_deleted(node_ids).tolist()
+        self._deleted.update(deleted)
+        for node_id in deleted:
+            self._uncache(node_id)
+        return len(deleted)
+
+    @synchronized
+    def get_many(self, node_ids: Iterable[int]) -> List[TextNode]:
+        """Look up nodes, reading the ones not cached from the database.
+
+        Returned nodes may be shared with the cache and must not be
+        modified.
+        """
+        node_ids = [int(node_id) for node_id in node_ids]
+        for node_id in node_ids:
+            if node_id not in self:
+                raise KeyError(node_id)
+        missing = [
+            node_id for node_id in dict.fromkeys(node_ids) if node_id not in self._cache
+        ]
+        found: Dict[int, TextNode] = {}
+        for start in range(0, len(missing), _SQL_BATCH_SIZE):
+            batch = missing[start : start + _SQL_BATCH_SIZE]
+            placeholders = ",".join("?" * len(batch))
+            rows = self._conn.execute(
+                f"SELECT id, node FROM nodes WHERE id IN ({placeholders})", batch
+            )
+            for node_id, record in rows:
+                found[node_id] = _node_from_record(node_id, record)
+        nodes = []
+        for node_id in node_ids:
+            node = found.get(node_id)
+            if node is None:
+                node = self._cache[node_id]
+                self._cache.move_to_end(node_id)
+            nodes.append(node)
+        for node_id, node in found.items():
+            self._put_cache(node_id, node)
+        return nodes
+
+    def _put_cache(self, node_id: int, node: TextNode):
+        if self.cache_max_entries <= 0:
+            return
+        self._cache[node_id] = node
+        self._cache_bytes += len(node.text) + _PY_NODE_BYTES
+        while len(self._cache) > self.cache_max_entries:
+            _, evicted = self._cache.popitem(last=False)
+            self._cache_bytes -= len(evicted.text) + _PY_NODE_BYTES
+
+    def _uncache(self, node_id: int):
+        node = self._cache.pop(node_id, None)
+        if node is not None:
+            self._cache_bytes -= len(node.text) + _PY_NODE_BYTES
+
+    @synchronized
+    def compact(self):
+        """Delete the rows of deleted nodes."""
+        if not self._deleted:
+            return
+        self._ensure_writable()
+        self._delete_rows(self._conn, sorted(self._deleted))
+        self._conn.commit()
+        logger.info(f"Compacted node store: dropped {len(self._deleted)} rows")
+        self._deleted.clear()
+
+    @staticmethod
+    def _delete_rows(conn: sqlite3.Connection, node_ids: List[int]):
+        for start in range(0, len(node_ids), _SQL_BATCH_SIZE):
+            batch = node_ids[start : start + _SQL_BATCH_SIZE]
+            placeholders = ",".join("?" * len(batch))
+            conn.execute(f"DELETE FROM nodes WHERE id IN ({placeholders})", batch)
+
+    @synchronized
+    def persist(self, persist_dir: str | os.PathLike[str]):
+        """Copy the live rows into a self-contained database.
+
+        Args:
+            persist_dir: Target directory
+        """
+        persist_path = Path(persist_dir)
+        persist_path.mkdir(parents=True, exist_ok=True)
+        path = persist_path / NODES_DB_FILENAME
+        path.unlink(missing_ok=True)
+        target = sqlite3.connect(str(path))
+        try:
+            self._conn.backup(target)
+            # A single file that can be opened read-only and immutable
+            target.execute("PRAGMA journal_mode=DELETE")
+            self._delete_rows(target, sorted(self._deleted))
+            target.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('size', ?)",
+                (self._size,),
+            )
+            target.commit()
+        finally:
+            target.close()
+
+    @classmethod
+    def load(
+        cls,
+        persist_dir: str | os.PathLike[str],
+        directory: str | os.PathLike[str],
+        cache_max_entries: int = 10_000,
+        mmap: bool = False,
+    ) -> "SQLiteNodeStore":
+        """Open a store written by `persist()`.
+
+        Only the IDs of the stored nodes are read; the database is used in
+        place until the store is first modified.
+
+        Args:
+            persist_dir: Directory written by `persist()`
+            directory: Directory for the working database
+            cache_max_entries: Maximum number of cached nodes
+            mmap: Memory-map the database, so processes serving the same
+                snapshot share its pages
+
+        Returns:
+            SQLiteNodeStore instance
+        """
+        path = Path(persist_dir) / NODES_DB_FILENAME
+        store = cls(directory, cache_max_entries, snapshot_path=path, mmap=mmap)
+        conn = store._conn
+        size = conn.execute("SELECT value FROM meta WHERE key = 'size'").fetchone()
+        node_ids = np.fromiter(
+            (row[0] for row in conn.execute("SELECT id FROM nodes")), dtype=np.int64
+        )
+        store._size = size[0] if size else 0
+        store._alive = np.zeros(store._size, dtype=bool)
+        store._alive[node_ids] = True
+        store._num_live = len(node_ids)
+        logger.info(f"Loaded {store._num_live} nodes from {path}")
+        return store
+
+    def close(self):
+        """Close the database, deleting it if it is a working copy."""
+        self._finalizer()
+
+
+def create_node_store(config: NodeStoreConfig) -> BaseNodeStore:
+    """Build an empty node store of the configured backend.
+
+    Args:
+        config: Node store configuration
+
+    Returns:
+        Node store instance
+    """
+    if config.backend == "memory":
+        return NodeStore()
+    if config.backend == "sqlite":
+        return SQLiteNodeStore(
+            _resolve_path(config.directory), cache_max_entries=config.cache_max_entries
+        )
+    raise ValueError(
+        f"Unsupported node store backend: {config.backend}. "
+        f"Options: {', '.join(NODE_STORE_BACKENDS)}"
+    )
+
+
+def load_node_store(
+    persist_dir: str | os.PathLike[str], config: NodeStoreConfig, mmap: bool = False
+) -> BaseNodeStore:
+    """Load a node store persisted by the configured backend.
+
+    Args:
+        persist_dir: Directory written by the store's `persist()`
+        config: Node store configuration
+        mmap: Memory-map the stored files instead of reading them
+
+    Returns:
+        Node store instance
+    """
+    if config.backend == "sqlite":
+        return SQLiteNodeStore.load(
+            persist_dir,
+            _resolve_path(config.directory),
+            cache_max_entries=config.cache_max_entries,
+            mmap=mmap,
+        )
+    if config.backend == "memory":
+        return NodeStore.load(persist_dir, mmap=mmap)
+    raise ValueError(
+        f"Unsupported node store backend: {config.backend}. "
+        f"Options: {', '.join(NODE_STORE_BACKENDS)}"
+    )
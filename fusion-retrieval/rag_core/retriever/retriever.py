@@ -1,66 +1,418 @@
 """Fusion retriever combining vector and BM25 retrieval"""
 
-from llama_index.core.retrievers import QueryFusionRetriever
-from llama_index.core.schema import BaseNode
-from llama_index.retrievers.bm25 import BM25Retriever
+import asyncio
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from llama_index.core.async_utils import asyncio_run
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.schema import BaseNode, NodeWithScore
+from llama_index.core.vector_stores.types import VectorStoreQueryResult
 
 from ..utils.config import RetrieverConfig
 from ..utils.logging import get_logger
+from ..utils.metrics import count_items, stage_timer
+from .bm25 import BM25Index, node_text
+from .faiss_store import FaissIndexStore
+from .fusion import FusionParams, fuse, merge_candidates, mmr
+from .node_store import BaseNodeStore
+from .rewriter import QueryRewriter
+from .sharded import ShardedBM25Index, ShardPool
 
 logger = get_logger(__name__)
 
+BM25Hits = List[Tuple[int, float]]
+
 
 class FusionRetriever:
-    """Fusion retriever combining vector-based and BM25 keyword-based retrieval."""
+    """Fusion retriever combining vector-based and BM25 keyword-based retrieval.
+
+    Each query, together with its LLM-generated variants when a
+    `QueryRewriter` is set, is searched in the FAISS store and the BM25
+    index in one batch. The candidates each retriever found for the
+    variants are merged, and the two merged lists are combined by the
+    vectorized fusion in `fusion.fuse()`. Fusion mode, retriever weights,
+    candidate depths and the number of results default to the retriever
+    configuration and can be overridden per call with `FusionParams`.
+    With MMR enabled, more candidates are fused and a diverse top-k is
+    selected from them by `fusion.mmr()`. Both indexes return integer
+    node IDs; only the final top-k are looked up in the node store as
+    nodes.
+    """
 
     def __init__(
         self,
-        nodes: list[BaseNode],
-        vector_retriever,
+        nodes: BaseNodeStore,
+        vector_store: FaissIndexStore,
+        embed_model: BaseEmbedding,
         retriever_config: RetrieverConfig,
+        bm25_index: Optional[BM25Index] = None,
+        rewriter: Optional[QueryRewriter] = None,
     ):
         """Initialize fusion retriever.
 
         Args:
-            nodes: List of nodes for BM25 indexing
-            vector_retriever: Vector-based retriever instance
+            nodes: Store of the nodes covered by the indexes
+            vector_store: FAISS store holding the node embeddings, or a
+                `ShardedVectorStore`
+            embed_model: Model used to embed queries
             retriever_config: Retriever configuration
+            bm25_index: Prebuilt BM25 index to reuse instead of indexing
+                `nodes` again, e.g. a `ShardedBM25Index`
+            rewriter: Generator of query variants; queries are used as
+                they are if None
         """
         self.config = retriever_config
+        self.params = FusionParams.from_config(retriever_config)
+        self.vector_store = vector_store
+        self.embed_model = embed_model
+        self.rewriter = rewriter
         self.nodes = nodes
 
-        # Create BM25 retriever
-        logger.info("Creating BM25 retriever")
-        self.bm25_retriever = BM25Retriever.from_defaults(
-            nodes=nodes, similarity_top_k=retriever_config.similarity_top_k
-        )
+        # Create BM25 index
+        if bm25_index is None:
+            logger.info("Creating BM25 index")
+            bm25_index = BM25Index()
+            node_ids = nodes.node_ids()
+            bm25_index.add(
+                node_ids, [node_text(node) for node in nodes.get_many(node_ids)]
+            )
+        self.bm25_index = bm25_index
+        logger.info("Fusion retriever created successfully")
+
+    @classmethod
+    def from_persist_dir(
+        cls,
+        persist_dir: str,
+        nodes: BaseNodeStore,
+        vector_store: FaissIndexStore,
+        embed_model: BaseEmbedding,
+        retriever_config: RetrieverConfig,
+        rewriter: Optional[QueryRewriter] = None,
+        shard_pool: Optional[ShardPool] = None,
+        mmap: bool = False,
+    ) -> "FusionRetriever":
+        """Restore a fusion retriever from persisted BM25 statistics.
+
+        Args:
+            persist_dir: Directory written by `persist()`
+            nodes: Store of the nodes covered by the persisted BM25 index
+            vector_store: FAISS store holding the node embeddings
+            embed_model: Model used to embed queries
+            retriever_config: Retriever configuration
+            rewriter: Generator of query variants
+            shard_pool: Shard workers to load a sharded BM25 index into
+            mmap: Memory-map the BM25 arrays instead of reading them
 
-        # Create fusion retriever
-        logger.info("Creating fusion retriever")
-        self.retriever = QueryFusionRetriever(
-            retrievers=[vector_retriever, self.bm25_retriever],
-            retriever_weights=[
-                retriever_config.vector_weight,
-                retriever_config.bm25_weight,
-            ],
-            num_queries=retriever_config.num_queries,
-            mode=retriever_config.mode,
-            use_async=False,
+        Returns:
+            FusionRetriever instance
+        """
+        logger.info(f"Loading BM25 index from {persist_dir}")
+        if shard_pool is not None:
+            bm25_index = ShardedBM25Index.load(persist_dir, shard_pool, mmap=mmap)
+        else:
+            bm25_index = BM25Index.load(persist_dir, mmap=mmap)
+        return cls(
+            nodes=nodes,
+            vector_store=vector_store,
+            embed_model=embed_model,
+            retriever_config=retriever_config,
+            bm25_index=bm25_index,
+            rewriter=rewriter,
         )
-        logger.info("Fusion retriever created successfully")
 
-    def retrieve(self, query: str):
+    def persist(self, persist_dir: str):
+        """Persist the BM25 index statistics and postings.
+
+        Args:
+            persist_dir: Target directory
+        """
+        logger.info(f"Persisting BM25 index to {persist_dir}")
+        self.bm25_index.persist(persist_dir)
+
+    def add_nodes(self, node_ids: Sequence[int], nodes: Sequence[BaseNode]):
+        """Make new nodes retrievable by BM25.
+
+        The node store and the vector store are updated by the caller.
+
+        Args:
+            node_ids: Node store IDs of the nodes
+            nodes: Nodes to add
+        """
+        self.bm25_index.add(node_ids, [node_text(node) for node in nodes])
+
+    def delete_nodes(self, node_ids: Iterable[int]) -> int:
+        """Tombstone nodes in the BM25 index.
+
+        Args:
+            node_ids: IDs of nodes to remove
+
+        Returns:
+            Number of nodes removed
+        """
+        return self.bm25_index.delete(list(node_ids))
+
+    def compact(self, threshold: float = 0.0) -> bool:
+        """Compact the BM25 index if enough of it is tombstoned.
+
+        Args:
+            threshold: Minimum tombstone ratio that triggers compaction
+
+        Returns:
+            True if the index was compacted
+        """
+        if self.bm25_index.tombstone_ratio <= threshold:
+            return False
+        self.bm25_index.compact()
+        return True
+
+    def retrieve(
+        self,
+        query: str,
+        query_embedding: Optional[Sequence[float]] = None,
+        params: Optional[FusionParams] = None,
+    ) -> List[NodeWithScore]:
         """Retrieve relevant nodes for a query.
 
         Args:
             query: Query string
+            query_embedding: Precomputed embedding of `query`; embedded with
+                the query embedding model if omitted
+            params: Fusion settings for this call; defaults to `self.params`
+
+        Returns:
+            List of retrieved nodes with scores
+        """
+        params = params or self.params
+        logger.info(f"Retrieving documents for query: {query[:50]}...")
+        variants = []
+        if self.rewriter is not None:
+            with stage_timer("rewrite"):
+                variants = self.rewriter.rewrite(query)
+        queries = [query, *variants]
+        embeddings = self._embed(queries, [query_embedding], params)
+        vector_results, bm25_results = self._search(queries, embeddings, params)
+        results = self._fuse(vector_results, bm25_results, params)
+        logger.info(f"Retrieved {len(results)} documents")
+        return results
+
+    async def aretrieve(
+        self,
+        query: str,
+        query_embedding: Optional[Sequence[float]] = None,
+        params: Optional[FusionParams] = None,
+    ) -> List[NodeWithScore]:
+        """Retrieve relevant nodes for a query without blocking the event loop.
+
+        Query variants are embedded concurrently, vector and BM25 search
+        run concurrently in worker threads, and fusion runs in a worker
+        thread too.
+
+        Args:
+            query: Query string
+            query_embedding: Precomputed embedding of `query`; embedded with
+                the query embedding model if omitted
+            params: Fusion settings for this call; defaults to `self.params`
 
         Returns:
             List of retrieved nodes with scores
         """
+        params = params or self.params
         logger.info(f"Retrieving documents for query: {query[:50]}...")
-        results = self.retriever.retrieve(query)
+        variants = []
+        if self.rewriter is not None:
+            with stage_timer("rewrite"):
+                variants = await self.rewriter.arewrite(query)
+        queries = [query, *variants]
+        embeddings = await self._aembed(queries, [query_embedding], params)
+        vector_results, bm25_results = await asyncio.gather(
+            asyncio.to_thread(self._search_vectors, embeddings, params),
+            asyncio.to_thread(self._search_bm25, queries, params),
+        )
+        # Fusion reads nodes from the node store and, for MMR, shard vectors
+        results = await asyncio.to_thread(
+            self._fuse, vector_results, bm25_results, params
+        )
         logger.info(f"Retrieved {len(results)} documents")
         return results
 
+    def retrieve_batch(
+        self,
+        queries: Sequence[str],
+        query_embeddings: np.ndarray,
+        params: Optional[FusionParams] = None,
+    ) -> List[List[NodeWithScore]]:
+        """Retrieve relevant nodes for many queries at once.
+
+        Rewrites of all queries are generated concurrently. Vector search
+        then runs as one FAISS search over all queries and variants, and
+        BM25 as one sparse matrix product; the result lists of each query
+        are fused exactly as in `retrieve()`.
+
+        Args:
+            queries: Query strings
+            query_embeddings: Embeddings of `queries`, shape (n, dimensions)
+            params: Fusion settings for this call; defaults to `self.params`
+
+        Returns:
+            One list of retrieved nodes with scores per query, in input order
+        """
+        params = params or self.params
+        logger.info(f"Retrieving documents for {len(queries)} queries")
+        if self.rewriter is not None:
+            with stage_timer("rewrite"):
+                variants = self.rewriter.rewrite_many(queries)
+        else:
+            variants = [[] for _ in queries]
+
+        all_queries: List[str] = []
+        known: List[Optional[Sequence[float]]] = []
+        bounds = [0]
+        for query, embedding, query_variants in zip(
+            queries, query_embeddings, variants
+        ):
+            all_queries.extend([query, *query_variants])
+            known.extend([embedding] + [None] * len(query_variants))
+            bounds.append(len(all_queries))
+
+        embeddings = self._embed(all_queries, known, params)
+        vector_results, bm25_results = self._search(all_queries, embeddings, params)
+        return [
+            self._fuse(vector_results[start:end], bm25_results[start:end], params)
+            for start, end in zip(bounds, bounds[1:])
+        ]
+
+    def _embed(
+        self,
+        queries: Sequence[str],
+        known: Sequence[Optional[Sequence[float]]],
+        params: FusionParams,
+    ) -> List[Optional[Sequence[float]]]:
+        """Embeddings of queries, computing those missing from `known`."""
+        embeddings = list(known) + [None] * (len(queries) - len(known))
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        # Vector search is skipped with a zero weight, and so is embedding
+        if not missing or not params.vector_weight:
+            return embeddings
+        if len(missing) > 1:
+            # Embed the variants concurrently
+            return asyncio_run(self._aembed(queries, embeddings, params))
+        with stage_timer("embed_query"):
+            embeddings[missing[0]] = self.embed_model.get_query_embedding(
+                queries[missing[0]]
+            )
+        count_items("embed_query", 1)
+        return embeddings
+
+    async def _aembed(
+        self,
+        queries: Sequence[str],
+        known: Sequence[Optional[Sequence[float]]],
+        params: FusionParams,
+    ) -> List[Optional[Sequence[float]]]:
+        embeddings = list(known) + [None] * (len(queries) - len(known))
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if not missing or not params.vector_weight:
+            return embeddings
+        with stage_timer("embed_query"):
+            computed = await asyncio.gather(
+                *(self.embed_model.aget_query_embedding(queries[i]) for i in missing)
+            )
+        count_items("embed_query", len(missing))
+        for i, embedding in zip(missing, computed):
+            embeddings[i] = embedding
+        return embeddings
+
+    def _search(
+        self, queries: Sequence[str], embeddings, params: FusionParams
+    ) -> Tuple[List[VectorStoreQueryResult], List[BM25Hits]]:
+        """Vector and BM25 candidates of each query."""
+        return (
+            self._search_vectors(embeddings, params),
+            self._search_bm25(queries, params),
+        )
+
+    def _search_vectors(
+        self, embeddings, params: FusionParams
+    ) -> List[VectorStoreQueryResult]:
+        # A retriever with zero weight does not contribute and is skipped
+        if not params.vector_weight:
+            return []
+        with stage_timer("faiss_search"):
+            results = self.vector_store.query_batch(
+                np.asarray(embeddings, dtype=np.float32), params.candidate_k[0]
+            )
+        count_items("faiss_search", sum(len(result.ids) for result in results))
+        return results
+
+    def _search_bm25(
+        self, queries: Sequence[str], params: FusionParams
+    ) -> List[BM25Hits]:
+        if not params.bm25_weight:
+            return []
+        with stage_timer("bm25_search"):
+            results = self.bm25_index.search_batch(queries, params.candidate_k[1])
+        count_items("bm25_search", sum(len(hits) for hits in results))
+        return results
+
+    def _fuse(
+        self,
+        vector_results: List[VectorStoreQueryResult],
+        bm25_results: List[BM25Hits],
+        params: FusionParams,
+    ) -> List[NodeWithScore]:
+        """Fuse the candidate lists of one query and its variants."""
+        with stage_timer("fusion"):
+            ids: List[List[int]] = []
+            scores: List[Sequence[float]] = []
+            weights: List[float] = []
+            vector_weight, bm25_weight = params.weights
+            if vector_results:
+                merged_ids, merged_scores = self._merge(
+                    [result.ids for result in vector_results],
+                    [result.similarities for result in vector_results],
+                )
+                ids.append(merged_ids)
+                scores.append(merged_scores)
+                weights.append(vector_weight)
+            if bm25_results:
+                merged_ids, merged_scores = self._merge(
+                    [[node_id for node_id, _ in hits] for hits in bm25_results],
+                    [[score for _, score in hits] for hits in bm25_results],
+                )
+                ids.append(merged_ids)
+                scores.append(merged_scores)
+                weights.append(bm25_weight)
+
+            fused_ids, fused_scores = fuse(
+                ids, scores, weights, params.mode, params.fused_k
+            )
+        if params.mmr and len(fused_ids) > params.top_k:
+            fused_ids, fused_scores = self._diversify(fused_ids, fused_scores, params)
+        results = [
+            NodeWithScore(node=node, score=float(score))
+            for node, score in zip(self.nodes.get_many(fused_ids), fused_scores)
+        ]
+        count_items("fusion", len(results))
+        return results
+
+    def _diversify(
+        self, ids: List[int], scores: np.ndarray, params: FusionParams
+    ) -> Tuple[List[int], np.ndarray]:
+        """Pick `top_k` of the fused candidates by maximal marginal relevance.
+
+        Candidate embeddings are read back from the vector store, so no
+        text is embedded again.
+        """
+        with stage_timer("mmr"):
+            embeddings = self.vector_store.reconstruct(ids)
+            selected = mmr(embeddings, scores, params.top_k, params.mmr_lambda)
+        count_items("mmr", len(ids))
+        return [ids[i] for i in selected.tolist()], scores[selected]
 
+    @staticmethod
+    def _merge(ids: List[List[int]], scores: List[Sequence[float]]):
+        """Merge a retriever's lists for the variants of one query."""
+        if len(ids) == 1:
+            return ids[0], scores[0]
+        return merge_candidates(ids, scores)
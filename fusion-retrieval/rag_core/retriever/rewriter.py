@@ -0,0 +1,230 @@
+"""Cached LLM query rewriting for multi-query fusion"""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Dict, List, Optional, Sequence
+
+from llama_index.core import Settings
+from llama_index.core.llms import LLM
+from llama_index.core.retrievers.fusion_retriever import QUERY_GEN_PROMPT
+
+from ..utils.config import RetrieverConfig
+from ..utils.logging import get_logger
+from .embedding_cache import normalize_query_text
+
+logger = get_logger(__name__)
+
+
+class QueryRewriter:
+    """Generates search query variants with an LLM and caches them.
+
+    Rewrites are cached per normalized query in an in-process LRU, and
+    concurrent requests for the same query share one LLM call. Each call
+    waits at most `timeout` seconds for the rewrites; a query that misses
+    the budget is retrieved without variants while generation finishes in
+    the background and fills the cache for the next time. When
+    `max_in_flight` generations are already running, new queries are not
+    rewritten at all, so rewriting sheds load instead of queueing it.
+    """
+
+    def __init__(
+        self,
+        num_rewrites: int,
+        llm: Optional[LLM] = None,
+        max_entries: int = 10_000,
+        timeout: Optional[float] = 2.0,
+        max_in_flight: int = 8,
+    ):
+        """Initialize query rewriter.
+
+        Args:
+            num_rewrites: Variants to generate per query
+            llm: LLM generating the variants; defaults to `Settings.llm`
+            max_entries: Maximum number of cached queries
+            timeout: Seconds a query waits for its rewrites (None waits
+                as long as generation takes)
+            max_in_flight: Maximum concurrent LLM rewrite calls
+        """
+        self.num_rewrites = num_rewrites
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.max_in_flight = max_in_flight
+        self._llm = llm
+        self._cache: OrderedDict[str, List[str]] = OrderedDict()
+        self._pending: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_in_flight, thread_name_prefix="query-rewriter"
+        )
+        self.hits = 0
+        self.misses = 0
+        self.timeouts = 0
+        self.shed = 0
+
+    def rewrite(self, query: str) -> List[str]:
+        """Variants of a query, within the latency budget.
+
+        Args:
+            query: Original query
+
+        Returns:
+            Up to `num_rewrites` distinct variants, excluding the query
+            itself; empty if generation missed the budget or was shed
+        """
+        return self.rewrite_many([query])[0]
+
+    def rewrite_many(self, queries: Sequence[str]) -> List[List[str]]:
+        """Variants of many queries, generated concurrently.
+
+        All queries share one latency budget that starts with this call.
+
+        Args:
+            queries: Original queries
+
+        Returns:
+            One list of variants per query, in input order
+        """
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        futures = [self._submit(query) for query in queries]
+        results = []
+        for query, future in zip(queries, futures):
+            if isinstance(future, list):
+                results.append(future)
+                continue
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                results.append(future.result(timeout=timeout))
+            except FutureTimeoutError:
+                results.append(self._timed_out(query))
+            except Exception as e:
+                logger.warning(f"Query rewriting failed: {e}")
+                results.append([])
+        return results
+
+    async def arewrite(self, query: str) -> List[str]:
+        """Async variant of `rewrite()`.
+
+        Args:
+            query: Original query
+
+        Returns:
+            Up to `num_rewrites` distinct variants, excluding the query itself
+        """
+        future = self._submit(query)
+        if isinstance(future, list):
+            return future
+        try:
+            # Shield the shared generation: a timeout must not cancel it
+            return await asyncio.wait_for(
+                asyncio.shield(asyncio.wrap_future(future)), self.timeout
+            )
+        except asyncio.TimeoutError:
+            return self._timed_out(query)
+        except Exception as e:
+            logger.warning(f"Query rewriting failed: {e}")
+            return []
+
+    def stats(self) -> Dict[str, Any]:
+        """Cache and load-shedding counters.
+
+        Returns:
+            Dictionary with hits, misses, timeouts, shed queries, cached
+            entries and generations in flight
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "timeouts": self.timeouts,
+                "shed": self.shed,
+                "entries": len(self._cache),
+                "in_flight": len(self._pending),
+            }
+
+    def clear(self):
+        """Drop all cached rewrites."""
+        with self._lock:
+            self._cache.clear()
+
+    def _submit(self, query: str):
+        """Cached variants of a query, or the future generating them."""
+        key = normalize_query_text(query)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return list(cached)
+            self.misses += 1
+            future = self._pending.get(key)
+            if future is not None:
+                return future
+            if len(self._pending) >= self.max_in_flight:
+                self.shed += 1
+                return []
+            future = self._executor.submit(self._generate, query)
+            self._pending[key] = future
+        future.add_done_callback(lambda f: self._store(key, f))
+        return future
+
+    def _timed_out(self, query: str) -> List[str]:
+        with self._lock:
+            self.timeouts += 1
+        logger.info(f"Query rewriting exceeded {self.timeout}s: {query[:50]}")
+        return []
+
+    def _store(self, key: str, future: Future):
+        with self._lock:
+            self._pending.pop(key, None)
+            if future.cancelled() or future.exception() is not None:
+                return
+            self._cache[key] = future.result()
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def _generate(self, query: str) -> List[str]:
+        """Ask the LLM for variants and drop duplicates of the query."""
+        llm = self._llm or Settings.llm
+        prompt = QUERY_GEN_PROMPT.format(num_queries=self.num_rewrites, query=query)
+        response = llm.complete(prompt)
+
+        seen = {normalize_query_text(query)}
+        variants = []
+        # One query per line; the LLM often returns more than asked for
+        for line in response.text.strip("`").split("\n"):
+            line = line.strip()
+            key = normalize_query_text(line)
+            if key and key not in seen:
+                seen.add(key)
+                variants.append(line)
+        return variants[: self.num_rewrites]
+
+
+def create_query_rewriter(
+    config: RetrieverConfig, llm: Optional[LLM] = None
+) -> Optional[QueryRewriter]:
+    """Build the query rewriter described by a retriever configuration.
+
+    Args:
+        config: Retriever configuration
+        llm: LLM generating the variants; defaults to `Settings.llm`
+
+    Returns:
+        QueryRewriter instance, or None if `num_queries` is 1
+    """
+    if config.num_queries <= 1:
+        return None
+    return QueryRewriter(
+        num_rewrites=config.num_queries - 1,
+        llm=llm,
+        max_entries=config.rewrite_cache_max_entries,
+        timeout=config.rewrite_timeout,
+        max_in_flight=config.max_concurrent_rewrites,
+    )
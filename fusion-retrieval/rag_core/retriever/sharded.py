@@ -0,0 +1,901 @@
+"""Sharded FAISS and BM25 indexes served by worker processes"""
+
+from __future__ import annotations
+
+import asyncio
+import itertools
+import math
+import multiprocessing
+import os
+import threading
+import weakref
+from collections import deque
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    VectorStoreQuery,
+    VectorStoreQueryResult,
+)
+from pydantic import PrivateAttr
+
+from ..utils.concurrency import synchronized
+from ..utils.config import EmbeddingConfig
+from ..utils.logging import get_logger
+from .bm25 import _PY_ENTRY_BYTES, BM25Index, BM25Tokenizer, CorpusStats
+from .faiss_store import FaissIndexStore
+
+logger = get_logger(__name__)
+
+# Subdirectory of a shard's part of a persisted index
+SHARD_DIRNAME = "shard-{}"
+
+Hits = Tuple[List[int], List[float]]
+
+
+def merge_hits(hits: Sequence[Hits], k: int) -> Hits:
+    """Merge per-shard hit lists into the global top-k.
+
+    Args:
+        hits: (IDs, scores) of each shard, best first
+        k: Number of results
+
+    Returns:
+        IDs and scores of the k best hits, best first
+    """
+    ids = [node_id for shard_ids, _ in hits for node_id in shard_ids]
+    if not ids:
+        return [], []
+    scores = np.concatenate(
+        [np.asarray(shard_scores, dtype=np.float64) for _, shard_scores in hits]
+    )
+    order = np.argsort(-scores, kind="stable")[:k]
+    return [ids[i] for i in order], scores[order].tolist()
+
+
+class _Shard:
+    """Indexes of one shard, living in a worker process.
+
+    Indexes are kept per generation, a number the parent process assigns
+    to every sharded index it creates or loads. A rebuild fills a new
+    generation while queries keep using the current one, and the old
+    generation is dropped once the parent no longer references it.
+    """
+
+    def __init__(self, embed_config: EmbeddingConfig):
+        self.embed_config = embed_config
+        self.vector_stores: Dict[int, FaissIndexStore] = {}
+        self.bm25_indexes: Dict[int, BM25Index] = {}
+
+    def drop_generations(self, generations: List[int]):
+        for generation in generations:
+            self.vector_stores.pop(generation, None)
+            self.bm25_indexes.pop(generation, None)
+
+    def create_vectors(self, generation: int):
+        self.vector_stores[generation] = FaissIndexStore(self.embed_config)
+
+    def train(
+        self, generation: int, embeddings: np.ndarray, num_vectors: Optional[int]
+    ):
+        self.vector_stores[generation].train(embeddings, num_vectors)
+
+    def add_vectors(self, generation: int, node_ids: List[int], embeddings: np.ndarray):
+        self.vector_stores[generation].add_embeddings(node_ids, embeddings)
+
+    def delete_vectors(self, generation: int, node_ids: List[int]):
+        self.vector_stores[generation].delete_nodes(node_ids)
+
+    def search_vectors(
+        self, generation: int, embeddings: np.ndarray, k: int
+    ) -> List[Hits]:
+        return [
+            (result.ids, result.similarities)
+            for result in self.vector_stores[generation].query_batch(embeddings, k)
+        ]
+
+    def reconstruct_vectors(self, generation: int, node_ids: List[int]) -> np.ndarray:
+        return self.vector_stores[generation].reconstruct(node_ids)
+
+    def compact_vectors(self, generation: int):
+        self.vector_stores[generation].compact()
+
+    def vector_stats(self, generation: int) -> Dict[str, Any]:
+        store = self.vector_stores[generation]
+        return {
+            "num_vectors": store.num_vectors,
+            "stored": store.client.ntotal if store.client is not None else 0,
+            "is_trained": store.is_trained,
+            "memory_bytes": store.memory_bytes,
+        }
+
+    def set_search_params(
+        self, generation: int, nprobe: Optional[int], ef_search: Optional[int]
+    ):
+        self.vector_stores[generation].set_search_params(nprobe, ef_search)
+
+    def persist_vectors(self, generation: int, persist_path: str):
+        self.vector_stores[generation].persist(persist_path)
+
+    def load_vectors(self, generation: int, persist_path: str, mmap: bool):
+        self.vector_stores[generation] = FaissIndexStore.load(
+            persist_path, self.embed_config, mmap
+        )
+
+    def create_documents(self, generation: int):
+        self.bm25_indexes[generation] = BM25Index()
+
+    def add_documents(self, generation: int, node_ids: List[int], texts: List[str]):
+        index = self.bm25_indexes[generation]
+        previous = index.doc_freqs.copy()
+        index.add(node_ids, texts)
+        return self._changes(index, previous)
+
+    def delete_documents(self, generation: int, node_ids: List[int]):
+        index = self.bm25_indexes[generation]
+        previous = index.doc_freqs.copy()
+        deleted = index.delete(node_ids)
+        return deleted, self._changes(index, previous)
+
+    def search_documents(
+        self, generation: int, queries: List[str], k: int, stats: CorpusStats
+    ) -> List[Hits]:
+        return [
+            ([node_id for node_id, _ in hits], [score for _, score in hits])
+            for hits in self.bm25_indexes[generation].search_batch(queries, k, stats)
+        ]
+
+    def compact_documents(self, generation: int):
+        self.bm25_indexes[generation].compact()
+
+    def document_stats(self, generation: int) -> Dict[str, Any]:
+        index = self.bm25_indexes[generation]
+        return {
+            "num_docs": index.num_docs,
+            "stored": len(index.doc_ids),
+            "memory_bytes": index.memory_bytes,
+        }
+
+    def persist_documents(self, generation: int, persist_dir: str):
+        self.bm25_indexes[generation].persist(persist_dir)
+
+    def load_documents(self, generation: int, persist_dir: str, mmap: bool):
+        index = BM25Index.load(persist_dir, mmap=mmap)
+        self.bm25_indexes[generation] = index
+        return self._changes(index, None)
+
+    @staticmethod
+    def _changes(index: BM25Index, previous: Optional[np.ndarray]):
+        """Document frequency changes plus the shard's corpus totals."""
+        return index.term_doc_freqs(previous), index.num_docs, index.total_len
+
+
+def _serve(conn, embed_config: EmbeddingConfig):
+    """Worker process loop: run shard methods requested over `conn`."""
+    # Shards are the unit of parallelism; more FAISS threads would oversubscribe
+    faiss.omp_set_num_threads(1)
+    shard = _Shard(embed_config)
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            break
+        if request is None:
+            break
+        method, args = request
+        try:
+            reply = ("ok", getattr(shard, method)(*args))
+        except Exception as e:
+            reply = ("error", e)
+        try:
+            conn.send(reply)
+        except Exception as e:
+            # The result or the exception could not be pickled
+            conn.send(("error", RuntimeError(f"Shard {method} failed: {e!r}")))
+
+
+def _stop(conns, processes):
+    for conn in conns:
+        try:
+            conn.send(None)
+            conn.close()
+        except OSError:
+            pass
+    for process in processes:
+        process.join(timeout=5)
+        if process.is_alive():
+            process.terminate()
+
+
+class ShardPool:
+    """Worker processes that each hold one shard of the FAISS and BM25 indexes.
+
+    Nodes are assigned to shards by a hash of their ID. A request to
+    several shards is sent to all of them before any reply is read, so
+    shards search in parallel, each on its own core. Workers are started
+    on first use and stopped when the pool is closed or garbage collected.
+
+    Every sharded index gets its own generation in the workers, so a new
+    index is built or loaded next to the one being served. Generations of
+    indexes that were garbage collected are dropped on the next call.
+    """
+
+    def __init__(self, num_shards: int, embed_config: EmbeddingConfig):
+        """Initialize shard pool.
+
+        Args:
+            num_shards: Number of worker processes
+            embed_config: Embedding configuration with index settings
+        """
+        if num_shards < 1:
+            raise ValueError("num_shards must be positive")
+        self.num_shards = num_shards
+        self.embed_config = embed_config
+        self._conns: List[Any] = []
+        self._processes: List[Any] = []
+        # One request at a time per worker, so replies match requests
+        self._shard_locks = [threading.Lock() for _ in range(num_shards)]
+        self._start_lock = threading.Lock()
+        self._finalizer = None
+        self._generations = itertools.count()
+        # Appended to by finalizers, which must not take locks
+        self._retired: deque = deque()
+
+    def _start(self):
+        with self._start_lock:
+            if self._conns:
+                return
+            # Spawned rather than forked: FAISS and the event loop hold threads
+            context = multiprocessing.get_context("spawn")
+            conns, processes = [], []
+            for shard in range(self.num_shards):
+                parent, child = context.Pipe()
+                process = context.Process(
+                    target=_serve,
+                    args=(child, self.embed_config),
+                    name=f"rag-shard-{shard}",
+                    daemon=True,
+                )
+                process.start()
+                child.close()
+                conns.append(parent)
+                processes.append(process)
+            self._finalizer = weakref.finalize(self, _stop, conns, processes)
+            self._processes = processes
+            # Published last: a non-empty list means the pool is ready
+            self._conns = conns
+            logger.info(f"Started {self.num_shards} shard workers")
+
+    def call(self, method: str, args: Dict[int, tuple]) -> Dict[int, Any]:
+        """Run a shard method on several shards in parallel.
+
+        Args:
+            method: Name of the shard method
+            args: Arguments of the call, keyed by shard
+
+        Returns:
+            Result of each shard, keyed by shard
+
+        Raises:
+            Exception: The first exception raised by a shard
+        """
+        if not self._conns:
+            self._start()
+        if self._retired:
+            self._drop_retired()
+        return self._call(method, args)
+
+    def _call(self, method: str, args: Dict[int, tuple]) -> Dict[int, Any]:
+        shards = sorted(args)
+        # Locks are taken in shard order, so concurrent calls cannot deadlock
+        for shard in shards:
+            self._shard_locks[shard].acquire()
+        try:
+            for shard in shards:
+                self._conns[shard].send((method, args[shard]))
+            replies = {}
+            for shard in shards:
+                try:
+                    replies[shard] = self._conns[shard].recv()
+                except (EOFError, OSError):
+                    replies[shard] = (
+                        "error",
+                        RuntimeError(f"Shard worker {shard} exited"),
+                    )
+        finally:
+            for shard in shards:
+                self._shard_locks[shard].release()
+
+        results = {}
+        for shard, (status, value) in replies.items():
+            if status == "error":
+                raise value
+            results[shard] = value
+        return results
+
+    def broadcast(self, method: str, *args: Any) -> List[Any]:
+        """Run a shard method with the same arguments on every shard.
+
+        Returns:
+            Result of each shard, in shard order
+        """
+        results = self.call(method, {shard: args for shard in range(self.num_shards)})
+        return [results[shard] for shard in range(self.num_shards)]
+
+    def new_generation(self) -> int:
+        """Reserve a generation number for a new sharded index."""
+        return next(self._generations)
+
+    def retire(self, generation: int):
+        """Have the workers drop the indexes of a generation on the next call.
+
+        Safe to call from a finalizer: it only queues the generation.
+        """
+        self._retired.append(generation)
+
+    def _drop_retired(self):
+        generations = []
+        while True:
+            try:
+                generations.append(self._retired.popleft())
+            except IndexError:
+                break
+        if generations:
+            self._call(
+                "drop_generations",
+                {shard: (generations,) for shard in range(self.num_shards)},
+            )
+            logger.debug(f"Dropped shard index generations {generations}")
+
+    @property
+    def pids(self) -> List[int]:
+        """Process IDs of the running workers."""
+        return [process.pid for process in self._processes]
+
+    def partition(self, node_ids: Sequence[int]) -> Dict[int, List[int]]:
+        """Positions of the given node IDs, grouped by shard.
+
+        A node belongs to shard `node_id % num_shards`, which spreads the
+        node store's consecutive IDs evenly over the shards.
+        """
+        shards = np.asarray(node_ids, dtype=np.int64) % self.num_shards
+        return {
+            shard: np.flatnonzero(shards == shard).tolist()
+            for shard in np.unique(shards).tolist()
+        }
+
+    def shard_path(self, path: str, shard: int) -> str:
+        """Location of a shard's part of a file or directory."""
+        head, tail = os.path.split(path)
+        return os.path.join(head, SHARD_DIRNAME.format(shard), tail)
+
+    def close(self):
+        """Stop the worker processes."""
+        if self._finalizer is not None:
+            self._finalizer()
+            self._conns, self._processes = [], []
+
+
+class ShardedVectorStore(BasePydanticVectorStore):
+    """Vector store whose FAISS index is split across a `ShardPool`.
+
+    Behaves like `FaissIndexStore`: every shard is searched for the top-k
+    of each query and the shard results are merged by similarity, which
+    gives the same results as one index for exact (flat) search. The
+    vectors are a generation of their own in the workers, dropped when the
+    store is garbage collected.
+    """
+
+    stores_text: bool = False
+
+    _pool: ShardPool = PrivateAttr()
+    _generation: int = PrivateAttr()
+
+    def __init__(self, pool: ShardPool, generation: int):
+        """Initialize sharded vector store.
+
+        Args:
+            pool: Shard workers holding the vectors
+            generation: Generation of the vectors in the workers, which
+                this store takes ownership of
+        """
+        super().__init__()
+        self._pool = pool
+        self._generation = generation
+        weakref.finalize(self, pool.retire, generation)
+
+    @classmethod
+    def create(cls, pool: ShardPool) -> "ShardedVectorStore":
+        """Create a store with empty vectors in every shard.
+
+        Indexes of other stores in the same workers are left untouched.
+        """
+        generation = pool.new_generation()
+        pool.broadcast("create_vectors", generation)
+        return cls(pool, generation)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ShardedVectorStore"
+
+    @property
+    def client(self) -> Any:
+        """The shard pool."""
+        return self._pool
+
+    def _stats(self) -> List[Dict[str, Any]]:
+        return self._pool.broadcast("vector_stats", self._generation)
+
+    @property
+    def is_trained(self) -> bool:
+        return all(stats["is_trained"] for stats in self._stats())
+
+    @property
+    def num_vectors(self) -> int:
+        return sum(stats["num_vectors"] for stats in self._stats())
+
+    @property
+    def memory_bytes(self) -> int:
+        """Approximate memory held by all shards, in bytes."""
+        return sum(stats["memory_bytes"] for stats in self._stats())
+
+    @property
+    def tombstone_ratio(self) -> float:
+        """Fraction of stored vectors that are tombstoned."""
+        stats = self._stats()
+        stored = sum(shard["stored"] for shard in stats)
+        if not stored:
+            return 0.0
+        return 1.0 - sum(shard["num_vectors"] for shard in stats) / stored
+
+    def train(self, embeddings: np.ndarray, num_vectors: Optional[int] = None):
+        """Create and train the FAISS index of every shard on the same sample.
+
+        Args:
+            embeddings: Training sample of shape (n, dimensions)
+            num_vectors: Expected size of the whole index
+        """
+        if num_vectors is not None:
+            num_vectors = math.ceil(num_vectors / self._pool.num_shards)
+        self._pool.broadcast(
+            "train",
+            self._generation,
+            np.ascontiguousarray(embeddings, dtype=np.float32),
+            num_vectors,
+        )
+
+    def add(self, nodes: List[BaseNode], **add_kwargs: Any) -> List[str]:
+        """Add nodes with embeddings to their shards.
+
+        Args:
+            nodes: Nodes with embeddings
+
+        Returns:
+            Node IDs, used as vector store IDs
+        """
+        if not nodes:
+            return []
+        node_ids = [node.node_id for node in nodes]
+        self.add_embeddings(
+            [int(node_id) for node_id in node_ids],
+            np.asarray([node.get_embedding() for node in nodes], dtype=np.float32),
+        )
+        return node_ids
+
+    def add_embeddings(self, node_ids: Sequence[int], embeddings: np.ndarray):
+        """Add embeddings keyed by node ID to their shards.
+
+        Args:
+            node_ids: Non-negative integer node IDs
+            embeddings: Embeddings of shape (len(node_ids), dimensions)
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        self._pool.call(
+            "add_vectors",
+            {
+                shard: (
+                    self._generation,
+                    [node_ids[i] for i in positions],
+                    embeddings[positions],
+                )
+                for shard, positions in self._pool.partition(node_ids).items()
+            },
+        )
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        """Delete by reference document is not tracked; use `delete_nodes()`."""
+        raise NotImplementedError(
+            "Delete by ref_doc_id is not supported, use delete_nodes()"
+        )
+
+    def delete_nodes(
+        self,
+        node_ids: Optional[Sequence[int]] = None,
+        filters: Optional[Any] = None,
+        **delete_kwargs: Any,
+    ) -> None:
+        """Tombstone nodes in their shards.
+
+        Args:
+            node_ids: IDs of nodes to delete
+        """
+        if filters is not None:
+            raise ValueError("Metadata filters are not supported for FAISS deletes")
+        node_ids = [int(node_id) for node_id in node_ids or []]
+        self._pool.call(
+            "delete_vectors",
+            {
+                shard: (self._generation, [node_ids[i] for i in positions])
+                for shard, positions in self._pool.partition(node_ids).items()
+            },
+        )
+
+    def reconstruct(self, node_ids: Sequence[int]) -> np.ndarray:
+        """Stored vectors of live nodes, gathered from their shards.
+
+        Args:
+            node_ids: IDs of live nodes
+
+        Returns:
+            Array of shape (len(node_ids), dimensions)
+
+        Raises:
+            KeyError: If a node has no live vector
+        """
+        node_ids = [int(node_id) for node_id in node_ids]
+        partition = self._pool.partition(node_ids)
+        vectors = self._pool.call(
+            "reconstruct_vectors",
+            {
+                shard: (self._generation, [node_ids[i] for i in positions])
+                for shard, positions in partition.items()
+            },
+        )
+        dimensions = self._pool.embed_config.dimensions
+        result = np.zeros((len(node_ids), dimensions), dtype=np.float32)
+        for shard, positions in partition.items():
+            result[positions] = vectors[shard]
+        return result
+
+    def compact(self):
+        """Physically remove tombstoned vectors from every shard."""
+        self._pool.broadcast("compact_vectors", self._generation)
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        """Return the top-k most similar live nodes of all shards.
+
+        Args:
+            query: Vector store query with embedding and top-k
+
+        Returns:
+            Query result with node IDs and similarities
+        """
+        if query.filters is not None:
+            raise ValueError("Metadata filters are not supported for FAISS queries")
+        result = self.query_batch([query.query_embedding], query.similarity_top_k)[0]
+        result.ids = [str(node_id) for node_id in result.ids]
+        return result
+
+    def query_batch(
+        self, query_embeddings: np.ndarray, k: int
+    ) -> List[VectorStoreQueryResult]:
+        """Search many query embeddings on every shard and merge the results.
+
+        Args:
+            query_embeddings: Query embeddings of shape (n, dimensions)
+            k: Number of results per query
+
+        Returns:
+            One query result per embedding with integer node IDs, in input
+            order
+        """
+        query_embeddings = np.ascontiguousarray(query_embeddings, dtype=np.float32)
+        per_shard = self._pool.broadcast(
+            "search_vectors", self._generation, query_embeddings, k
+        )
+        results = []
+        for row in range(len(query_embeddings)):
+            ids, similarities = merge_hits([hits[row] for hits in per_shard], k)
+            results.append(VectorStoreQueryResult(similarities=similarities, ids=ids))
+        return results
+
+    async def aquery(
+        self, query: VectorStoreQuery, **kwargs: Any
+    ) -> VectorStoreQueryResult:
+        """Run `query()` in a worker thread while the shards search."""
+        return await asyncio.to_thread(self.query, query, **kwargs)
+
+    def set_search_params(
+        self, nprobe: Optional[int] = None, ef_search: Optional[int] = None
+    ):
+        """Change query-time search parameters of every shard.
+
+        Args:
+            nprobe: Number of IVF lists to visit
+            ef_search: HNSW search beam width
+        """
+        self._pool.broadcast("set_search_params", self._generation, nprobe, ef_search)
+
+    def persist(self, persist_path: str, fs: Optional[Any] = None) -> None:
+        """Write each shard's FAISS index into its own subdirectory.
+
+        Args:
+            persist_path: Target file of an unsharded FAISS index
+        """
+        self._pool.call(
+            "persist_vectors",
+            {
+                shard: (self._generation, self._pool.shard_path(persist_path, shard))
+                for shard in range(self._pool.num_shards)
+            },
+        )
+
+    @classmethod
+    def load(
+        cls, persist_path: str, pool: ShardPool, mmap: bool = False
+    ) -> "ShardedVectorStore":
+        """Load a store written by `persist()` into the shard workers.
+
+        Args:
+            persist_path: Target file given to `persist()`
+            pool: Shard workers to load into; must have as many shards as
+                the persisted store
+            mmap: Memory-map each shard's index instead of reading it
+
+        Returns:
+            ShardedVectorStore instance
+        """
+        generation = pool.new_generation()
+        try:
+            pool.call(
+                "load_vectors",
+                {
+                    shard: (generation, pool.shard_path(persist_path, shard), mmap)
+                    for shard in range(pool.num_shards)
+                },
+            )
+        except Exception:
+            # Drop the shards that did load
+            pool.retire(generation)
+            raise
+        return cls(pool, generation)
+
+
+class ShardedBM25Index:
+    """BM25 index split across a `ShardPool`, with corpus-wide statistics.
+
+    Each shard scores only its own documents, but with the document
+    frequencies, document count and average length of the whole corpus,
+    which this object keeps up to date from the changes every update
+    reports. Shard scores are therefore identical to those of a single
+    index, and the per-shard top-k lists are merged by score. Offers the
+    same methods as `BM25Index` that `FusionRetriever` uses. Like
+    `ShardedVectorStore`, the postings are a generation of their own in the
+    workers.
+    """
+
+    def __init__(
+        self,
+        pool: ShardPool,
+        generation: int,
+        tokenizer: Optional[BM25Tokenizer] = None,
+    ):
+        """Initialize sharded BM25 index.
+
+        Args:
+            pool: Shard workers holding the postings
+            generation: Generation of the postings in the workers, which
+                this index takes ownership of
+            tokenizer: Tokenizer matching the one of the shard indexes
+        """
+        self.pool = pool
+        self.generation = generation
+        self.tokenizer = tokenizer or BM25Tokenizer()
+        self.doc_freqs: Dict[str, int] = {}
+        # Live document count and total length of each shard
+        self._totals: Dict[int, Tuple[int, int]] = {}
+        self._lock = threading.RLock()
+        weakref.finalize(self, pool.retire, generation)
+
+    @classmethod
+    def create(cls, pool: ShardPool) -> "ShardedBM25Index":
+        """Create an index with an empty BM25 index in every shard.
+
+        Indexes of other instances in the same workers are left untouched.
+        """
+        generation = pool.new_generation()
+        pool.broadcast("create_documents", generation)
+        return cls(pool, generation)
+
+    @property
+    def num_docs(self) -> int:
+        return sum(num_docs for num_docs, _ in self._totals.values())
+
+    @property
+    def total_len(self) -> int:
+        return sum(total_len for _, total_len in self._totals.values())
+
+    def __len__(self) -> int:
+        return self.num_docs
+
+    @property
+    def memory_bytes(self) -> int:
+        """Approximate memory held by all shards and the term statistics."""
+        shards = sum(stats["memory_bytes"] for stats in self._stats())
+        return shards + len(self.doc_freqs) * _PY_ENTRY_BYTES
+
+    @property
+    def tombstone_ratio(self) -> float:
+        """Fraction of stored documents that are tombstoned."""
+        stats = self._stats()
+        stored = sum(shard["stored"] for shard in stats)
+        if not stored:
+            return 0.0
+        return 1.0 - sum(shard["num_docs"] for shard in stats) / stored
+
+    def _stats(self) -> List[Dict[str, Any]]:
+        return self.pool.broadcast("document_stats", self.generation)
+
+    @synchronized
+    def add(self, node_ids: Sequence[int], texts: Sequence[str]):
+        """Index new documents in their shards.
+
+        Args:
+            node_ids: Non-negative integer node IDs
+            texts: Document texts
+        """
+        self._update(
+            self.pool.call(
+                "add_documents",
+                {
+                    shard: (
+                        self.generation,
+                        [node_ids[i] for i in positions],
+                        [texts[i] for i in positions],
+                    )
+                    for shard, positions in self.pool.partition(node_ids).items()
+                },
+            )
+        )
+
+    @synchronized
+    def delete(self, node_ids: Sequence[int]) -> int:
+        """Tombstone documents in their shards.
+
+        Args:
+            node_ids: Node IDs to delete
+
+        Returns:
+            Number of documents deleted
+        """
+        node_ids = list(node_ids)
+        results = self.pool.call(
+            "delete_documents",
+            {
+                shard: (self.generation, [node_ids[i] for i in positions])
+                for shard, positions in self.pool.partition(node_ids).items()
+            },
+        )
+        self._update({shard: changes for shard, (_, changes) in results.items()})
+        return sum(deleted for deleted, _ in results.values())
+
+    def _update(self, changes: Dict[int, tuple]):
+        """Apply the statistics changes reported by shards."""
+        for shard, (doc_freqs, num_docs, total_len) in changes.items():
+            for term, change in doc_freqs.items():
+                doc_freq = self.doc_freqs.get(term, 0) + change
+                if doc_freq:
+                    self.doc_freqs[term] = doc_freq
+                else:
+                    self.doc_freqs.pop(term, None)
+            self._totals[shard] = (num_docs, total_len)
+
+    def compact(self):
+        """Drop tombstoned documents in every shard."""
+        self.pool.broadcast("compact_documents", self.generation)
+
+    def search(self, query: str, k: int) -> List[Tuple[int, float]]:
+        """Score live documents of all shards against a query.
+
+        Args:
+            query: Query text
+            k: Number of results
+
+        Returns:
+            List of (node ID, score) pairs, best first
+        """
+        return self.search_batch([query], k)[0]
+
+    def search_batch(
+        self, queries: Sequence[str], k: int
+    ) -> List[List[Tuple[int, float]]]:
+        """Score many queries on every shard and merge the results.
+
+        Args:
+            queries: Query texts
+            k: Number of results per query
+
+        Returns:
+            One list of (node ID, score) pairs per query, best first
+        """
+        if k <= 0:
+            return [[] for _ in queries]
+        terms = {term for query in queries for term in self.tokenizer(query)}
+        with self._lock:
+            if not self.num_docs:
+                return [[] for _ in queries]
+            stats = CorpusStats(
+                num_docs=self.num_docs,
+                total_len=self.total_len,
+                doc_freqs={
+                    term: self.doc_freqs[term]
+                    for term in terms
+                    if term in self.doc_freqs
+                },
+            )
+        per_shard = self.pool.broadcast(
+            "search_documents", self.generation, list(queries), k, stats
+        )
+        results = []
+        for row in range(len(queries)):
+            ids, scores = merge_hits([hits[row] for hits in per_shard], k)
+            results.append(list(zip(ids, scores)))
+        return results
+
+    def persist(self, persist_dir: str | os.PathLike[str]):
+        """Write each shard's BM25 index into its own subdirectory.
+
+        Args:
+            persist_dir: Target directory
+        """
+        persist_dir = os.fspath(persist_dir)
+        self.pool.call(
+            "persist_documents",
+            {
+                shard: (
+                    self.generation,
+                    os.path.join(persist_dir, SHARD_DIRNAME.format(shard)),
+                )
+                for shard in range(self.pool.num_shards)
+            },
+        )
+
+    @classmethod
+    def load(
+        cls, persist_dir: str | os.PathLike[str], pool: ShardPool, mmap: bool = False
+    ) -> "ShardedBM25Index":
+        """Load an index written by `persist()` into the shard workers.
+
+        Args:
+            persist_dir: Directory written by `persist()`
+            pool: Shard workers to load into; must have as many shards as
+                the persisted index
+            mmap: Memory-map each shard's arrays instead of reading them
+
+        Returns:
+            ShardedBM25Index instance with the corpus statistics rebuilt
+        """
+        persist_dir = os.fspath(persist_dir)
+        generation = pool.new_generation()
+        try:
+            changes = pool.call(
+                "load_documents",
+                {
+                    shard: (
+                        generation,
+                        os.path.join(persist_dir, SHARD_DIRNAME.format(shard)),
+                        mmap,
+                    )
+                    for shard in range(pool.num_shards)
+                },
+            )
+        except Exception:
+            # Drop the shards that did load
+            pool.retire(generation)
+            raise
+        index = cls(pool, generation)
+        index._update(changes)
+        return index
@@ -6,6 +6,7 @@ from llama_index.core.node_parser import SentenceSplitter
 from llama_index.core.schema import BaseNode, TransformComponent
 
 from ..utils.logging import get_logger
+from ..utils.metrics import count_items, stage_timer
 
 logger = get_logger(__name__)
 
@@ -55,8 +56,12 @@ class TextSplitter:
             List of split nodes
         """
         logger.info(f"Splitting {len(documents)} documents into chunks")
-        nodes = self.splitter.get_nodes_from_documents(documents)
-        cleaned_nodes = self.cleaner(nodes)
+        with stage_timer("split"):
+            nodes = self.splitter.get_nodes_from_documents(documents)
+        count_items("split", len(nodes))
+        with stage_timer("clean"):
+            cleaned_nodes = self.cleaner(nodes)
+        count_items("clean", len(cleaned_nodes))
         logger.info(f"Created {len(cleaned_nodes)} nodes after splitting")
         return cleaned_nodes
 
@@ -1,52 +1,324 @@
 """Vector store management"""
 
-import faiss
-from llama_index.core import VectorStoreIndex
+import os
+import random
+from typing import Any, Dict, Iterable, Optional, Sequence
+
+import numpy as np
+from llama_index.core.indices.utils import embed_nodes
 from llama_index.core.schema import BaseNode
 from llama_index.embeddings.openai import OpenAIEmbedding
-from llama_index.vector_stores.faiss import FaissVectorStore
 
-from ..utils.config import EmbeddingConfig
+from ..utils.config import EmbeddingConfig, _resolve_path
 from ..utils.logging import get_logger
+from ..utils.metrics import count_items, stage_timer
+from .embedding_cache import CachedEmbedding, CachedQueryEmbedding, EmbeddingCache
+from .embedding_scheduler import RateLimitedEmbedding
+from .faiss_store import VECTOR_STORE_FILENAME, FaissIndexStore
+from .local_embedding import HashedNgramEmbedding
+from .sharded import ShardedVectorStore, ShardPool
 
 logger = get_logger(__name__)
 
+EMBEDDING_PROVIDERS = ("openai", "local")
+
+# Nodes embedded and added to the vector store at a time
+_INSERT_BATCH_SIZE = 2048
+
 
 class VectorStoreManager:
     """Manages vector store creation and indexing."""
 
-    def __init__(self, embed_config: EmbeddingConfig):
+    def __init__(
+        self, embed_config: EmbeddingConfig, shard_pool: Optional[ShardPool] = None
+    ):
         """Initialize vector store manager.
 
         Args:
             embed_config: Embedding configuration
+            shard_pool: Worker processes to split the FAISS index across;
+                the index is kept in this process if None
         """
         self.embed_config = embed_config
-        self.embed_model = OpenAIEmbedding(
-            model=embed_config.model, dimensions=embed_config.dimensions
+        self.shard_pool = shard_pool
+        if embed_config.provider == "local":
+            self.embed_model = HashedNgramEmbedding(
+                dimensions=embed_config.dimensions,
+                embed_batch_size=embed_config.batch_max_size,
+            )
+        elif embed_config.provider == "openai":
+            self.embed_model = OpenAIEmbedding(
+                model=embed_config.model, dimensions=embed_config.dimensions
+            )
+        else:
+            raise ValueError(
+                f"Unsupported embedding provider: {embed_config.provider}. "
+                f"Options: {', '.join(EMBEDDING_PROVIDERS)}"
+            )
+        # Queries bypass the chunk embedding cache and use their own LRU
+        self.query_embed_model = self.embed_model
+        if embed_config.query_cache_max_entries > 0:
+            query_cache = None
+            if embed_config.query_cache_path:
+                query_cache = EmbeddingCache(
+                    _resolve_path(embed_config.query_cache_path),
+                    max_entries=embed_config.query_cache_max_entries,
+                )
+            self.query_embed_model = CachedQueryEmbedding(
+                self.embed_model,
+                max_entries=embed_config.query_cache_max_entries,
+                cache=query_cache,
+                dimensions=embed_config.dimensions,
+            )
+        self.embedding_scheduler = None
+        self.embedding_cache = None
+        if embed_config.provider == "local":
+            # Local embeddings are cheaper to compute than to look up, and
+            # have no rate limits to schedule around
+            logger.info("Embedding chunks and queries locally on CPU")
+            self.vector_store = self._new_store()
+            return
+        # Chunks are embedded through the rate-limit-aware scheduler, which
+        # does its own retrying
+        self.embed_model = RateLimitedEmbedding(
+            OpenAIEmbedding(
+                model=embed_config.model,
+                dimensions=embed_config.dimensions,
+                embed_batch_size=embed_config.batch_max_size,
+                max_retries=0,
+            ),
+            max_batch_tokens=embed_config.batch_max_tokens,
+            max_batch_size=embed_config.batch_max_size,
+            max_concurrency=embed_config.max_concurrency,
+            max_retries=embed_config.max_retries,
         )
-        self.faiss_index = faiss.IndexFlatL2(embed_config.dimensions)
-        self.vector_store = FaissVectorStore(faiss_index=self.faiss_index)
+        self.embedding_scheduler = self.embed_model
+        if embed_config.cache_path:
+            self.embedding_cache = EmbeddingCache(
+                _resolve_path(embed_config.cache_path),
+                max_entries=embed_config.cache_max_entries,
+            )
+            self.embed_model = CachedEmbedding(
+                self.embed_model,
+                self.embedding_cache,
+                dimensions=embed_config.dimensions,
+                embed_batch_size=self.embed_model.embed_batch_size,
+            )
+            logger.info(f"Using embedding cache at {self.embedding_cache.path}")
+        self.vector_store = self._new_store()
 
-    def create_index(self, nodes: list[BaseNode]) -> VectorStoreIndex:
-        """Create a vector store index from nodes.
+    def _new_store(self):
+        """Empty vector store, split across the shard workers if there are any."""
+        if self.shard_pool is not None:
+            return ShardedVectorStore.create(self.shard_pool)
+        return FaissIndexStore(self.embed_config)
 
-        Args:
-            nodes: List of nodes to index
+    def create_index(self, node_ids: Sequence[int], nodes: Sequence[BaseNode]):
+        """Replace the vector store with a new one holding the given nodes.
 
-        Returns:
-            VectorStoreIndex instance
+        Args:
+            node_ids: Node store IDs of the nodes
+            nodes: Nodes to embed and index
         """
         logger.info(f"Creating vector store index from {len(nodes)} nodes")
-        index = VectorStoreIndex(nodes, embed_model=self.embed_model)
+        # Build aside so a failed build keeps the current store in place
+        vector_store = self._new_store()
+        self._add_to(vector_store, node_ids, nodes)
+        self.vector_store = vector_store
         logger.info("Vector store index created successfully")
-        return index
 
-    def get_vector_store(self) -> FaissVectorStore:
+    def add_nodes(self, node_ids: Sequence[int], nodes: Sequence[BaseNode]):
+        """Embed nodes and add them to the vector store under their IDs.
+
+        Nodes are embedded and added in batches, so only one batch of
+        embeddings is held in memory. An untrained IVF index needs all
+        embeddings up front to train on a sample of them.
+
+        Args:
+            node_ids: Node store IDs of the nodes
+            nodes: Nodes to embed and index
+        """
+        self._add_to(self.vector_store, node_ids, nodes)
+
+    def _add_to(
+        self, vector_store, node_ids: Sequence[int], nodes: Sequence[BaseNode]
+    ):
+        """Embed nodes and add them to a given vector store."""
+        if not len(nodes):
+            return
+        node_ids = np.asarray(node_ids, dtype=np.int64)
+        if (
+            self.embed_config.index_type.startswith("ivf")
+            and not vector_store.is_trained
+        ):
+            embeddings = self._embed(nodes)
+            self._train(vector_store, embeddings)
+            vector_store.add_embeddings(node_ids, embeddings)
+            return
+        for start in range(0, len(nodes), _INSERT_BATCH_SIZE):
+            end = start + _INSERT_BATCH_SIZE
+            vector_store.add_embeddings(
+                node_ids[start:end], self._embed(nodes[start:end])
+            )
+
+    def delete_nodes(self, node_ids: Iterable[int]):
+        """Tombstone the vectors of nodes.
+
+        Args:
+            node_ids: Node store IDs of the nodes
+        """
+        self.vector_store.delete_nodes(list(node_ids))
+
+    def compact(self, threshold: float = 0.0) -> bool:
+        """Remove tombstoned vectors if enough of the index is tombstoned.
+
+        Args:
+            threshold: Minimum tombstone ratio that triggers compaction
+
+        Returns:
+            True if the index was compacted
+        """
+        if self.vector_store.tombstone_ratio <= threshold:
+            return False
+        self.vector_store.compact()
+        return True
+
+    def _embed(self, nodes: Sequence[BaseNode]) -> np.ndarray:
+        """Embeddings of nodes, in input order."""
+        id_to_embedding = embed_nodes(nodes, self.embed_model)
+        return np.asarray(
+            [id_to_embedding[node.node_id] for node in nodes], dtype=np.float32
+        )
+
+    def _train(self, vector_store, embeddings: np.ndarray):
+        """Train the FAISS index of a vector store on a sample of embeddings."""
+        sample_size = min(self.embed_config.train_sample_size, len(embeddings))
+        sample = random.Random(0).sample(range(len(embeddings)), sample_size)
+        vector_store.train(embeddings[sample], num_vectors=len(embeddings))
+
+    def persist(self, persist_dir: str):
+        """Persist the vector store.
+
+        Args:
+            persist_dir: Target directory
+        """
+        logger.info(f"Persisting vector store to {persist_dir}")
+        self.vector_store.persist(os.path.join(persist_dir, VECTOR_STORE_FILENAME))
+
+    def load_vector_store(self, persist_dir: str, mmap: bool = False):
+        """Load a vector store written by `persist()`.
+
+        Args:
+            persist_dir: Directory written by `persist()`
+            mmap: Memory-map the FAISS index instead of reading it
+        """
+        logger.info(f"Loading vector store from {persist_dir}")
+        persist_path = os.path.join(persist_dir, VECTOR_STORE_FILENAME)
+        if self.shard_pool is not None:
+            self.vector_store = ShardedVectorStore.load(
+                persist_path, self.shard_pool, mmap=mmap
+            )
+        else:
+            self.vector_store = FaissIndexStore.load(
+                persist_path, self.embed_config, mmap=mmap
+            )
+
+    def embed_query(self, query: str) -> np.ndarray:
+        """Embed a single query.
+
+        Args:
+            query: Query string
+
+        Returns:
+            Array of shape (dimensions,)
+        """
+        with stage_timer("embed_query"):
+            embedding = self.query_embed_model.get_query_embedding(query)
+        count_items("embed_query", 1)
+        return np.asarray(embedding, dtype=np.float32)
+
+    async def aembed_query(self, query: str) -> np.ndarray:
+        """Async variant of `embed_query()`.
+
+        Args:
+            query: Query string
+
+        Returns:
+            Array of shape (dimensions,)
+        """
+        with stage_timer("embed_query"):
+            embedding = await self.query_embed_model.aget_query_embedding(query)
+        count_items("embed_query", 1)
+        return np.asarray(embedding, dtype=np.float32)
+
+    def embed_queries(self, queries: Sequence[str]) -> np.ndarray:
+        """Embed many queries with batched embedding calls.
+
+        OpenAI embeds queries and documents with the same model, so the
+        text batch endpoint is used to embed `embed_batch_size` queries per
+        request instead of one request per query.
+
+        Args:
+            queries: Query strings
+
+        Returns:
+            Array of shape (len(queries), dimensions)
+        """
+        with stage_timer("embed_query"):
+            embeddings = self.query_embed_model.get_text_embedding_batch(list(queries))
+        count_items("embed_query", len(queries))
+        return np.asarray(embeddings, dtype=np.float32)
+
+    async def aembed_queries(self, queries: Sequence[str]) -> np.ndarray:
+        """Async variant of `embed_queries()`.
+
+        Args:
+            queries: Query strings
+
+        Returns:
+            Array of shape (len(queries), dimensions)
+        """
+        with stage_timer("embed_query"):
+            embeddings = await self.query_embed_model.aget_text_embedding_batch(
+                list(queries)
+            )
+        count_items("embed_query", len(queries))
+        return np.asarray(embeddings, dtype=np.float32)
+
+    def warm_query_cache(self, queries: Sequence[str]) -> int:
+        """Pre-compute query embeddings for known frequent queries.
+
+        Args:
+            queries: Query strings
+
+        Returns:
+            Number of queries newly embedded
+        """
+        if not isinstance(self.query_embed_model, CachedQueryEmbedding):
+            raise ValueError("Query embedding cache is disabled")
+        return self.query_embed_model.warm(queries)
+
+    def embedding_stats(self) -> Optional[Dict[str, Any]]:
+        """Throughput and rate-limit counters of chunk embedding.
+
+        Returns:
+            Scheduler counters, or None if chunks are embedded locally
+        """
+        if self.embedding_scheduler is None:
+            return None
+        return self.embedding_scheduler.stats()
+
+    def query_cache_stats(self) -> Optional[Dict[str, Any]]:
+        """Counters of the query embedding cache, or None if it is disabled."""
+        if not isinstance(self.query_embed_model, CachedQueryEmbedding):
+            return None
+        return self.query_embed_model.stats()
+
+    def get_vector_store(self) -> FaissIndexStore:
         """Get the underlying FAISS vector store.
 
         Returns:
-            FaissVectorStore instance
+            FaissIndexStore instance
         """
         return self.vector_store
 
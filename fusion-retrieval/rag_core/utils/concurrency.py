@@ -0,0 +1,17 @@
+"""Concurrency utilities"""
+
+import functools
+
+
+def synchronized(method):
+    """Run a method while holding the instance's `_lock`.
+
+    The lock should be reentrant so synchronized methods can call each other.
+    """
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+
+    return wrapper
@@ -3,9 +3,9 @@
 from __future__ import annotations
 
 import os
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 
 import yaml
 
@@ -14,8 +14,26 @@ import yaml
 class EmbeddingConfig:
     """Embedding model configuration."""
 
+    provider: str = "openai"
     model: str = "text-embedding-3-small"
     dimensions: int = 512
+    cache_path: Optional[str] = "cache/embeddings.sqlite"
+    cache_max_entries: int = 1_000_000
+    query_cache_max_entries: int = 10_000
+    query_cache_path: Optional[str] = None
+    batch_max_tokens: int = 100_000
+    batch_max_size: int = 512
+    max_concurrency: int = 8
+    max_retries: int = 8
+    index_type: str = "flat"
+    nlist: int = 0
+    nprobe: int = 16
+    pq_m: int = 64
+    pq_nbits: int = 8
+    hnsw_m: int = 32
+    ef_construction: int = 200
+    ef_search: int = 64
+    train_sample_size: int = 100_000
 
 
 @dataclass
@@ -24,6 +42,16 @@ class LLMConfig:
 
     model: str = "gpt-4o-mini"
     temperature: float = 0.1
+    max_concurrency: int = 8
+
+
+@dataclass
+class ContextConfig:
+    """Prompt context assembly configuration."""
+
+    max_tokens: int = 3000
+    merge_adjacent: bool = True
+    dedup_threshold: Optional[float] = 0.9
 
 
 @dataclass
@@ -33,8 +61,17 @@ class RetrieverConfig:
     vector_weight: float = 0.6
     bm25_weight: float = 0.4
     similarity_top_k: int = 2
+    vector_top_k: Optional[int] = None
+    bm25_top_k: Optional[int] = None
     num_queries: int = 1
+    rewrite_cache_max_entries: int = 10_000
+    rewrite_timeout: Optional[float] = 2.0
+    max_concurrent_rewrites: int = 8
     mode: str = "dist_based_score"
+    mmr: bool = False
+    mmr_lambda: float = 0.5
+    mmr_candidates: Optional[int] = None
+    compaction_threshold: float = 0.2
 
 
 @dataclass
@@ -43,6 +80,60 @@ class DataConfig:
 
     chunk_size: int = 1000
     chunk_overlap: int = 200
+    loader_workers: int = 0
+    pdf_pages_per_task: int = 32
+    stream_batch_size: int = 1000
+    checkpoint_every: int = 10
+
+
+@dataclass
+class SnapshotConfig:
+    """Index snapshot configuration."""
+
+    directory: str = "snapshots"
+    load_on_startup: bool = True
+    save_on_ingest: bool = True
+    save_on_update: bool = False
+    keep_last: int = 3
+    mmap: bool = False
+
+
+@dataclass
+class AnswerCacheConfig:
+    """Answer cache configuration."""
+
+    enabled: bool = True
+    backend: str = "memory"
+    path: str = "cache/answers.sqlite"
+    ttl_seconds: float = 3600
+    max_entries: int = 10_000
+    similarity_threshold: float = 0.95
+
+
+@dataclass
+class NodeStoreConfig:
+    """Node store configuration."""
+
+    backend: str = "memory"
+    directory: str = "cache/nodes"
+    cache_max_entries: int = 10_000
+
+
+@dataclass
+class CollectionsConfig:
+    """Multi-collection registry configuration."""
+
+    directory: str = "collections"
+    default: str = "default"
+    memory_budget_mb: float = 0
+    max_loaded: int = 0
+
+
+@dataclass
+class ShardingConfig:
+    """Sharded retrieval configuration."""
+
+    num_shards: int = 1
 
 
 @dataclass
@@ -53,6 +144,12 @@ class FusionRAGConfig:
     llm: LLMConfig
     retriever: RetrieverConfig
     data: DataConfig
+    context: ContextConfig = field(default_factory=ContextConfig)
+    snapshot: SnapshotConfig = field(default_factory=SnapshotConfig)
+    answer_cache: AnswerCacheConfig = field(default_factory=AnswerCacheConfig)
+    node_store: NodeStoreConfig = field(default_factory=NodeStoreConfig)
+    collections: CollectionsConfig = field(default_factory=CollectionsConfig)
+    sharding: ShardingConfig = field(default_factory=ShardingConfig)
 
     @classmethod
     def from_dict(cls, config_dict: Dict[str, Any]) -> FusionRAGConfig:
@@ -62,6 +159,12 @@ class FusionRAGConfig:
             llm=LLMConfig(**config_dict.get("llm", {})),
             retriever=RetrieverConfig(**config_dict.get("retriever", {})),
             data=DataConfig(**config_dict.get("data", {})),
+            context=ContextConfig(**config_dict.get("context", {})),
+            snapshot=SnapshotConfig(**config_dict.get("snapshot", {})),
+            answer_cache=AnswerCacheConfig(**config_dict.get("answer_cache", {})),
+            node_store=NodeStoreConfig(**config_dict.get("node_store", {})),
+            collections=CollectionsConfig(**config_dict.get("collections", {})),
+            sharding=ShardingConfig(**config_dict.get("sharding", {})),
         )
 
 
@@ -265,8 +265,12 @@ def bm25_retrieval(bm25: BM25Okapi, cleaned_texts: List[str], query: str, k: int
     # Get BM25 scores for the query
     bm25_scores = bm25.get_scores(query_tokens)
 
-    # Get the indices of the top k scores
-    top_k_indices = np.argsort(bm25_scores)[::-1][:k]
+    # Get the indices of the top k scores without sorting every score
+    k = min(k, len(bm25_scores))
+    if k <= 0:
+        return []
+    top_k_indices = np.argpartition(bm25_scores, -k)[-k:]
+    top_k_indices = top_k_indices[np.argsort(bm25_scores[top_k_indices])[::-1]]
 
     # Retrieve the top k cleaned text chunks
     top_k_texts = [cleaned_texts[i] for i in top_k_indices]
@@ -1,15 +1,70 @@
 from __future__ import annotations
 
-from typing import Any
+import re
+import zlib
+from typing import Any, List
 
-from langchain_cohere import CohereEmbeddings
+import numpy as np
+from langchain_core.embeddings import Embeddings
 
 from rag_core.utils.config import EmbeddingConfig
 
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+
+class HashedNgramEmbeddings(Embeddings):
+    """Offline CPU embeddings built by hashing word and character n-grams.
+
+    Words, adjacent word pairs and the character trigrams of each word are
+    hashed with CRC32 into `dimensions` signed buckets; bucket values are
+    damped with a signed `log1p` and each vector is L2-normalized. Nothing
+    is downloaded or fitted, so it works in air-gapped deployments.
+    """
+
+    def __init__(self, dimensions: int = 512):
+        self.dimensions = dimensions
+
+    def _features(self, text: str) -> List[str]:
+        words = _TOKEN_PATTERN.findall(text.lower())
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        for word in words:
+            padded = f"<{word}>"
+            features += [f"#{padded[i : i + 3]}" for i in range(len(padded) - 2)]
+        return features
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        """Embed a batch of texts with one vectorized bucket count."""
+        features = [self._features(text) for text in texts]
+        rows = np.repeat(np.arange(len(texts)), [len(f) for f in features])
+        hashes = np.fromiter(
+            (zlib.crc32(f.encode("utf-8")) for fs in features for f in fs),
+            dtype=np.uint32,
+            count=len(rows),
+        )
+        signs = np.where(hashes >> 31, -1.0, 1.0)
+        vectors = np.bincount(
+            rows * self.dimensions + hashes % self.dimensions,
+            weights=signs,
+            minlength=len(texts) * self.dimensions,
+        ).reshape(len(texts), self.dimensions)
+        vectors = np.sign(vectors) * np.log1p(np.abs(vectors))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text])[0].tolist()
+
 
 def get_embedding_model(config: EmbeddingConfig) -> Any:
     """Instantiate an embedding model from configuration."""
-    if config.provider.lower() == "cohere":
+    provider = config.provider.lower()
+    if provider == "cohere":
+        from langchain_cohere import CohereEmbeddings
+
         return CohereEmbeddings(model=config.model)
+    if provider == "local":
+        return HashedNgramEmbeddings(dimensions=config.dimensions)
     raise ValueError(f"Unsupported embedding provider: {config.provider}")
-
@@ -31,6 +31,7 @@ class EmbeddingConfig:
 
     provider: str
     model: str
+    dimensions: int = 512
 
 
 @dataclass